@@ -0,0 +1,151 @@
+"""Benchmark resolver throughput against the local stand-in server.
+
+Measures IPs resolved per second, request latency percentiles, and quota
+efficiency (the share of requests sent that were not rejected by a rate
+limit) for the ip-api free and pro resolvers and the VirusTotal resolver.
+Quota windows are shortened so each scenario completes in seconds.
+
+Usage::
+
+    python devscripts/benchmark_resolvers.py --ips 5000 --latency 0.05
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from libchickadee.resolvers import ipapi, virustotal  # noqa: E402
+from libchickadee.resolvers.rate_limit import RateLimiter  # noqa: E402
+from libchickadee.test.stub_server import StubServer  # noqa: E402
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def ipapi_free(server, args):
+    """ip-api free resolver, paced by the batch quota."""
+    resolver = ipapi.Resolver(fields=["query", "country", "as"])
+    resolver.uri = server.ipapi_uri
+    resolver.batch_limiter = RateLimiter(15, args.window, buffer=0.1)
+    return resolver, args.ips
+
+
+def ipapi_pro(server, args):
+    """ip-api pro resolver, with concurrent batch requests."""
+    resolver = ipapi.ProResolver(
+        "benchmark", fields=["query", "country", "as"], max_workers=args.workers
+    )
+    resolver.uri = server.ipapi_uri
+    return resolver, args.ips
+
+
+def virustotal_pro(server, args):
+    """VirusTotal resolver, paced per API key."""
+    keys = [f"key-{x}" for x in range(args.vt_keys)]
+    resolver = virustotal.ProResolver(keys)
+    resolver.uri = server.vt_uri
+    for key in resolver.pool.keys:
+        key.limiter = RateLimiter(4, args.window, buffer=0.05)
+    return resolver, args.vt_ips
+
+
+SCENARIOS = {
+    "ip_api": ipapi_free,
+    "ip_api_pro": ipapi_pro,
+    "virustotal": virustotal_pro,
+}
+
+
+def run_scenario(name, args):
+    """Resolve the scenario's IPs against a fresh server, collecting metrics."""
+    with StubServer(latency=args.latency, window=args.window) as server:
+        resolver, count = SCENARIOS[name](server, args)
+        latencies = []
+        resolver.session.hooks["response"].append(
+            lambda resp, *a, **kw: latencies.append(resp.elapsed.total_seconds())
+        )
+        ips = [
+            f"198.{x // 65536 % 256}.{x // 256 % 256}.{x % 256}" for x in range(count)
+        ]
+
+        start = time.perf_counter()
+        records = resolver.query(ips)
+        elapsed = time.perf_counter() - start
+        resolver.close()
+
+    rejected = sum(v for k, v in server.stats.items() if k.endswith(("_429", "_204")))
+    sent = sum(server.stats.values())
+    resolved = sum(1 for x in records if x.get("status") not in ("failed", "skipped"))
+    return {
+        "scenario": name,
+        "ips": count,
+        "resolved": resolved,
+        "seconds": elapsed,
+        "ips_per_sec": resolved / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "requests": sent,
+        "rejected": rejected,
+        "quota_efficiency": (sent - rejected) / sent if sent else 0.0,
+        "retries": resolver.retry.stats()["retries"],
+    }
+
+
+def main(argv=None):
+    """Run the selected scenarios and print a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "-r",
+        "--resolvers",
+        default=",".join(SCENARIOS),
+        help="Comma separated scenarios to run. Choices: " + ", ".join(SCENARIOS),
+    )
+    parser.add_argument("--ips", type=int, default=2000, help="IPs per ip-api run")
+    parser.add_argument("--vt-ips", type=int, default=40, help="IPs per VT run")
+    parser.add_argument("--vt-keys", type=int, default=4, help="VT API keys to use")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds per response"
+    )
+    parser.add_argument(
+        "--window", type=float, default=1.0, help="Seconds per quota window"
+    )
+    parser.add_argument("--workers", type=int, default=8, help="Pro API workers")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show logs")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    columns = [
+        ("scenario", 12, ""),
+        ("resolved", 9, ""),
+        ("seconds", 8, ".2f"),
+        ("ips_per_sec", 11, ".1f"),
+        ("p50_ms", 8, ".1f"),
+        ("p95_ms", 8, ".1f"),
+        ("p99_ms", 8, ".1f"),
+        ("requests", 8, ""),
+        ("rejected", 8, ""),
+        ("quota_efficiency", 16, ".1%"),
+        ("retries", 7, ""),
+    ]
+    print(" ".join(f"{key:>{width}}" for key, width, _ in columns))
+    for name in args.resolvers.split(","):
+        result = run_scenario(name.strip(), args)
+        print(" ".join(f"{result[key]:>{width}{spec}}" for key, width, spec in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,15 @@ Usage
 
 .. code-block:: text
 
-    usage: chickadee [-h] [-r {ip_api,virustotal}] [-f FIELDS]
-                     [-t {json,jsonl,csv}] [-w FILENAME.JSON] [-n] [--no-count]
-                     [-s] [--lang {en,de,es,pt-BR,fr,ja,zh-CN,ru}] [-b]
+    usage: chickadee [-h] [-r RESOLVER[,RESOLVER]] [-f FIELDS]
+                     [-t {json,jsonl,csv}] [-w FILENAME.JSON] [--compact-json]
+                     [-n] [--no-count] [--min-count N] [--top N] [--include-cidrs FILE]
+                     [--exclude-cidrs FILE] [--build-index INDEX]
+                     [--no-cache] [--refresh-cache] [--cache-ttl SECONDS]
+                     [--no-shared-limits] [--budget N] [--journal PATH] [--merge]
+                     [--resolve-granularity V4[,V6]] [--workers N]
+                     [-s] [--reverse-dns]
+                     [--lang {en,de,es,pt-BR,fr,ja,zh-CN,ru}] [-b]
                      [-c CONFIG] [-p] [-v] [-V] [-l LOG]
                      [data [data ...]]
 
@@ -39,10 +45,12 @@ Usage
 
     optional arguments:
       -h, --help            show this help message and exit
-      -r {ip_api,virustotal}, --resolver {ip_api,virustotal}
+      -r RESOLVER[,RESOLVER], --resolver RESOLVER[,RESOLVER]
                             Resolving service to use. Must specify api key in config file.
-                            Please see template_chickadee.ini for instructions.
-                            (default: ip_api)
+                            Please see template_chickadee.ini for instructions. Separate
+                            several resolvers with commas to only query each for IPs the
+                            previous lacked data for. Choices: ip_api, virustotal, mmdb,
+                            range_table (default: ip_api)
       -f FIELDS, --fields FIELDS
                             Comma separated fields to query (default: None)
       -t {json,jsonl,csv}, --output-format {json,jsonl,csv}
@@ -50,11 +58,59 @@ Usage
       -w FILENAME.JSON, --output-file FILENAME.JSON
                             Path to file to write output
                             (default: stdout)
+      --compact-json        Write JSON and JSON lines reports without spaces after
+                            separators and with non-ASCII characters UTF-8 encoded.
+                            Faster with orjson installed. (default: False)
       -n, --no-resolve      Only extract IP addresses, don't resolve. (default: False)
       --no-count            Disable counting the occurrences of IP addresses extracted
                             from source files (default: False)
+      --min-count N         Only resolve IP addresses seen at least N times in the
+                            source data (default: None)
+      --top N               Only resolve the N most frequently seen IP addresses
+                            (default: None)
+      --include-cidrs FILE  Path to a file of CIDR ranges, one per line. Only IP
+                            addresses within these ranges are extracted.
+                            (default: None)
+      --exclude-cidrs FILE  Path to a file of CIDR ranges, one per line. IP
+                            addresses within these ranges are not extracted.
+                            (default: None)
+      --build-index INDEX   Path to an index file recording where each IP address
+                            was found. Query it with `chickadee query`.
+                            (default: None)
+      --no-cache            Do not read or write the resolution cache
+                            (default: False)
+      --refresh-cache       Resolve all IP addresses again and update the
+                            resolution cache (default: False)
+      --cache-ttl SECONDS   Number of seconds a cached resolution is used for.
+                            Use 0 to always resolve again, ignoring cached
+                            resolutions. (default: 86400)
+      --no-shared-limits    Do not share rate limits with other chickadee
+                            processes on this host (default: False)
+      --budget N            Maximum number of requests to send to resolvers with
+                            request quotas, such as VirusTotal. IP addresses not
+                            resolved are reported as skipped. (default: None)
+      --journal PATH        Path to a journal of resolved records. Rerunning an
+                            interrupted job with the same journal only resolves IP
+                            addresses missing from it. (default: None)
+      --merge               Resolve every IP address with each resolver given to
+                            --resolver concurrently, rather than as a chain, merging
+                            the records of each IP address. Fields are prefixed by
+                            the resolver name, such as ip_api.country.
+                            (default: False)
+      --resolve-granularity V4[,V6]
+                            Only resolve one IP address per network prefix of this
+                            length, such as 24 or 24,64, copying the result to the
+                            others. Copied records name the IP address resolved in
+                            the inferred_from field. The IPv6 prefix length defaults
+                            to 48. (default: None)
+      --workers N           Number of requests to send concurrently. Only used by
+                            resolvers without rate limits, such as the ip-api pro
+                            service. (default: 1)
       -s, --single          Use the significantly slower single item API. Adds reverse
                             DNS. (default: False)
+      --reverse-dns         Look up the hostname of each IP address with the system
+                            resolver while resolving, filling the reverse field.
+                            Much faster than --single. (default: False)
       --lang {en,de,es,pt-BR,fr,ja,zh-CN,ru}
                             Language (default: en)
       -b, --include-bogon   Include BOGON addresses in results. (default: False)
@@ -67,6 +123,21 @@ Usage
 
     Built by Chapin Bryce, v.20200805.0
 
+Index queries
+^^^^^^^^^^^^^
+
+.. code-block:: text
+
+    usage: chickadee query [-h] [-t {json,jsonl,csv}] [-w FILENAME.JSON]
+                           index values [values ...]
+
+    Find where IP addresses were seen, using an index created with
+    --build-index.
+
+    positional arguments:
+      index                 Path to index file created with --build-index
+      values                IP addresses or CIDR ranges to look up
+
 
 .. _chickadee-examples:
 
@@ -103,10 +174,42 @@ Resolve using VirusTotal (set API key in config file):
 
 ``chickadee -r virustotal 1.1.1.1``
 
+Resolve offline using a MaxMind DB file (set the mmdb path in config file):
+
+``chickadee -r mmdb 1.1.1.1``
+
+Resolve offline using an ip2asn or IP2Location LITE range table (requires NumPy,
+set the range_table path in config file):
+
+``chickadee -r range_table folder/``
+
+Resolve offline first, only sending IPs missing from the dataset, or without a
+city, to ip-api (set the range_table path and ip-api key in config file):
+
+``chickadee -r range_table,ip_api -f query,as,city folder/``
+
+Resolve with ip-api and VirusTotal at the same time, merging their records in
+to one row per IP address (set both API keys in config file):
+
+``chickadee -r ip_api,virustotal --merge folder/``
+
+Resolve one IP address per /24 IPv4 and /48 IPv6 network:
+
+``chickadee --resolve-granularity 24 folder/``
+
+Add the hostname of each IP address, looked up while resolving with the
+batch API:
+
+``chickadee --reverse-dns folder/``
+
 Resolve using ip-api (set API key in config file):
 
 ``chickadee -r ip_api 1.1.1.1``
 
+Resolve with 16 concurrent batch requests (ip-api pro API key required):
+
+``chickadee -r ip_api --workers 16 folder/``
+
 Output options
 ^^^^^^^^^^^^^^
 
@@ -137,17 +240,51 @@ Changing the output location (STDOUT by default)
 
 ``chickadee 1.1.1.1 -w resolve.json``
 
+Skip the resolution cache for this run:
+
+``chickadee --no-cache 1.1.1.1``
+
 Only extract IP addresses, don't resolve:
 
 ``chickadee -n 1.1.1.1``
 
+Only resolve IP addresses seen at least 5 times:
+
+``chickadee --min-count 5 folder/``
+
+Only resolve the 100 most frequently seen IP addresses:
+
+``chickadee --top 100 folder/``
+
+Use at most 500 requests of the VirusTotal quota:
+
+``chickadee -r virustotal --budget 500 folder/``
+
+Resume an interrupted job, only resolving IP addresses missing from the journal:
+
+``chickadee --journal job.journal -w resolve.json folder/``
+
+Skip IP addresses within the ranges listed in a file:
+
+``chickadee --exclude-cidrs our_netblocks.txt folder/``
+
+Record where each IP address was found while extracting:
+
+``chickadee --build-index evidence.idx folder/``
+
+Look up where an IP address or range was found, without rescanning:
+
+``chickadee query evidence.idx 1.1.1.1 203.0.113.0/24``
+
 Module Documentation
 --------------------
 
 """
 
 import argparse
+import asyncio
 import configparser
+import heapq
 import logging
 import os
 import sys
@@ -155,18 +292,35 @@ from collections import Counter
 from pathlib import PurePath
 
 import _io
-from tqdm import tqdm
 
 # Import lib features
 from libchickadee import __version__
 from libchickadee.parsers.evtx import EVTXParser
+from libchickadee.parsers.ip_filter import IPFilter
+from libchickadee.parsers.ip_index import OccurrenceIndex
 
 # Import Parsers
 from libchickadee.parsers.plain_text import PlainTextParser
 from libchickadee.parsers.xlsx import XLSXParser
 
 # Import resolvers
-from libchickadee.resolvers import ResolverBase, ipapi, virustotal
+from libchickadee.resolvers import (
+    ResolverBase,
+    chain,
+    ipapi,
+    merge,
+    mmdb,
+    prefix,
+    range_table,
+    reverse_dns,
+    virustotal,
+)
+from libchickadee.resolvers.cache import (
+    DEFAULT_TTL,
+    ResolutionCache,
+    ResolutionJournal,
+)
+from libchickadee.resolvers.rate_limit import RequestBudget, default_state_dir
 from libchickadee.update import update_available
 
 __author__ = "Chapin Bryce"
@@ -189,6 +343,9 @@ class CustomArgFormatter(
     """Custom argparse formatter class"""
 
 
+RESOLVER_NAMES = ["ip_api", "virustotal", "mmdb", "range_table"]
+
+
 class Chickadee:
     """Class to handle chickadee script operations.
 
@@ -213,13 +370,27 @@ class Chickadee:
         self.input_data = None
         self.out_format = out_format
         self.outfile = outfile
+        self.compact_json = False  # Write JSON reports without spaces
         self.fields = fields
+        self.report_fields = None  # Fields to report, if not those requested
         self.force_single = False
         self.ignore_bogon = True
+        self.ip_filter = None
+        self.index = None
         self.no_count = False
+        self.min_count = None
+        self.top = None
         self.lang = "en"
         self.progress_bar = False
         self.resolve_ips = True
+        self.cache = None  # Optional ResolutionCache or MemoryCache for resolvers
+        self.session = None  # HTTP session shared by resolvers across runs
+        self.rate_limit_dir = None  # Share rate limits with other processes
+        self.budget = None  # Optional RequestBudget shared by resolvers
+        self.granularity = None  # IPv4 and IPv6 prefix lengths to resolve by
+        self.reverse_dns = False  # Look up hostnames alongside the resolver
+        self.merge = False  # Merge the records of every resolver, not chain them
+        self.workers = 1
 
     def run(self, input_data, api_key=None):
         """Evaluate the input data format to extract and resolve IP addresses.
@@ -232,16 +403,101 @@ class Chickadee:
         method if the ``self.resolve_ips`` option is enabled.
 
         Args:
-            input_data (str or file_obj): User provided data containing IPs to
+            input_data (str, file_obj or list): User provided data containing IPs to
+                resolve
+            api_key (str): API Key for IP resolver.
+
+        Returns:
+            (list): List of dictionaries containing resolved hits.
+        """
+        result_dict = self.extract(input_data)
+
+        # Resolve if requested
+        if self.resolve_ips:
+            return self.resolve(result_dict, api_key)
+
+        return self.unresolved(result_dict)
+
+    def irun(self, input_data, api_key=None):
+        """Streaming counterpart to ``self.run()``.
+
+        IP addresses are extracted, and the resolver configured, when called.
+        Resolution takes place as the returned iterator is consumed, so
+        records may be written while later IP addresses are resolved.
+
+        Args:
+            input_data (str, file_obj or list): User provided data containing IPs to
+                resolve
+            api_key (str): API Key for IP resolver.
+
+        Returns:
+            (iterator): Dictionaries containing resolved hits.
+        """
+        result_dict = self.extract(input_data)
+
+        if self.resolve_ips:
+            return self.iresolve(result_dict, api_key)
+
+        return iter(self.unresolved(result_dict))
+
+    async def arun(self, input_data, api_key=None, timeout=None):
+        """Asynchronous counterpart to ``self.run()``.
+
+        Extraction runs on a worker thread, and resolution uses the resolver's
+        ``aquery()`` method, so the event loop is not blocked.
+
+        Args:
+            input_data (str, file_obj or list): User provided data containing IPs to
                 resolve
             api_key (str): API Key for IP resolver.
+            timeout (float): Seconds to wait for resolution before raising
+                ``asyncio.TimeoutError``. Waits indefinitely if None.
 
         Returns:
             (list): List of dictionaries containing resolved hits.
         """
+        loop = asyncio.get_running_loop()
+        result_dict = await loop.run_in_executor(None, self.extract, input_data)
+
+        if self.resolve_ips:
+            return await self.aresolve(result_dict, api_key, timeout)
+
+        return self.unresolved(result_dict)
+
+    def extract(self, input_data):
+        """Extract and count the IP addresses within the input data.
+
+        Counts are totalled across every source in a list of input data
+        before the frequency filters are applied.
+
+        Args:
+            input_data (str, file_obj or list): User provided data containing
+                IPs, or a list of such sources.
+
+        Returns:
+            (dict): Filtered dictionary structured as ``{IP: COUNT}``
+        """
+        if isinstance(input_data, (list, tuple)):
+            result_dict = Counter()
+            for source in input_data:
+                result_dict.update(self.extract_source(source))
+            logger.debug("%s total distinct IPs extracted", len(result_dict))
+            return self.filter_counts(dict(result_dict))
+
+        return self.filter_counts(self.extract_source(input_data))
+
+    def extract_source(self, input_data):
+        """Extract and count the IP addresses within a single source.
+
+        Args:
+            input_data (str or file_obj): User provided data containing IPs.
+
+        Returns:
+            (dict): Dictionary structured as ``{IP: COUNT}``
+        """
         self.input_data = input_data
         result_dict = {}
-        # Extract and resolve IP addresses
+        # Extract IP addresses
         if not isinstance(self.input_data, _io.TextIOWrapper) and os.path.isdir(
             self.input_data
         ):
@@ -253,7 +509,9 @@ class Chickadee:
         ):
             logger.debug("Detected the data source as a file")
             # File handler
-            result_dict = self.file_handler(self.input_data, self.ignore_bogon)
+            result_dict = self.file_handler(
+                self.input_data, self.ignore_bogon, self.ip_filter, self.index
+            )
 
         elif isinstance(self.input_data, str):
             logger.debug("Detected the data source as raw value(s)")
@@ -261,15 +519,48 @@ class Chickadee:
 
         logger.debug("Extracted %s distinct IPs", len(list(result_dict.keys())))
 
-        # Resolve if requested
-        if self.resolve_ips:
-            return self.resolve(result_dict, api_key)
+        return result_dict
+
+    @staticmethod
+    def unresolved(data_dict):
+        """Format extracted IP addresses as records, without resolving them.
+
+        Args:
+            data_dict (dict): Structured as ``{IP: COUNT}``
 
+        Returns:
+            (list): List of dictionaries with the IP address and count.
+        """
         return [
             {"query": k, "count": v, "message": "No resolve"}
-            for k, v in result_dict.items()
+            for k, v in data_dict.items()
         ]
 
+    def filter_counts(self, data_dict):
+        """Limit the distinct IP addresses to resolve based on their frequency.
+
+        Applies the ``self.min_count`` threshold, followed by the ``self.top``
+        limit, to the aggregated counts. This occurs prior to resolution to
+        reduce the number of requests sent to the resolver.
+
+        Args:
+            data_dict (dict): Structured as ``{IP: COUNT}``
+
+        Returns:
+            (dict): Filtered dictionary structured as ``{IP: COUNT}``
+        """
+        if self.min_count:
+            data_dict = {k: v for k, v in data_dict.items() if v >= self.min_count}
+
+        if self.top and len(data_dict) > self.top:
+            # Stable sort, so ties are kept in order of discovery
+            data_dict = dict(
+                heapq.nlargest(self.top, data_dict.items(), key=lambda x: x[1])
+            )
+
+        logger.debug("%s distinct IPs selected for resolution", len(data_dict))
+        return data_dict
+
     @staticmethod
     def get_api_key():
         """DEPRECIATED
@@ -313,7 +604,7 @@ class Chickadee:
         return data_dict
 
     @staticmethod
-    def file_handler(file_path, ignore_bogon):
+    def file_handler(file_path, ignore_bogon, ip_filter=None, index=None):
         """Handle parsing IP addresses from a file.
 
         Will evaluate format of input file or file stream. Currently supports
@@ -322,6 +613,8 @@ class Chickadee:
         Args:
             file_path (str or file_obj): Path of file to read or stream.
             ignore_bogon (bool): Whether to include BOGON addresses in results.
+            ip_filter (IPFilter): Optional CIDR based include/exclude filter.
+            index (OccurrenceIndex): Optional index to record IP locations in.
 
         Return:
             data_dict (dict): dictionary of distinct IP addresses to resolve.
@@ -336,11 +629,11 @@ class Chickadee:
             logger.debug("Extracting IPs from %s", file_path)
 
         if not is_stream and file_path.lower().endswith("xlsx"):
-            file_parser = XLSXParser(ignore_bogon)
+            file_parser = XLSXParser(ignore_bogon, ip_filter, index)
         elif not is_stream and file_path.lower().endswith("evtx"):
-            file_parser = EVTXParser(ignore_bogon)
+            file_parser = EVTXParser(ignore_bogon, ip_filter, index)
         else:
-            file_parser = PlainTextParser(ignore_bogon)
+            file_parser = PlainTextParser(ignore_bogon, ip_filter, index)
         try:
             file_parser.parse_file(file_path, is_stream)
         except Exception as e:
@@ -365,7 +658,9 @@ class Chickadee:
             for file_name in files:
                 file_entry = os.path.join(root, file_name)
                 logger.debug("Parsing file %s", file_entry)
-                file_results = self.file_handler(file_entry, self.ignore_bogon)
+                file_results = self.file_handler(
+                    file_entry, self.ignore_bogon, self.ip_filter, self.index
+                )
                 logger.debug(
                     "Parsed file %s, %s results", file_entry, len(file_results)
                 )
@@ -393,21 +688,88 @@ class Chickadee:
             resolver.pbar = self.progress_bar
 
         logger.debug("Resolving IPs")
-        if self.force_single:
-            results = []
-            data = distinct_ips
-            if self.progress_bar:
-                data = tqdm(distinct_ips, desc="Resolving IPs", unit_scale=True)
-
-            for element in data:
-                resolver.data = element
-                results += resolver.single()
-        else:
-            results = resolver.query(distinct_ips)
+        results = resolver.query(distinct_ips, force_single=self.force_single)
 
         logger.debug("Resolved IPs")
+        self.report_skipped(results)
+        return self.add_counts(results, data_dict)
 
-        # Add frequency information to results
+    def iresolve(self, data_dict, api_key=None):
+        """Streaming counterpart to ``self.resolve()``.
+
+        Args:
+            data_dict (dict): Structured as ``{IP: COUNT}``
+            api_key (str): API Key for IP resolver.
+
+        Returns:
+            (iterator): Resolved IP address information, yielded as each
+                chunk of IP addresses is resolved.
+        """
+        resolver = self.get_resolver(api_key)
+
+        if self.progress_bar:
+            resolver.pbar = self.progress_bar
+
+        logger.debug("Streaming resolved IPs")
+        records = resolver.iquery(
+            list(data_dict.keys()), force_single=self.force_single
+        )
+        return self.stream_counts(records, data_dict)
+
+    async def aresolve(self, data_dict, api_key=None, timeout=None):
+        """Asynchronous counterpart to ``self.resolve()``.
+
+        Args:
+            data_dict (dict): Structured as ``{IP: COUNT}``
+            api_key (str): API Key for IP resolver.
+            timeout (float): Seconds to wait for resolution before raising
+                ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            results (list): List containing resolved IP address information
+        """
+        resolver = self.get_resolver(api_key)
+
+        logger.debug("Resolving IPs")
+        results = await resolver.aquery(
+            list(data_dict.keys()), force_single=self.force_single, timeout=timeout
+        )
+
+        logger.debug("Resolved IPs")
+        self.report_skipped(results)
+        return self.add_counts(results, data_dict)
+
+    @staticmethod
+    def report_skipped(results):
+        """Log the IP addresses a resolver skipped, such as once a budget is spent.
+
+        Args:
+            results (list): Resolved records.
+
+        Returns:
+            (list): Records with a ``skipped`` status.
+        """
+        skipped = [x for x in results if x.get("status") == "skipped"]
+        if skipped:
+            logger.warning(
+                "%s of %s IP addresses were not resolved. %s",
+                len(skipped),
+                len(results),
+                skipped[0].get("message", "Skipped"),
+            )
+        return skipped
+
+    def add_counts(self, results, data_dict):
+        """Add frequency information to resolved records.
+
+        Args:
+            results (list): Resolved records.
+            data_dict (dict): Structured as ``{IP: COUNT}``
+
+        Returns:
+            results (list): Records with a ``count`` field, unless
+                ``self.no_count`` is set.
+        """
         if not self.no_count:
             updated_results = []
             for result in results:
@@ -419,10 +781,123 @@ class Chickadee:
             return updated_results
         return results
 
+    def stream_counts(self, records, data_dict):
+        """Lazily add frequency information to a stream of resolved records.
+
+        Skipped IP addresses are reported, as by ``self.report_skipped()``,
+        once the stream is exhausted.
+
+        Args:
+            records (iterable): Resolved records.
+            data_dict (dict): Structured as ``{IP: COUNT}``
+
+        Yields:
+            (dict): Records with a ``count`` field, unless ``self.no_count``
+                is set.
+        """
+        total = 0
+        skipped = []
+        for record in records:
+            total += 1
+            if record.get("status") == "skipped":
+                skipped.append(record.get("message", "Skipped"))
+            if not self.no_count:
+                record["count"] = int(data_dict.get(str(record.get("query", "")), "0"))
+            yield record
+
+        logger.debug("Resolved IPs")
+        if skipped:
+            logger.warning(
+                "%s of %s IP addresses were not resolved. %s",
+                len(skipped),
+                total,
+                skipped[0],
+            )
+
     def get_resolver(self, api_key):
         """Determine the proper resolver to use, based on the available API keys.
 
+        A comma separated ``self.resolver``, such as ``range_table,ip_api``,
+        configures a chain of resolvers. IP addresses are only sent to the
+        next resolver in the chain if those before it lack data for them.
+        If ``self.merge`` is set, every resolver instead resolves every IP
+        address concurrently, and the records are merged with fields prefixed
+        by the resolver name, such as ``ip_api.country``. The prefixed fields
+        are reported through ``self.report_fields``.
+
+        If ``self.granularity`` is set, only one IP address per network prefix
+        is resolved, and the result is copied to the others.
+
+        If ``self.reverse_dns`` is set, the hostname of every IP address is
+        looked up while the resolver runs, and set in the ``reverse`` field.
+
         Args:
+            api_key (str or dict): API key value to register with the resolver.
+                For chains, a dictionary mapping each resolver name to its key.
+
+        Returns:
+            Instance of an initialized resolver
+        """
+        self.report_fields = None
+        names = self.resolver.split(",")
+        if len(names) == 1:
+            resolver = self.build_resolver(names[0], api_key)
+        elif self.merge:
+            keys = api_key if isinstance(api_key, dict) else {}
+            resolver = merge.MergeResolver(
+                {x: self.build_resolver(x, keys.get(x)) for x in dict.fromkeys(names)}
+            )
+        else:
+            keys = api_key if isinstance(api_key, dict) else {}
+            resolver = chain.ChainResolver(
+                [self.build_resolver(x, keys.get(x)) for x in names],
+                fields=self.resolver_fields(),
+            )
+
+        if self.granularity:
+            resolver = prefix.PrefixResolver(resolver, *self.granularity)
+            if self.fields and prefix.INFERRED_FIELD not in self.fields:
+                self.fields = self.fields + [prefix.INFERRED_FIELD]
+
+        if self.reverse_dns:
+            resolver = reverse_dns.ReverseDNSResolver(resolver, cache=self.cache)
+            if self.fields and reverse_dns.REVERSE_FIELD not in self.fields:
+                self.fields = self.fields + [reverse_dns.REVERSE_FIELD]
+
+        if self.merge and len(names) > 1:
+            # Report the prefixed fields of each resolver, leaving the fields
+            # requested from them unchanged for later runs.
+            self.report_fields = list(resolver.fields)
+        elif not self.fields:
+            # Inherit the fields used by the resolver if none are used.
+            self.fields = resolver.fields
+
+        return resolver
+
+    def resolver_fields(self):
+        """Fields to request from resolvers, excluding those added by chickadee.
+
+        The ``query`` field is always requested when resolving by prefix, as
+        records are matched to their prefix by it.
+
+        Returns:
+            (list): Requested fields, or None to use the resolver defaults.
+        """
+        if not self.fields:
+            return self.fields
+        added = [prefix.INFERRED_FIELD]
+        if self.reverse_dns:
+            added.append(reverse_dns.REVERSE_FIELD)
+        fields = [x for x in self.fields if x not in added]
+        if self.granularity and "query" not in fields:
+            fields.insert(0, "query")
+        return fields
+
+    def build_resolver(self, name, api_key):
+        """Initialize a resolver by name and apply the run configuration.
+
+        Args:
+            name (str): Name of the resolver, from ``RESOLVER_NAMES``.
             api_key (str): API key value to register with the resolver
 
         Returns:
@@ -437,28 +912,47 @@ class Chickadee:
                 "pro_resolver": virustotal.ProResolver,
                 "free_resolver": None,
             },
+            # Configured with database paths in place of an API key
+            "mmdb": {
+                "pro_resolver": mmdb.Resolver,
+                "free_resolver": None,
+            },
+            "range_table": {
+                "pro_resolver": range_table.Resolver,
+                "free_resolver": None,
+            },
         }
 
         if api_key:
             logger.debug("Using authenticated resolution service")
-            resolver_class = resolvers[self.resolver]["pro_resolver"]
+            resolver_class = resolvers[name]["pro_resolver"]
             if not resolver_class:
                 raise ValueError(
                     "Unable to configure resolver. Please report to github.com/chapinb/chickadee/issues"
                 )
-            resolver = resolver_class(api_key, fields=self.fields, lang=self.lang)
+            resolver = resolver_class(
+                api_key, fields=self.resolver_fields(), lang=self.lang
+            )
             logger.debug("Resolver API key found.")
-        elif resolver_class := resolvers[self.resolver]["free_resolver"]:
-            resolver = resolver_class(fields=self.fields, lang=self.lang)
+        elif resolver_class := resolvers[name]["free_resolver"]:
+            resolver = resolver_class(fields=self.resolver_fields(), lang=self.lang)
 
         else:
             raise ValueError(
-                f"Unable to configure resolver. An API key may be required for {self.resolver}"
+                f"Unable to configure resolver. An API key or database path may be required for {name}"
             )
-        if not self.fields:
-            # Inherit the fields used by the resolver if none are used.
-            self.fields = resolver.fields
-
+        resolver.cache = self.cache if resolver.cacheable else None
+        if self.rate_limit_dir:
+            resolver.share_limits(self.rate_limit_dir)
+        if self.budget is not None:
+            resolver.set_budget(self.budget)
+        resolver.max_workers = self.workers
+        resolver.pool_size = max(resolver.pool_size, self.workers)
+        # Reuse pooled connections across runs
+        if self.session is None:
+            self.session = resolver.session
+        else:
+            resolver.session = self.session
         return resolver
 
     def write_output(self, results):
@@ -469,21 +963,27 @@ class Chickadee:
         ``self.out_format``.
 
         Args:
-            results (list): List of GeoIP results
+            results (list or iterable): GeoIP results. JSON and JSON lines
+                reports are written as records are read from an iterator.
 
         Returns:
             None
         """
 
+        fields = self.report_fields or self.fields
         if self.out_format == "csv":
             logger.debug("Writing CSV report")
-            ResolverBase.write_csv(self.outfile, results, self.fields)
+            ResolverBase.write_csv(self.outfile, results, fields)
         elif self.out_format == "json":
             logger.debug("Writing json report")
-            ResolverBase.write_json(self.outfile, results, self.fields)
+            ResolverBase.write_json(
+                self.outfile, results, fields, compact=self.compact_json
+            )
         elif self.out_format == "jsonl":
             logger.debug("Writing json lines report")
-            ResolverBase.write_json(self.outfile, results, self.fields, lines=True)
+            ResolverBase.write_json(
+                self.outfile, results, fields, lines=True, compact=self.compact_json
+            )
 
 
 def setup_logging(logging_obj, log_file, verbose=False):
@@ -538,16 +1038,27 @@ def config_handing(config_file=None, search_conf_path=None):
         "main": {
             "fields": "",
             "output-format": "",
+            "compact-json": False,
             "progress": False,
             "no-resolve": False,
             "include-bogon": False,
+            "include-cidrs": "",
+            "exclude-cidrs": "",
+            "no-cache": False,
+            "cache-ttl": "",
+            "no-shared-limits": False,
+            "resolve-granularity": "",
+            "reverse-dns": False,
             "log": "",
             "verbose": False,
         },
         "resolvers": {
             "resolver": "",
+            "merge": False,
             "ip_api": "",  # Hold respective API key
             "virustotal": "",  # Hold respective API key
+            "mmdb": "",  # Hold the database path(s)
+            "range_table": "",  # Hold the dataset path(s)
         },
     }
 
@@ -653,6 +1164,89 @@ def _generate_default_config_search_path():
     return search_conf_path
 
 
+def resolver_names(value):
+    """Validate a resolver name, or comma separated chain of names.
+
+    Args:
+        value (str): Value of the ``--resolver`` argument.
+
+    Returns:
+        (str): Comma separated resolver names, without whitespace.
+
+    Raises:
+        argparse.ArgumentTypeError: If a name is not in ``RESOLVER_NAMES``.
+    """
+    names = [x.strip() for x in value.split(",") if x.strip()]
+    invalid = [x for x in names if x not in RESOLVER_NAMES]
+    if not names or invalid:
+        raise argparse.ArgumentTypeError(
+            f"invalid choice: {', '.join(invalid) or repr(value)} "
+            f"(choose from {', '.join(RESOLVER_NAMES)})"
+        )
+    return ",".join(names)
+
+
+def positive_int(value):
+    """Validate an argument requiring a whole number of at least 1.
+
+    Args:
+        value (str): Value of the argument.
+
+    Returns:
+        (int): The parsed value.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer above 0.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
+def non_negative_int(value):
+    """Validate an argument requiring a whole number of at least 0.
+
+    Args:
+        value (str): Value of the argument.
+
+    Returns:
+        (int): The parsed value.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer of 0 or more.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, not {number}")
+    return number
+
+
+def granularity(value):
+    """Validate the prefix lengths of the ``--resolve-granularity`` argument.
+
+    Args:
+        value (str): IPv4 prefix length, optionally followed by a comma and
+            the IPv6 prefix length.
+
+    Returns:
+        (tuple): IPv4 and IPv6 prefix lengths.
+
+    Raises:
+        argparse.ArgumentTypeError: If the prefix lengths are not valid.
+    """
+    try:
+        return prefix.parse_granularity(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
 def arg_handling(args):
     """Parses command line arguments.
 
@@ -679,8 +1273,11 @@ def arg_handling(args):
         "-r",
         "--resolver",
         help="Resolving service to use. Must specify api key in config file. "
-        "Please see template_chickadee.ini for instructions.",
-        choices=["ip_api", "virustotal"],
+        "Please see template_chickadee.ini for instructions. Separate several "
+        "resolvers with commas to only query each for IPs the previous lacked "
+        f"data for. Choices: {', '.join(RESOLVER_NAMES)}",
+        type=resolver_names,
+        metavar="RESOLVER[,RESOLVER]",
         default="ip_api",
     )
     parser.add_argument("-f", "--fields", help="Comma separated fields to query")
@@ -698,6 +1295,12 @@ def arg_handling(args):
         default=sys.stdout,
         metavar="FILENAME.JSON",
     )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="Write JSON and JSON lines reports without spaces after separators "
+        "and with non-ASCII characters UTF-8 encoded. Faster with orjson installed.",
+    )
     parser.add_argument(
         "-n",
         "--no-resolve",
@@ -709,10 +1312,30 @@ def arg_handling(args):
         action="store_true",
         help="Disable counting the occurrences of IP addresses extracted from source files",
     )
+    parser.add_argument(
+        "--min-count",
+        type=positive_int,
+        metavar="N",
+        help="Only resolve IP addresses seen at least N times in the source data",
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_int,
+        metavar="N",
+        help="Only resolve the N most frequently seen IP addresses",
+    )
     parser.add_argument(
         "-s",
         "--single",
-        help="Use the significantly slower single item API. Adds reverse DNS.",
+        help="Use the significantly slower single item API. Adds reverse DNS. "
+        "Combine with --workers to send several requests concurrently.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reverse-dns",
+        help="Look up the hostname of each IP address with the system "
+        "resolver while resolving, filling the reverse field. Much faster than "
+        "--single.",
         action="store_true",
     )
     parser.add_argument(
@@ -727,6 +1350,86 @@ def arg_handling(args):
         action="store_true",
         help="Include BOGON addresses in results.",
     )
+    parser.add_argument(
+        "--include-cidrs",
+        metavar="FILE",
+        help="Path to a file of CIDR ranges, one per line. Only IP addresses "
+        "within these ranges are extracted.",
+    )
+    parser.add_argument(
+        "--exclude-cidrs",
+        metavar="FILE",
+        help="Path to a file of CIDR ranges, one per line. IP addresses within "
+        "these ranges are not extracted.",
+    )
+    parser.add_argument(
+        "--build-index",
+        metavar="INDEX",
+        help="Path to an index file recording where each IP address was found. "
+        "Query it with `chickadee query`.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the resolution cache",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Resolve all IP addresses again and update the resolution cache",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=non_negative_int,
+        metavar="SECONDS",
+        help="Number of seconds a cached resolution is used for. Use 0 to "
+        "always resolve again, ignoring cached resolutions.",
+        default=DEFAULT_TTL,
+    )
+    parser.add_argument(
+        "--no-shared-limits",
+        action="store_true",
+        help="Do not share rate limits with other chickadee processes on this host",
+    )
+    parser.add_argument(
+        "--budget",
+        type=non_negative_int,
+        metavar="N",
+        help="Maximum number of requests to send to resolvers with request "
+        "quotas, such as VirusTotal. IP addresses not resolved are reported as "
+        "skipped.",
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help="Path to a journal of resolved records. Rerunning an interrupted "
+        "job with the same journal only resolves IP addresses missing from it.",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Resolve every IP address with each resolver given to --resolver "
+        "concurrently, rather than as a chain, merging the records of each IP "
+        "address. Fields are prefixed by the resolver name, such as "
+        "ip_api.country.",
+    )
+    parser.add_argument(
+        "--resolve-granularity",
+        type=granularity,
+        metavar="V4[,V6]",
+        help="Only resolve one IP address per network prefix of this length, "
+        "such as 24 or 24,64, copying the result to the others. Copied records "
+        "name the IP address resolved in the inferred_from field. The IPv6 "
+        "prefix length defaults to 48.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        metavar="N",
+        help="Number of requests to send concurrently. Only used by resolvers "
+        "without rate limits, such as the ip-api pro service.",
+        default=1,
+    )
     parser.add_argument("-c", "--config", help="Path to config file to load")
     parser.add_argument(
         "-p", "--progress", help="Enable progress bar", action="store_true"
@@ -754,6 +1457,75 @@ def arg_handling(args):
     return parser.parse_args(args)
 
 
+def query_arg_handling(args):
+    """Parses command line arguments for the ``query`` subcommand.
+
+    Returns:
+        argparse Namespace containing argument parameters.
+    """
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        prog="chickadee query",
+        description="Find where IP addresses were seen, using an index created "
+        "with --build-index.",
+        formatter_class=CustomArgFormatter,
+        epilog=f"Built by {__author__}, v.{__version__}",
+    )
+    parser.add_argument("index", help="Path to index file created with --build-index")
+    parser.add_argument(
+        "values", nargs="+", help="IP addresses or CIDR ranges to look up"
+    )
+    parser.add_argument(
+        "-t",
+        "--output-format",
+        help="Output format",
+        choices=["json", "jsonl", "csv"],
+        default="jsonl",
+    )
+    parser.add_argument(
+        "-w",
+        "--output-file",
+        help="Path to file to write output",
+        default=sys.stdout,
+        metavar="FILENAME.JSON",
+    )
+    return parser.parse_args(args)
+
+
+def query_index(index_path, values):
+    """Look up the locations of IP addresses or CIDR ranges in an index.
+
+    Args:
+        index_path (str): Path to an index created with ``--build-index``.
+        values (list): IP addresses or CIDR ranges to look up.
+
+    Returns:
+        (list): List of dictionaries describing each occurrence.
+    """
+    if not os.path.isfile(index_path):
+        raise FileNotFoundError(f"Index file {index_path} not found")
+    results = []
+    with OccurrenceIndex(index_path) as index:
+        for value in values:
+            results += index.query(value)
+    return results
+
+
+def query_entry(args):  # pragma: no cover
+    """Entrypoint for the ``query`` subcommand.
+
+    Args:
+        args: Arguments from invocation, excluding the subcommand name.
+    """
+    args = query_arg_handling(args)
+    chickadee = Chickadee(
+        out_format=args.output_format,
+        outfile=args.output_file,
+        fields=["query", "file", "location", "unit"],
+    )
+    chickadee.write_output(query_index(args.index, args.values))
+
+
 def join_config_args(config, args, definitions=None):
     """Join config file and argument parameters, where the args override configs.
 
@@ -776,11 +1548,27 @@ def join_config_args(config, args, definitions=None):
             "fields": "",
             "output-format": "jsonl",
             "output-file": sys.stdout,
+            "compact-json": False,
             "progress": False,
             "no-resolve": False,
             "no-count": False,
+            "min-count": None,
+            "top": None,
             "include-bogon": False,
+            "include-cidrs": None,
+            "exclude-cidrs": None,
+            "build-index": None,
+            "no-cache": False,
+            "refresh-cache": False,
+            "cache-ttl": DEFAULT_TTL,
+            "no-shared-limits": False,
+            "budget": None,
+            "journal": None,
+            "merge": False,
+            "resolve-granularity": None,
+            "workers": 1,
             "single": False,
+            "reverse-dns": False,
             "lang": "en",
             "log": os.path.abspath(
                 os.path.join(
@@ -791,6 +1579,8 @@ def join_config_args(config, args, definitions=None):
             "resolver": "ip_api",
             "ip_api": "",  # Hold the related API key
             "virustotal": "",  # Hold the related API key
+            "mmdb": "",  # Hold the database path(s)
+            "range_table": "",  # Hold the dataset path(s)
             "data": "",
         }
 
@@ -824,6 +1614,9 @@ def entry(args=None):  # pragma: no cover
     """
     if not args:
         args = sys.argv[1:]
+    if args and args[0] == "query":
+        query_entry(args[1:])
+        return
     # Handle parameters from config file and command line.
     args = arg_handling(args)
     config = config_handing(args.config)
@@ -843,35 +1636,110 @@ def entry(args=None):  # pragma: no cover
         logger.debug("Argument %s is set to %s", arg, getattr(args, arg))
 
     logger.debug("Configuring Chickadee")
+    chickadee = configure_chickadee(params)
+    configure_resolution(chickadee, params)
+
+    if "," in chickadee.resolver:
+        api_key = {x: params.get(x) for x in chickadee.resolver.split(",")}
+    else:
+        api_key = params.get(chickadee.resolver)
+
+    logger.debug("Parsing input")
+    # Extracted up front, totalling counts across every data argument, as the
+    # resolver sets the output fields. Records are resolved as they are written.
+    data = chickadee.irun(params.get("data"), api_key)
+
+    logger.debug("Writing output")
+    write_results(chickadee, data)
+    logger.debug("Chickadee complete")
+
+
+def configure_chickadee(params):
+    """Create a Chickadee instance with the extraction and output options.
+
+    Args:
+        params (dict): Parameters from ``join_config_args()``.
+
+    Returns:
+        (Chickadee): Configured instance.
+
+    Raises:
+        SystemExit: If a resolver name from the config file is not valid.
+    """
     fields = (
         params.get("fields", "").split(",")
         if len(params.get("fields", "")) > 0
         else None
     )
     chickadee = Chickadee(fields=fields)
-    chickadee.resolver = params.get("resolver", "ip_api")
+    try:  # Names from the config file are not validated by argparse
+        chickadee.resolver = resolver_names(params.get("resolver") or "ip_api")
+    except argparse.ArgumentTypeError as err:
+        sys.exit(f"chickadee: error: resolver: {err}")
     chickadee.resolve_ips = not params.get("no-resolve")
     chickadee.ignore_bogon = not params.get("include-bogon")
+    if params.get("build-index"):
+        chickadee.index = OccurrenceIndex(params.get("build-index"))
+    chickadee.ip_filter = IPFilter.from_files(
+        params.get("include-cidrs"), params.get("exclude-cidrs")
+    )
     chickadee.no_count = params.get("no-count")
+    chickadee.min_count = params.get("min-count")
+    chickadee.top = params.get("top")
     chickadee.force_single = params.get("single")
+    chickadee.reverse_dns = params.get("reverse-dns")
+    chickadee.merge = params.get("merge")
     chickadee.lang = params.get("lang")
     chickadee.progress_bar = params.get("progress")
-
-    logger.debug("Parsing input")
-    if isinstance(params.get("data"), list):
-        data = []
-        for x in params.get("data"):
-            res = chickadee.run(x, params.get(chickadee.resolver))
-            data += res
-    else:
-        data = chickadee.run(params.get("data"), params.get(chickadee.resolver))
-
-    logger.debug("Writing output")
+    chickadee.workers = params.get("workers")
     chickadee.outfile = params.get("output-file")
     chickadee.out_format = params.get("output-format")
-    chickadee.write_output(data)
+    chickadee.compact_json = params.get("compact-json")
+    return chickadee
 
-    logger.debug("Chickadee complete")
+
+def configure_resolution(chickadee, params):
+    """Apply the caching, rate limit, budget, and prefix options.
+
+    Args:
+        chickadee (Chickadee): Instance to configure.
+        params (dict): Parameters from ``join_config_args()``.
+
+    Returns:
+        None
+    """
+    if chickadee.resolve_ips and not params.get("no-cache"):
+        chickadee.cache = ResolutionCache(
+            ttl=int(params.get("cache-ttl")), refresh=params.get("refresh-cache")
+        )
+    if chickadee.resolve_ips and params.get("journal"):
+        chickadee.cache = ResolutionJournal(params.get("journal"), chickadee.cache)
+    if not params.get("no-shared-limits"):
+        chickadee.rate_limit_dir = default_state_dir()
+    if params.get("budget") is not None:
+        chickadee.budget = RequestBudget(params.get("budget"))
+    if params.get("resolve-granularity"):
+        chickadee.granularity = params.get("resolve-granularity")
+        if isinstance(chickadee.granularity, str):  # From the config file
+            chickadee.granularity = prefix.parse_granularity(chickadee.granularity)
+
+
+def write_results(chickadee, data):
+    """Write the records and release the resources held by the run.
+
+    Args:
+        chickadee (Chickadee): Configured instance.
+        data (iterable): Records from ``Chickadee.irun()``.
+
+    Returns:
+        None
+    """
+    try:
+        chickadee.write_output(data)
+    finally:
+        for resource in (chickadee.index, chickadee.cache, chickadee.session):
+            if resource is not None:
+                resource.close()
 
 
 if __name__ == "__main__":
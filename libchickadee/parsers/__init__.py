@@ -66,33 +66,72 @@ def run_parser_from_cli(args, parser_obj):  # pragma: no cover
 class ParserBase:
     """Base class for parsers, containing common utilities."""
 
-    def __init__(self, ignore_bogon=True):
-        """Configure the parser and set default values."""
+    def __init__(self, ignore_bogon=True, ip_filter=None, index=None):
+        """Configure the parser and set default values.
+
+        Args:
+            ignore_bogon (bool): Whether to exclude BOGON addresses.
+            ip_filter (IPFilter): Optional CIDR based include/exclude filter.
+            index (OccurrenceIndex): Optional index to record the location
+                of each extracted IP address in.
+        """
         self.ignore_bogon = ignore_bogon
+        self.ip_filter = ip_filter
+        self.index = index
+        self.file_id = None
         self.ips = {}
 
-    def check_ips(self, data):
+    def start_index(self, file_path, unit="byte"):
+        """Register a file with the occurrence index, if one is configured.
+
+        Args:
+            file_path (str): Path of the file being parsed, or None if the
+                data is not from a file, such as STDIN, and is not indexed.
+            unit (str): Meaning of the locations recorded for this file.
+
+        Returns:
+            None
+        """
+        self.file_id = None
+        if self.index is not None and file_path is not None:
+            self.file_id = self.index.add_file(file_path, unit)
+
+    def check_ips(self, data, location=None):
         """Check data for IP addresses. Results stored in ``self.ips``.
 
         Args:
             data (str): String to search for IP address content.
+            location (int): Location of the data within the current file,
+                recorded in ``self.index`` if configured.
 
         Returns:
             None
         """
         for ipv4 in IPv4Pattern.findall(data):
-            if self.ignore_bogon and self.is_bogon(ipv4):
-                continue
-            if ipv4 not in self.ips:
-                self.ips[ipv4] = 0
-            self.ips[ipv4] += 1
+            self.add_ip(ipv4, location)
         for ipv6 in IPv6Pattern.findall(data):
-            ipv6 = self.strip_ipv6(ipv6)
-            if self.ignore_bogon and self.is_bogon(ipv6):
-                continue
-            if ipv6 not in self.ips:
-                self.ips[ipv6] = 0
-            self.ips[ipv6] += 1
+            self.add_ip(self.strip_ipv6(ipv6), location)
+
+    def add_ip(self, ip_addr, location=None):
+        """Count an IP address found in the data, unless filtered out.
+
+        Args:
+            ip_addr (str): IP address discovered.
+            location (int): Location of the IP address within the current
+                file, recorded in ``self.index`` if configured.
+
+        Returns:
+            None
+        """
+        if self.ignore_bogon and self.is_bogon(ip_addr):
+            return
+        if self.ip_filter and self.ip_filter.is_excluded(ip_addr):
+            return
+        if ip_addr not in self.ips:
+            self.ips[ip_addr] = 0
+        self.ips[ip_addr] += 1
+        if self.file_id is not None and location is not None:
+            self.index.add(ip_addr, self.file_id, location)
 
     @staticmethod
     def strip_ipv6(ipv6_addr):
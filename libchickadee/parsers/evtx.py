@@ -22,12 +22,13 @@ class EVTXParser(ParserBase):
                 "Providing EVTX files as an input stream of data is not yet supported."
             )
 
+        self.start_index(file_entry, "record")
         # Open file
         with Evtx.Evtx.Evtx(file_entry) as event_log:
             # Iterate over events
             for record in event_log.records():
                 # Send event data to self.check_ips()
-                self.check_ips(record.xml())
+                self.check_ips(record.xml(), record.record_num())
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,182 @@
+"""
+IP Address Filters
+==================
+
+Include and exclude IP addresses during extraction based on CIDR ranges.
+
+Ranges are loaded from plain text files containing one CIDR (or single IP
+address) per line. Blank lines and content following a ``#`` are ignored::
+
+    # Corporate netblocks
+    203.0.113.0/24
+    2001:db8::/32
+    198.51.100.7
+
+Each file is loaded in to a sorted table of integer ranges, with overlapping
+and adjacent ranges merged. Lookups use a binary search, so the cost of
+checking an address grows logarithmically with the number of ranges.
+
+"""
+
+from bisect import bisect_right
+
+from netaddr import AddrFormatError, IPAddress, IPNetwork
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class CIDRRangeTable:
+    """Sorted table of IPv4 and IPv6 ranges, searched by bisection.
+
+    Args:
+        cidrs (list): Optional collection of CIDR strings to load.
+
+    Examples:
+        >>> table = CIDRRangeTable(['10.0.0.0/8', '2001:db8::/32'])
+        >>> '10.1.2.3' in table
+        True
+    """
+
+    def __init__(self, cidrs=None):
+        """Configure the empty range table and load any provided ranges."""
+        self._pending = {4: [], 6: []}
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._dirty = False
+        for cidr in cidrs or []:
+            self.add(cidr)
+
+    def add(self, cidr):
+        """Add a CIDR range or single IP address to the table.
+
+        Args:
+            cidr (str): CIDR notation range or IP address.
+
+        Raises:
+            ValueError: If the value is not a valid CIDR or IP address.
+        """
+        try:
+            network = IPNetwork(cidr.strip())
+        except (AddrFormatError, ValueError) as e:
+            raise ValueError(f"Invalid CIDR range {cidr!r}") from e
+        self._pending[network.version].append((network.first, network.last))
+        self._dirty = True
+
+    def _build(self):
+        """Sort and merge the loaded ranges in to the searchable table."""
+        for version, pending in self._pending.items():
+            ranges = sorted(
+                pending + list(zip(self._starts[version], self._ends[version]))
+            )
+            starts, ends = [], []
+            for first, last in ranges:
+                if ends and first <= ends[-1] + 1:
+                    # Overlapping or adjacent, extend the previous range
+                    ends[-1] = max(ends[-1], last)
+                    continue
+                starts.append(first)
+                ends.append(last)
+            self._starts[version] = starts
+            self._ends[version] = ends
+            self._pending[version] = []
+        self._dirty = False
+
+    def __contains__(self, ip_addr):
+        """Check whether an IP address falls within a loaded range.
+
+        Args:
+            ip_addr (str or IPAddress): IP address to check.
+
+        Returns:
+            (bool): True if the address is within a range in the table.
+        """
+        if self._dirty:
+            self._build()
+        ip = ip_addr if isinstance(ip_addr, IPAddress) else IPAddress(ip_addr)
+        value = int(ip)
+        idx = bisect_right(self._starts[ip.version], value) - 1
+        return idx >= 0 and value <= self._ends[ip.version][idx]
+
+    def __len__(self):
+        """Number of distinct ranges within the table, after merging."""
+        if self._dirty:
+            self._build()
+        return len(self._starts[4]) + len(self._starts[6])
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Load a range table from a file of CIDR ranges, one per line.
+
+        Args:
+            file_path (str): Path to the file to read.
+
+        Returns:
+            (CIDRRangeTable): Table containing the ranges within the file.
+
+        Raises:
+            ValueError: If a line does not contain a valid CIDR or IP address.
+        """
+        table = cls()
+        with open(file_path) as open_file:
+            for line_num, line in enumerate(open_file, start=1):
+                value = line.split("#", 1)[0].strip()
+                if not value:
+                    continue
+                try:
+                    table.add(value)
+                except ValueError as e:
+                    raise ValueError(f"{e} on line {line_num} of {file_path}") from e
+        return table
+
+
+class IPFilter:
+    """Decide whether extracted IP addresses should be kept.
+
+    An address is excluded if an include table is provided and the address is
+    not within it, or if an exclude table is provided and the address is
+    within it.
+
+    Args:
+        include (CIDRRangeTable): Ranges to keep. Keeps all addresses if None.
+        exclude (CIDRRangeTable): Ranges to drop. Drops nothing if None.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        """Store the include and exclude range tables."""
+        self.include = include
+        self.exclude = exclude
+
+    def is_excluded(self, ip_addr):
+        """Identifies whether an IP address should be dropped from results.
+
+        Args:
+            ip_addr (str): Valid IP address to check.
+
+        Returns:
+            (bool): Whether or not the IP address is filtered out.
+        """
+        ip = IPAddress(ip_addr)
+        if self.include is not None and ip not in self.include:
+            return True
+        return self.exclude is not None and ip in self.exclude
+
+    @classmethod
+    def from_files(cls, include_path=None, exclude_path=None):
+        """Build a filter from files of CIDR ranges.
+
+        Args:
+            include_path (str): Path to a file of ranges to keep.
+            exclude_path (str): Path to a file of ranges to drop.
+
+        Returns:
+            (IPFilter): Configured filter, or None if no paths were provided.
+        """
+        if not include_path and not exclude_path:
+            return None
+        return cls(
+            include=CIDRRangeTable.from_file(include_path) if include_path else None,
+            exclude=CIDRRangeTable.from_file(exclude_path) if exclude_path else None,
+        )
@@ -0,0 +1,254 @@
+"""
+IP Occurrence Index
+===================
+
+On-disk inverted index recording where each IP address was found.
+
+While extracting IP addresses, parsers may record the source file and
+location of each hit in an SQLite database. The index can then be queried for
+a single IP address or a CIDR range without rescanning the source data.
+
+The location recorded depends on the source format:
+
+* ``byte`` - Offset of the line containing the IP address, for plain text.
+  Offsets for gzipped files are within the decompressed content.
+* ``record`` - Record number, for EVTX files.
+* ``row`` - Row number within the sheet, for XLSX files. The sheet name is
+  appended to the file path as ``path#sheet``.
+
+Addresses are stored as their address family followed by their 16 byte big
+endian value, so IPv4 addresses never match IPv6 ranges such as ``::/0``, and
+IPv4-mapped IPv6 addresses remain distinct from the IPv4 addresses they map.
+
+When a file that changed since it was indexed is parsed again, its previous
+hits are removed before the new ones are recorded. Data read from STDIN is not
+indexed.
+
+"""
+
+import os
+import sqlite3
+
+from netaddr import IPAddress, IPNetwork
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+SCHEMA_VERSION = 2  # Indexes with an older schema are rebuilt
+
+
+def ip_to_key(ip_addr):
+    """Convert an IP address in to a 17 byte sortable index key.
+
+    Args:
+        ip_addr (str or IPAddress): IP address to convert.
+
+    Returns:
+        (bytes): Address family, followed by the big endian address value.
+    """
+    ip = ip_addr if isinstance(ip_addr, IPAddress) else IPAddress(ip_addr)
+    return bytes([ip.version]) + int(ip).to_bytes(16, "big")
+
+
+def key_to_ip(key):
+    """Convert an index key back in to an IP address string.
+
+    Args:
+        key (bytes): 17 byte index key.
+
+    Returns:
+        (str): IP address.
+    """
+    return str(IPAddress(int.from_bytes(key[1:], "big"), key[0]))
+
+
+def file_stat(file_path):
+    """Read the modification time and size of an indexed file.
+
+    Args:
+        file_path (str): Path of the file. Sheets within XLSX files are named
+            as ``path#sheet``.
+
+    Returns:
+        (tuple): Modification time and size, or ``(None, None)`` if the file
+            does not exist.
+    """
+    for path in (file_path, file_path.rsplit("#", 1)[0]):
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            return stat.st_mtime, stat.st_size
+    return None, None
+
+
+def absolute_path(file_path):
+    """Make the path of an indexed file absolute, if the file exists.
+
+    Args:
+        file_path (str): Path of the file. Sheets within XLSX files are named
+            as ``path#sheet``.
+
+    Returns:
+        (str): Absolute path, keeping any sheet name, or ``file_path`` if the
+            file does not exist.
+    """
+    if os.path.exists(file_path):
+        return os.path.abspath(file_path)
+    path, separator, sheet = file_path.rpartition("#")
+    if separator and os.path.isfile(path):
+        return os.path.abspath(path) + separator + sheet
+    return file_path
+
+
+class OccurrenceIndex:
+    """SQLite backed index of IP address occurrences.
+
+    Args:
+        index_path (str): Path to the index database. Created if missing.
+        buffer_size (int): Number of hits to hold in memory between writes.
+
+    Examples:
+        >>> with OccurrenceIndex('evidence.idx') as index:
+        ...     print(index.query('1.1.1.0/24'))
+        [{'query': '1.1.1.1', 'file': 'auth.log', 'location': 1024, 'unit': 'byte'}]
+    """
+
+    def __init__(self, index_path, buffer_size=10000):
+        """Open the index database and create the tables if needed."""
+        self.index_path = index_path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self.conn = sqlite3.connect(index_path)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self.conn.executescript(
+                f"""
+                DROP TABLE IF EXISTS hits;
+                DROP TABLE IF EXISTS files;
+                PRAGMA user_version = {SCHEMA_VERSION};
+                """
+            )
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                unit TEXT NOT NULL,
+                mtime REAL,
+                size INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS hits (
+                addr BLOB NOT NULL,
+                file_id INTEGER NOT NULL,
+                location INTEGER NOT NULL,
+                PRIMARY KEY (addr, file_id, location)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def add_file(self, file_path, unit="byte"):
+        """Register a source file with the index.
+
+        If the file was indexed before and has since been modified, its
+        previous hits are removed, as they are recorded again while parsing.
+
+        Args:
+            file_path (str): Path of the source file.
+            unit (str): Meaning of the recorded location. One of ``byte``,
+                ``record``, or ``row``.
+
+        Returns:
+            (int): Identifier of the file within the index.
+        """
+        file_path = absolute_path(file_path)
+        mtime, size = file_stat(file_path)
+        row = self.conn.execute(
+            "SELECT id, mtime, size FROM files WHERE path = ?", (file_path,)
+        ).fetchone()
+        if row is None:
+            return self.conn.execute(
+                "INSERT INTO files (path, unit, mtime, size) VALUES (?, ?, ?, ?)",
+                (file_path, unit, mtime, size),
+            ).lastrowid
+        file_id, indexed_mtime, indexed_size = row
+        if (mtime, size) != (indexed_mtime, indexed_size):
+            self.flush()
+            self.conn.execute("DELETE FROM hits WHERE file_id = ?", (file_id,))
+            self.conn.execute(
+                "UPDATE files SET unit = ?, mtime = ?, size = ? WHERE id = ?",
+                (unit, mtime, size, file_id),
+            )
+        return file_id
+
+    def add(self, ip_addr, file_id, location):
+        """Record an occurrence of an IP address.
+
+        Args:
+            ip_addr (str): IP address discovered.
+            file_id (int): Identifier returned by ``self.add_file()``.
+            location (int): Location of the IP address within the file.
+
+        Returns:
+            None
+        """
+        self._buffer.append((ip_to_key(ip_addr), file_id, location))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered occurrences to disk.
+
+        Returns:
+            None
+        """
+        if self._buffer:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO hits VALUES (?, ?, ?)", self._buffer
+            )
+            self._buffer = []
+        self.conn.commit()
+
+    def query(self, value):
+        """Find the occurrences of an IP address or CIDR range.
+
+        Args:
+            value (str): IP address or CIDR range.
+
+        Returns:
+            (list): List of dictionaries with the ``query``, ``file``,
+                ``location``, and ``unit`` of each occurrence.
+        """
+        self.flush()
+        network = IPNetwork(value.strip())
+        rows = self.conn.execute(
+            "SELECT hits.addr, files.path, hits.location, files.unit "
+            "FROM hits JOIN files ON files.id = hits.file_id "
+            "WHERE hits.addr BETWEEN ? AND ? "
+            "ORDER BY hits.addr, files.path, hits.location",
+            (
+                ip_to_key(IPAddress(network.first, network.version)),
+                ip_to_key(IPAddress(network.last, network.version)),
+            ),
+        )
+        return [
+            {"query": key_to_ip(addr), "file": path, "location": location, "unit": unit}
+            for addr, path, location, unit in rows
+        ]
+
+    def close(self):
+        """Flush pending occurrences and close the database.
+
+        Returns:
+            None
+        """
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        """Allow use as a context manager."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the index when leaving the context."""
+        self.close()
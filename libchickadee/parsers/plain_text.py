@@ -41,7 +41,9 @@ class PlainTextParser(ParserBase):
     def parse_file(self, file_entry, is_stream=False):
         """Parse contents of the file and extract IP addresses.
 
-        Will read from STDIN or path to a file. Stores results in ``self.ips``.
+        Will read from STDIN or path to a file. Stores results in ``self.ips``
+        and, if configured, records the byte offset of each line containing an
+        IP address in ``self.index``. Data read from STDIN is not indexed.
 
         Args:
             file_entry (str or file_obj): Path to file for reading.
@@ -51,6 +53,8 @@ class PlainTextParser(ParserBase):
         Returns:
             None
         """
+        # Data read from STDIN cannot be located again, so is not indexed
+        self.start_index(None if is_stream else file_entry, "byte")
         if not is_stream:
             file_data = (
                 GzipFile(filename=file_entry)
@@ -72,9 +76,11 @@ class PlainTextParser(ParserBase):
                 else file_entry.buffer
             )
 
+        offset = 0
         for raw_line in file_data:
             line = raw_line if isinstance(raw_line, str) else raw_line.decode()
-            self.check_ips(line)
+            self.check_ips(line, offset)
+            offset += len(raw_line)
 
         if "closed" in dir(file_data) and not file_data.closed:
             file_data.close()
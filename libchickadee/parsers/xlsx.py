@@ -37,11 +37,12 @@ class XLSXParser(ParserBase):
         wb = load_workbook(file_entry)
 
         for sheet in wb.sheetnames:
+            self.start_index(f"{file_entry}#{sheet}", "row")
             ws = wb[sheet]
             for row in ws.iter_rows():
                 for cell in row:
                     if isinstance(cell.value, (str, bytes)):
-                        self.check_ips(cell.value)
+                        self.check_ips(cell.value, cell.row)
 
 
 if __name__ == "__main__":  # pragma: no cover
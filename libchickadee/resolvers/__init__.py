@@ -12,8 +12,18 @@ formats.
 Module Documentation
 --------------------
 """
+import asyncio
 import csv
-import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+from . import codec
+from .retry import RetryPolicy
 
 __author__ = "Chapin Bryce"
 __date__ = 20200107
@@ -32,6 +42,9 @@ class ResolverBase:
         (ResolverBase)
     """
 
+    cacheable = True  # Whether results may be stored in a resolution cache
+    stream_size = 100  # IPs per worker resolved in each chunk of a stream
+
     def __init__(self):
         """Initialize class object and set defaults."""
         self.uri = None
@@ -40,11 +53,124 @@ class ResolverBase:
         self.fields = []
         self.pbar = False  # Enable progress bars
         self.data = None
+        self.enable_sleep = False  # Whether requests are paced for rate limits
+        self.cache = None  # Optional ResolutionCache or MemoryCache
+        self.max_workers = 1  # Concurrent requests, where supported
+        self.pool_size = 10  # Connections kept alive per host
+        self.max_retries = 0  # Transport retries, as ``self.retry`` retries failures
+        self.retry = RetryPolicy()  # Backoff and circuit breaker for requests
+        self._session = None
+
+    @property
+    def session(self):
+        """Pooled HTTP session used for all requests made by the resolver.
+
+        Created on first use with ``self.pool_size`` and ``self.max_retries``.
+        Assign a ``requests.Session`` (or compatible object) to share a
+        session between resolvers or to inject one for testing.
+
+        Returns:
+            (requests.Session)
+        """
+        if self._session is None:
+            self._session = self.create_session(self.pool_size, self.max_retries)
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        """Use the provided session for future requests."""
+        self._session = value
+
+    @staticmethod
+    def create_session(pool_size=10, max_retries=3):
+        """Create an HTTP session that keeps connections alive between requests.
+
+        Args:
+            pool_size (int): Number of connections to keep alive per host.
+            max_retries (int): Number of times to retry a request on connection
+                errors or 502, 503, and 504 responses.
+
+        Returns:
+            (requests.Session)
+        """
+        retries = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,  # The batch endpoints are POST requests
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Send an HTTP request with ``self.session``, retrying failures.
+
+        Network errors and server error responses are retried according to
+        ``self.retry``.
+
+        Args:
+            method (str): Session method to call, such as ``get`` or ``post``.
+            url (str): URL to request.
+            **kwargs: Arguments for the session method.
+
+        Returns:
+            (requests.Response)
+
+        Raises:
+            RequestFailed: If the request failed after all attempts, or was
+                not sent as the circuit breaker is open.
+        """
+        return self.retry.call(partial(getattr(self.session, method), url, **kwargs))
+
+    def close(self):
+        """Close the HTTP session and its pooled connections.
+
+        Returns:
+            None
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
-    def single(self):
+    def share_limits(self, state_dir=None):
+        """Draw on rate limits shared with other processes on the host.
+
+        Not needed by resolvers without rate limits.
+
+        Args:
+            state_dir (str): Directory holding the shared rate limit state.
+                Defaults to ``rate_limits`` within the cache directory.
+
+        Returns:
+            None
+        """
+
+    def set_budget(self, budget):
+        """Limit the number of requests sent by the resolver.
+
+        Not supported by resolvers without request quotas.
+
+        Args:
+            budget (RequestBudget): Budget to spend requests from, or None for
+                no limit.
+
+        Returns:
+            None
+        """
+
+    def single(self, ip=None):
         """Base method to handle single queries.
 
         Not implemented in base class.
+
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
         """
         raise NotImplementedError()
 
@@ -54,12 +180,69 @@ class ResolverBase:
         Not implemented in base class."""
         raise NotImplementedError()
 
-    def query(self, data):
+    def worker_count(self):
+        """Determine the number of requests to have in flight at once.
+
+        Concurrent requests are only used when sleeping for rate limits is
+        disabled, as with paid APIs.
+
+        Returns:
+            (int): Number of worker threads to use.
+        """
+        if self.enable_sleep:
+            return 1
+        return max(1, self.max_workers)
+
+    def single_many(self, ips):
+        """Resolve IPs individually using the single endpoint.
+
+        Up to ``self.worker_count()`` requests are sent concurrently. As
+        ``self.single()`` receives the IP as an argument, the resolver state
+        is not modified by each request.
+
+        Args:
+            ips (list): IPs to resolve
+
+        Returns:
+            (list) List of collected records, in the order of ``ips``.
+        """
+        records = []
+        with ThreadPoolExecutor(max_workers=self.worker_count()) as executor:
+            results = executor.map(self.single, ips)
+            if self.pbar:
+                results = tqdm(
+                    results, total=len(ips), desc="Resolving IPs", unit_scale=True
+                )
+            for result in results:
+                records += result or []
+        return records
+
+    def request_units(self, ips, force_single=False):
+        """Split IPs in to independent requests that may be sent concurrently.
+
+        Each request is a callable taking no arguments and returning a list of
+        records. Resolvers with a batch endpoint that can be split should
+        override this method.
+
+        Args:
+            ips (list): IPs to resolve
+            force_single (bool): Resolve each IP with the single endpoint.
+
+        Returns:
+            (list): List of callables, one per request.
+        """
+        if force_single:
+            return [partial(self.single, ip) for ip in ips]
+        return [partial(self._batch_ips, ips)]
+
+    def query(self, data, force_single=False):
         """Generic query handler to decide to use single or batch
             method for querying.
 
         Args:
             data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
 
         Returns:
             (list) List of collected records.
@@ -74,14 +257,271 @@ class ResolverBase:
              {"query": "2.2.2.2", "country": "France", ...}
             ]
         """
-
         self.data = data
         if isinstance(data, (list, tuple, set)):
-            return self.batch()
+            resolve = self.single_many if force_single else self._batch_ips
+        elif isinstance(data, str):
+            resolve = self._single_ips
+        else:
+            raise NotImplementedError()
+
+        if self.cache is not None:
+            return self._cached_query(data, resolve)
+        return resolve([data] if isinstance(data, str) else data)
+
+    def stream_chunk(self):
+        """Determine the number of IPs to resolve in each chunk of a stream.
+
+        Sized so each chunk keeps every worker busy, without holding more
+        records than needed in memory.
+
+        Returns:
+            (int): Number of IPs per chunk.
+        """
+        return max(1, self.stream_size * self.worker_count())
+
+    def iquery(self, data, force_single=False):
+        """Streaming counterpart to ``self.query()``.
+
+        IPs are resolved in chunks of ``self.stream_chunk()``, yielding the
+        records of each chunk as soon as it is resolved, so results can be
+        written before the remaining IPs are resolved.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+
+        Yields:
+            (dict): Resolved records, in the order of ``data``.
+
+        Example:
+            >>> resolver = ipapi.Resolver()
+            >>> for record in resolver.iquery(ips):
+            ...     print(record['query'], record['country'])
+        """
         if isinstance(data, str):
-            return self.single()
+            yield from self.query(data, force_single)
+            return
+        if not isinstance(data, (list, tuple, set)):
+            raise NotImplementedError()
+
+        ips = list(data)
+        size = self.stream_chunk()
+        # A single progress bar for the stream, rather than one per chunk
+        progress = None
+        if self.pbar:
+            progress = tqdm(total=len(ips), desc="Resolving IPs", unit_scale=True)
+        pbar, self.pbar = self.pbar, False
+        try:
+            for start in range(0, len(ips), size):
+                chunk = ips[start : start + size]
+                records = self.query(chunk, force_single)
+                if progress is not None:
+                    progress.update(len(chunk))
+                yield from records
+        finally:
+            self.pbar = pbar
+            if progress is not None:
+                progress.close()
+
+    async def aquery(self, data, force_single=False, timeout=None):
+        """Asynchronous counterpart to ``self.query()``.
+
+        Requests from ``self.request_units()`` are run on worker threads, with
+        up to ``self.worker_count()`` in flight at once, so the same rate limit
+        handling applies as for ``self.query()``. Requests not yet started are
+        abandoned if the call is cancelled or times out.
 
-        raise NotImplementedError()
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+            timeout (float): Seconds to wait for resolution to complete before
+                raising ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            (list) List of collected records.
+
+        Example:
+            >>> resolver = ipapi.ProResolver(api_key, max_workers=4)
+            >>> resolved_data = await resolver.aquery(['1.1.1.1', '2.2.2.2'])
+        """
+        if isinstance(data, str):
+            ips = [data]
+            force_single = True
+        elif isinstance(data, (list, tuple, set)):
+            ips = list(data)
+        else:
+            raise NotImplementedError()
+
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(self.worker_count())
+        executor = ThreadPoolExecutor(max_workers=self.worker_count())
+
+        async def send(request):
+            """Run a request on the executor once a slot is available."""
+            async with limit:
+                return await loop.run_in_executor(executor, request)
+
+        async def resolve(misses):
+            """Resolve IPs, keeping the order of the requests."""
+            units = self.request_units(misses, force_single)
+            results = await asyncio.gather(*(send(x) for x in units))
+            return [rec for recs in results for rec in recs or []]
+
+        try:
+            if self.cache is not None:
+                return await asyncio.wait_for(
+                    self._acached_query(ips, resolve), timeout
+                )
+            return await asyncio.wait_for(resolve(ips), timeout)
+        finally:
+            executor.shutdown(wait=False)
+
+    def _batch_ips(self, ips):
+        """Resolve IPs with the batch endpoint.
+
+        Args:
+            ips (list): IPs to resolve
+
+        Returns:
+            (list) List of collected records.
+        """
+        self.data = ips
+        return self.batch()
+
+    def _single_ips(self, ips):
+        """Resolve a single IP with the single endpoint.
+
+        Args:
+            ips (list): List containing the IP to resolve
+
+        Returns:
+            (list) List of collected records.
+        """
+        return self.single(ips[0])
+
+    def cache_key(self):
+        """Describe the resolver configuration that cached records depend on.
+
+        Returns:
+            (tuple): Resolver name, language, and comma separated fields.
+        """
+        fields = ",".join(self.fields) if isinstance(self.fields, list) else self.fields
+        return type(self).__module__.rsplit(".", 1)[-1], self.lang, fields or ""
+
+    def default_fields(self):
+        """Fields reported in the records of the resolver, as configured.
+
+        Resolvers leaving the choice of fields to their data source when none
+        are requested should override this method.
+
+        Returns:
+            (list): Field names.
+        """
+        if isinstance(self.fields, str):
+            return [x for x in self.fields.split(",") if x]
+        return list(self.fields or [])
+
+    def _cached_query(self, data, resolve):
+        """Resolve IPs through ``self.cache``, only querying for cache misses.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            resolve (callable): Method to resolve a list of cache misses.
+
+        Returns:
+            (list) List of collected records, in the order of ``data``.
+        """
+        ips = [data] if isinstance(data, str) else list(data)
+        key = self.cache_key()
+        cached = self.cache.get_many(key, ips)
+        misses = [ip for ip in ips if ip not in cached]
+
+        # Caches supporting coalescing hand out IPs not already in flight
+        pending = {}
+        if misses and hasattr(self.cache, "claim"):
+            misses, pending = self.cache.claim(key, misses)
+
+        resolved = None
+        try:
+            if misses:
+                resolved = resolve(misses)
+                self.cache.put_many(key, resolved or [])
+                if not cached and not pending:
+                    return resolved
+        finally:
+            if hasattr(self.cache, "claim"):
+                self.cache.release(key, misses)
+
+        if pending:
+            cached.update(self.cache.wait(key, pending))
+            # Resolve any IPs the other caller failed to resolve
+            failed = [ip for ip in pending if ip not in cached]
+            if failed:
+                retried = resolve(failed) or []
+                self.cache.put_many(key, retried)
+                resolved = (resolved or []) + retried
+
+        return self._merge_cached(ips, cached, resolved)
+
+    async def _acached_query(self, ips, resolve):
+        """Asynchronous counterpart to ``self._cached_query()``.
+
+        Args:
+            ips (list): IPs to resolve
+            resolve (coroutine function): Resolves a list of cache misses.
+
+        Returns:
+            (list) List of collected records, in the order of ``ips``.
+        """
+        key = self.cache_key()
+        cached = self.cache.get_many(key, ips)
+        misses = [ip for ip in ips if ip not in cached]
+
+        pending = {}
+        if misses and hasattr(self.cache, "claim"):
+            misses, pending = self.cache.claim(key, misses)
+
+        resolved = None
+        try:
+            if misses:
+                resolved = await resolve(misses)
+                self.cache.put_many(key, resolved or [])
+        finally:
+            if hasattr(self.cache, "claim"):
+                self.cache.release(key, misses)
+
+        if pending:
+            # Waiting on other callers blocks, so keep it off the event loop
+            loop = asyncio.get_running_loop()
+            cached.update(
+                await loop.run_in_executor(None, self.cache.wait, key, pending)
+            )
+            failed = [ip for ip in pending if ip not in cached]
+            if failed:
+                retried = await resolve(failed) or []
+                self.cache.put_many(key, retried)
+                resolved = (resolved or []) + retried
+
+        return self._merge_cached(ips, cached, resolved)
+
+    @staticmethod
+    def _merge_cached(ips, cached, resolved):
+        """Combine cached and newly resolved records in the order requested.
+
+        Args:
+            ips (list): IPs requested
+            cached (dict): Cached records, keyed by IP.
+            resolved (list): Newly resolved records.
+
+        Returns:
+            (list) List of records, in the order of ``ips``.
+        """
+        resolved_by_ip = {str(rec.get("query")): rec for rec in resolved or []}
+        results = [cached.get(ip) or resolved_by_ip.pop(ip, None) for ip in ips]
+        return [rec for rec in results if rec] + list(resolved_by_ip.values())
 
     @staticmethod
     def defang_ioc(ioc):
@@ -100,9 +540,12 @@ class ResolverBase:
     def write_csv(outfile, data, headers=None):
         """Writes a list of dictionaries to a CSV file.
 
+        As nested objects in any record may add columns to the header row,
+        records from an iterator are collected before writing.
+
         Arguments:
             outfile (str or file_obj): Path to output file
-            data (list): List of dictionaries to write to file
+            data (list or iterable): Dictionaries to write to file
             headers (list): Header row to use. If empty, will use the
                 first dictionary in the `data` list.
 
@@ -115,10 +558,11 @@ class ResolverBase:
             >>> resolver.write_csv('test.csv', records, ['query', 'count'])
 
         """
+        data = list(data)
 
         if not headers:
             # Use the first line of data
-            headers = [str(x) for x in data[0].keys()]
+            headers = [str(x) for x in data[0].keys()] if data else []
 
         # Write rows individually to handle flattening complex objects. Will update headers with new fields
         rows_to_write, headers = ResolverBase.flatten_objects(data, headers)
@@ -140,15 +584,23 @@ class ResolverBase:
             open_file.close()
 
     @staticmethod
-    def write_json(outfile, data, headers=None, lines=False):
+    def write_json(outfile, data, headers=None, lines=False, compact=False):
         """Writes output in JSON format
 
+        Records are written as they are read from ``data``, so a generator of
+        records is written as it is resolved. JSON lines output is flushed
+        after each record, for readers consuming the output as it is written.
+        Records are encoded by ``codec.dumps()``, using orjson for compact
+        output if installed.
+
         Args:
             outfile (str or file_obj): Path to or already open file
-            data (list): List of dictionaries containing resolved data
+            data (list or iterable): Dictionaries containing resolved data
             headers (list): List of column headers. Will use the first element of data if not present.
             lines (bool): Whether to export 1 dictionary object per line or
                 a whole json object.
+            compact (bool): Whether to omit the spaces after separators and
+                write non-ASCII characters as UTF-8.
 
         Returns:
             None
@@ -170,17 +622,26 @@ class ResolverBase:
         was_opened = False
         open_file = outfile
         if isinstance(outfile, str):
-            open_file = open(outfile, "w", newline="")
+            open_file = open(outfile, "wb")
             was_opened = True
 
         if headers:
-            data = ResolverBase.normalize_data_headers(data, headers)
+            data = (ResolverBase.select_headers(x, headers) for x in data)
 
+        write = codec.byte_writer(open_file)
         if lines:
             for entry in data:
-                open_file.write(json.dumps(entry) + "\n")
+                write(codec.dumps(entry, newline=True, compact=compact))
+                open_file.flush()
         else:
-            json.dump(data, open_file)
+            separator = codec.item_separator(compact)
+            write(b"[")
+            for position, entry in enumerate(data):
+                if position:
+                    write(separator)
+                write(codec.dumps(entry, compact=compact))
+            write(b"]")
+            open_file.flush()
 
         if was_opened:
             open_file.close()
@@ -196,16 +657,26 @@ class ResolverBase:
         Returns:
             (dict): Updated API response with limited headers
         """
+        return [ResolverBase.select_headers(x, headers) for x in data]
+
+    @staticmethod
+    def select_headers(record, headers):
+        """Filter content from a single record that is not requested in output
+
+        Args:
+            record (dict): Record from API
+            headers (list): List of user-provided headers to return
+
+        Returns:
+            (dict): Record with only the requested headers
+        """
         # Only include fields in headers
         # Include headers with no value if not present in original
-        selected_data = []
-        for x in data:
-            d = {k: v for k, v in x.items() if k in headers}
-            for h in headers:
-                if h not in d:
-                    d[h] = None
-            selected_data.append(d)
-        return selected_data
+        d = {k: v for k, v in record.items() if k in headers}
+        for h in headers:
+            if h not in d:
+                d[h] = None
+        return d
 
     @staticmethod
     def flatten_objects(data, headers):
@@ -250,3 +721,123 @@ class ResolverBase:
                 if new_header not in headers:
                     headers.append(new_header)
                 row[new_header] = value
+
+
+class CompositeResolver(ResolverBase):
+    """Base class for resolvers that delegate resolution to other resolvers.
+
+    Progress bars, rate limits, request budgets, and resources are configured
+    on and released by each wrapped resolver, rather than the composite.
+
+    Args:
+        resolvers (list): Configured resolvers to delegate to.
+
+    Raises:
+        ValueError: If no resolvers are provided.
+    """
+
+    cacheable = False  # Wrapped resolvers use the cache, as configured
+
+    def __init__(self, resolvers):
+        """Configure the wrapped resolvers."""
+        super().__init__()
+        self.wrapped = list(resolvers)
+        if not self.wrapped:
+            raise ValueError("At least one resolver is required")
+
+    @property
+    def pbar(self):
+        """Whether the wrapped resolvers display progress bars."""
+        return any(x.pbar for x in getattr(self, "wrapped", []))
+
+    @pbar.setter
+    def pbar(self, value):
+        """Enable or disable progress bars for every wrapped resolver."""
+        for resolver in getattr(self, "wrapped", []):
+            resolver.pbar = value
+
+    def close(self):
+        """Close the resources held by each wrapped resolver.
+
+        Returns:
+            None
+        """
+        for resolver in self.wrapped:
+            resolver.close()
+
+    def share_limits(self, state_dir=None):
+        """Draw on rate limits shared with other processes, for each resolver.
+
+        Args:
+            state_dir (str): Directory holding shared rate limit state.
+
+        Returns:
+            None
+        """
+        for resolver in self.wrapped:
+            resolver.share_limits(state_dir)
+
+    def set_budget(self, budget):
+        """Limit the requests sent by each wrapped resolver with a shared budget.
+
+        Args:
+            budget (RequestBudget): Budget to spend requests from.
+
+        Returns:
+            None
+        """
+        for resolver in self.wrapped:
+            resolver.set_budget(budget)
+
+    def stream_chunk(self):
+        """Size chunks of a stream for the resolver needing the most IPs per chunk.
+
+        Returns:
+            (int): Number of IPs per chunk.
+        """
+        return max(x.stream_chunk() for x in self.wrapped)
+
+    def single(self, ip=None):
+        """Resolve a single IP address.
+
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
+
+        Returns:
+            (list): List containing the resolved record.
+        """
+        return self.query(self.data if ip is None else ip)
+
+    def batch(self):
+        """Resolve multiple IP addresses.
+
+        Returns:
+            (list): List of resolved IP address records.
+        """
+        return self.query(self.data)
+
+    @staticmethod
+    def _ips(data):
+        """Normalize the IPs to resolve in to a list of distinct strings."""
+        if isinstance(data, str):
+            return [data]
+        if isinstance(data, (list, tuple, set)):
+            return list(dict.fromkeys(str(x) for x in data))
+        raise NotImplementedError()
+
+    @staticmethod
+    def match(ips, records):
+        """Match the records of a wrapped resolver to the IPs sent to it.
+
+        Args:
+            ips (list): IPs sent to the resolver.
+            records (list): Records returned by the resolver.
+
+        Returns:
+            (dict): Records keyed by IP address.
+        """
+        records = records or []
+        if all(isinstance(x, dict) and "query" in x for x in records):
+            return {str(x["query"]): x for x in records}
+        # Records without a query field are returned in the order requested
+        return {ip: x for ip, x in zip(ips, records) if isinstance(x, dict)}
@@ -0,0 +1,562 @@
+"""
+Resolution Cache
+================
+
+Caches of resolved IP address records.
+
+``ResolutionCache`` is a persistent cache, shared across runs. ``MemoryCache``
+is a bounded in-process cache for long running library users, and may use a
+``ResolutionCache`` as its backing store. ``ResolutionJournal`` records the
+progress of a single job, so an interrupted job may be resumed.
+
+Persistent records are stored in an SQLite database within the user's cache directory
+and are keyed on the resolver, IP address, language, and requested fields.
+Records older than the configured time to live (TTL) are ignored and
+replaced the next time the IP address is resolved. A TTL of ``0`` ignores every
+cached record, while ``None`` never expires them.
+
+Default cache locations:
+
+* Linux - ``$XDG_CACHE_HOME/chickadee`` or ``~/.cache/chickadee``
+* macOS - ``~/Library/Caches/chickadee``
+* Windows - ``%LOCALAPPDATA%\\chickadee\\Cache``
+
+Module Documentation
+--------------------
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+DEFAULT_TTL = 86400  # One day, in seconds
+UNCACHED_STATUSES = ("failed", "skipped")  # Records to resolve again next time
+
+
+def default_cache_dir():
+    """Determine the platform specific cache directory for chickadee.
+
+    Returns:
+        (str): Path to the cache directory. Not created by this function.
+    """
+    if "win32" in sys.platform:
+        base = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "chickadee", "Cache")
+    if "darwin" in sys.platform:
+        return os.path.expanduser("~/Library/Caches/chickadee")
+    base = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "chickadee")
+
+
+class ResolutionCache:
+    """SQLite backed cache of resolved records.
+
+    Args:
+        cache_path (str): Path to the cache database. Defaults to
+            ``resolutions.sqlite`` within ``default_cache_dir()``.
+        ttl (int): Number of seconds a record is considered valid. Records
+            never expire if ``None``, and are never read if ``0``.
+        refresh (bool): Ignore existing records, while still storing new
+            resolutions. Useful to force an update of cached data.
+
+    Examples:
+        >>> cache = ResolutionCache(ttl=3600)
+        >>> resolver = ipapi.Resolver()
+        >>> resolver.cache = cache
+        >>> resolver.query(['1.1.1.1'])  # Resolved and stored
+        >>> resolver.query(['1.1.1.1'])  # Read from cache
+    """
+
+    def __init__(self, cache_path=None, ttl=DEFAULT_TTL, refresh=False):
+        """Open the cache database and create the table if needed."""
+        if not cache_path:
+            cache_dir = default_cache_dir()
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = os.path.join(cache_dir, "resolutions.sqlite")
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resolutions (
+                resolver TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                record TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (resolver, lang, fields, ip)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, key, ips):
+        """Retrieve unexpired records for a collection of IP addresses.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            ips (list): IP addresses to look up.
+
+        Returns:
+            (dict): Cached records, keyed by IP address. IPs without a valid
+                record are not included.
+        """
+        if self.refresh or self.ttl == 0:
+            return {}
+        oldest = time.time() - self.ttl if self.ttl is not None else 0
+        found = {}
+        ips = list(ips)
+        with self._lock:
+            # Keep well within the SQLite host parameter limit
+            for start in range(0, len(ips), 500):
+                chunk = ips[start : start + 500]
+                rows = self.conn.execute(
+                    "SELECT ip, record FROM resolutions "
+                    "WHERE resolver = ? AND lang = ? AND fields = ? AND created >= ? "
+                    f"AND ip IN ({','.join('?' * len(chunk))})",
+                    (*key, oldest, *chunk),
+                )
+                found.update({ip: json.loads(record) for ip, record in rows})
+        logger.debug("Found %s of %s IPs in the resolution cache", len(found), len(ips))
+        return found
+
+    def put_many(self, key, records):
+        """Store resolved records.
+
+        Records without a ``query`` value, or with a ``failed`` or ``skipped``
+        status, are not stored. The ``count`` field is removed prior to storing, as it is
+        specific to the input data.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            records (list): Resolved records to store.
+
+        Returns:
+            None
+        """
+        now = time.time()
+        rows = [
+            (
+                *key,
+                str(rec["query"]),
+                json.dumps({k: v for k, v in rec.items() if k != "count"}),
+                now,
+            )
+            for rec in records
+            if rec and rec.get("query") and rec.get("status") not in UNCACHED_STATUSES
+        ]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def purge_expired(self):
+        """Remove expired records from the cache database.
+
+        Returns:
+            (int): Number of records removed.
+        """
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM resolutions WHERE created < ?", (time.time() - self.ttl,)
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Close the cache database.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.conn.close()
+
+
+class MemoryCache:
+    """Bounded in-memory LRU cache of resolved records, with request coalescing.
+
+    Intended for long running processes that resolve overlapping IP addresses
+    many times, potentially from several threads. Share a single instance
+    across resolvers (or ``Chickadee`` instances) to benefit from it.
+
+    When several callers request the same uncached IP address concurrently,
+    only the first sends the request. The others wait for that request to
+    complete and are served its result ("single-flight" coalescing).
+
+    Args:
+        max_size (int): Maximum number of records to hold before evicting the
+            least recently used.
+        backend (ResolutionCache): Optional persistent cache consulted on a
+            miss and updated with new resolutions.
+        wait_timeout (int): Seconds to wait on another caller's in-flight
+            request before resolving the IP address independently.
+        ttl (int): Seconds a record is served for before it is resolved
+            again. Records do not expire if None.
+
+    Examples:
+        >>> cache = MemoryCache(max_size=50000)
+        >>> chickadee = Chickadee()
+        >>> chickadee.cache = cache
+        >>> chickadee.run('1.1.1.1')
+        >>> cache.stats()
+        {'hits': 0, 'misses': 1, 'coalesced': 0, 'evictions': 0, 'size': 1}
+    """
+
+    def __init__(self, max_size=10000, backend=None, wait_timeout=120, ttl=None):
+        """Configure the cache and its counters."""
+        self.max_size = max_size
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._records = OrderedDict()
+        self._expires = {}  # Expiry time of each record, if self.ttl is set
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Report cache counters.
+
+        Returns:
+            (dict): Hit, miss, coalesced request, and eviction counts along
+                with the current number of cached records.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "size": len(self._records),
+            }
+
+    def get_many(self, key, ips):
+        """Retrieve records for a collection of IP addresses.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            ips (list): IP addresses to look up.
+
+        Returns:
+            (dict): Copies of the cached records, keyed by IP address.
+        """
+        found = {}
+        with self._lock:
+            for ip in ips:
+                record = self._get(key, ip)
+                if record is not None:
+                    self._records.move_to_end((key, ip))
+                    found[ip] = dict(record)
+            self.hits += len(found)
+
+        if self.backend is not None and len(found) < len(ips):
+            stored = self.backend.get_many(key, [ip for ip in ips if ip not in found])
+            self._store(key, stored.values())
+            with self._lock:
+                self.hits += len(stored)
+            found.update(stored)
+
+        with self._lock:
+            self.misses += len(ips) - len(found)
+        return found
+
+    def put_many(self, key, records):
+        """Store resolved records and wake any callers waiting on them.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            records (list): Resolved records to store.
+
+        Returns:
+            None
+        """
+        records = [
+            {k: v for k, v in rec.items() if k != "count"}
+            for rec in records
+            if rec and rec.get("query") and rec.get("status") not in UNCACHED_STATUSES
+        ]
+        self._store(key, records)
+        if self.backend is not None:
+            self.backend.put_many(key, records)
+
+    def _store(self, key, records):
+        """Add records to the LRU, evicting the oldest entries if full.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            records (iterable): Records to add.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for rec in records:
+                self._records[(key, str(rec["query"]))] = dict(rec)
+                self._records.move_to_end((key, str(rec["query"])))
+                if self.ttl is not None:
+                    self._expires[(key, str(rec["query"]))] = time.time() + self.ttl
+            while len(self._records) > self.max_size:
+                evicted, _ = self._records.popitem(last=False)
+                self._expires.pop(evicted, None)
+                self.evictions += 1
+
+    def _get(self, key, ip):
+        """Get a record, dropping it if expired. Must hold ``self._lock``.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            ip (str): IP address to look up.
+
+        Returns:
+            (dict): Cached record, or None if missing or expired.
+        """
+        expires = self._expires.get((key, ip))
+        if expires is not None and expires <= time.time():
+            del self._records[(key, ip)]
+            del self._expires[(key, ip)]
+            return None
+        return self._records.get((key, ip))
+
+    def claim(self, key, ips):
+        """Claim IP addresses to resolve, skipping those already in flight.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            ips (list): IP addresses missing from the cache.
+
+        Returns:
+            (tuple): List of IP addresses claimed by the caller, and a
+                dictionary of IP addresses being resolved by other callers
+                mapped to the event signalling their completion.
+        """
+        claimed = []
+        pending = {}
+        with self._lock:
+            for ip in ips:
+                event = self._in_flight.get((key, ip))
+                if event is None:
+                    self._in_flight[(key, ip)] = threading.Event()
+                    claimed.append(ip)
+                else:
+                    pending[ip] = event
+            self.coalesced += len(pending)
+        return claimed, pending
+
+    def release(self, key, ips):
+        """Release claimed IP addresses, waking callers waiting on them.
+
+        Should be called once resolution completes, whether or not it was
+        successful.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            ips (list): IP addresses previously returned by ``self.claim()``.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            events = [self._in_flight.pop((key, ip), None) for ip in ips]
+        for event in events:
+            if event is not None:
+                event.set()
+
+    def wait(self, key, pending):
+        """Wait for other callers' in-flight requests to complete.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            pending (dict): IP addresses mapped to events, from ``self.claim()``.
+
+        Returns:
+            (dict): Copies of the records resolved by other callers. IP
+                addresses that failed to resolve are not included.
+        """
+        for event in pending.values():
+            event.wait(self.wait_timeout)
+        found = {}
+        with self._lock:
+            for ip in pending:
+                record = self._get(key, ip)
+                if record is not None:
+                    found[ip] = dict(record)
+        return found
+
+
+class ResolutionJournal:
+    """Append-only journal of the records resolved by a job.
+
+    Resolvers append the records of each completed request to the journal
+    through the cache interface. When a job is interrupted, running it again
+    with the same journal only resolves the IP addresses missing from it.
+    As journaled records are returned in the order requested, the output is
+    identical to that of an uninterrupted run.
+
+    Unlike the resolution cache, journaled records do not expire. Records with
+    a ``failed`` or ``skipped`` status are not journaled, so they are resolved
+    again when the job resumes.
+
+    Args:
+        journal_path (str): Path to the journal file. Created if missing.
+        backend (ResolutionCache or MemoryCache): Optional cache consulted for
+            IP addresses missing from the journal, and updated with new
+            resolutions.
+
+    Examples:
+        >>> chickadee = Chickadee()
+        >>> chickadee.cache = ResolutionJournal('job.journal', ResolutionCache())
+        >>> chickadee.run('folder/')  # Interrupted
+        >>> chickadee.run('folder/')  # Only resolves IPs missing from the journal
+    """
+
+    def __init__(self, journal_path, backend=None):
+        """Load the records journaled so far and open the journal to append."""
+        self.journal_path = journal_path
+        self.backend = backend
+        self._records = {}
+        self._lock = threading.Lock()
+        self._load()
+        self._journal = open(journal_path, "a", encoding="utf-8")
+
+    def __len__(self):
+        """Number of records in the journal."""
+        return len(self._records)
+
+    def _load(self):
+        """Read the records journaled by earlier runs.
+
+        A line left incomplete by an interrupted write is removed, so new
+        entries are appended after the last complete line.
+
+        Returns:
+            None
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        complete = 0
+        with open(self.journal_path, "rb") as open_file:
+            for line in open_file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                    key = tuple(entry["key"])
+                    record = entry["record"]
+                    self._records[(key, str(record["query"]))] = record
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Ignoring invalid journal entry: %s", line[:80])
+                complete += len(line)
+        if complete < os.path.getsize(self.journal_path):
+            logger.warning("Removing incomplete entry from %s", self.journal_path)
+            with open(self.journal_path, "r+b") as open_file:
+                open_file.truncate(complete)
+        logger.debug(
+            "Loaded %s records from journal %s", len(self._records), self.journal_path
+        )
+
+    def get_many(self, key, ips):
+        """Retrieve journaled records for a collection of IP addresses.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            ips (list): IP addresses to look up.
+
+        Returns:
+            (dict): Copies of the records, keyed by IP address. IPs missing from
+                the journal, and the backend if set, are not included.
+        """
+        key = tuple(key)
+        found = {}
+        with self._lock:
+            for ip in ips:
+                record = self._records.get((key, ip))
+                if record is not None:
+                    found[ip] = dict(record)
+        if self.backend is not None and len(found) < len(ips):
+            stored = self.backend.get_many(key, [ip for ip in ips if ip not in found])
+            # Journal records from the backend, so resuming does not depend on them
+            self._append(key, stored.values())
+            found.update(stored)
+        return found
+
+    def put_many(self, key, records):
+        """Append resolved records to the journal and the backend, if set.
+
+        The journal is flushed to disk before returning, so the records
+        survive the job being interrupted.
+
+        Args:
+            key (tuple): Resolver, language, and fields, as provided by
+                ``ResolverBase.cache_key()``.
+            records (list): Resolved records to store.
+
+        Returns:
+            None
+        """
+        records = [
+            {k: v for k, v in rec.items() if k != "count"}
+            for rec in records
+            if rec and rec.get("query") and rec.get("status") not in UNCACHED_STATUSES
+        ]
+        self._append(tuple(key), records)
+        if self.backend is not None:
+            self.backend.put_many(key, records)
+
+    def _append(self, key, records):
+        """Write records to the journal file.
+
+        Args:
+            key (tuple): Resolver, language, and fields.
+            records (iterable): Records to write.
+
+        Returns:
+            None
+        """
+        lines = []
+        with self._lock:
+            for rec in records:
+                self._records[(key, str(rec["query"]))] = rec
+                lines.append(json.dumps({"key": key, "record": rec}) + "\n")
+            if not lines:
+                return
+            self._journal.write("".join(lines))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def close(self):
+        """Close the journal and the backend, if set.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._journal.close()
+        if getattr(self.backend, "close", None) is not None:
+            self.backend.close()
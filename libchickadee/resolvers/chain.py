@@ -0,0 +1,196 @@
+"""
+Chain Resolver
+==============
+
+Composite resolver passing IP addresses through a series of resolvers.
+
+Each IP address is sent to the first resolver, or tier, in the chain. It is
+only sent on to the next tier if the previous tiers found no data for it, or
+did not provide one of the requested fields. A common chain places an offline
+resolver, such as ``mmdb`` or ``range_table``, before a paid API, so the API is
+only queried for addresses missing from the local dataset.
+
+Each tier keeps its own configuration, including its use of the resolution
+cache, rate limits, and request budget. Tiers using the resolution cache only
+query their data source for addresses not already cached.
+
+Records are merged in tier order. Fields are taken from the first tier
+providing a value, and the ``status`` and ``message`` fields come from the
+first tier with data. Where no tier has data for an IP address, the record
+from the last tier is returned, so errors such as an exhausted budget are
+reported.
+
+Configuration
+^^^^^^^^^^^^^
+
+Select a chain with a comma separated list of resolvers, such as
+``-r range_table,ip_api``. Each resolver is configured with its own option in
+the ``[resolvers]`` section of the configuration file.
+
+Module Documentation
+--------------------
+
+"""
+import logging
+
+from . import CompositeResolver
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+META_FIELDS = ("query", "count", "status", "message")  # Not resolved data
+NO_DATA_STATUSES = ("fail", "failed", "skipped", 0, -1)  # -1 and 0 from VirusTotal
+
+
+class ChainResolver(CompositeResolver):
+    """Class to resolve IP addresses with a series of resolvers.
+
+    Args:
+        resolvers (list): Configured resolvers, in the order to query them.
+        fields (list): Fields to require before an IP address is considered
+            resolved. Any data is sufficient if not provided.
+
+    Raises:
+        ValueError: If no resolvers are provided.
+
+    Examples:
+        >>> local = range_table.Resolver('ip2asn-combined.tsv.gz')
+        >>> remote = ipapi.ProResolver(api_key)
+        >>> resolver = ChainResolver([local, remote], fields=['query', 'as', 'city'])
+        >>> resolver.query(ips)  # Only IPs without a city are sent to ip-api
+        >>> resolver.stats
+        {'range_table': 1000, 'ipapi': 87}
+    """
+
+    def __init__(self, resolvers, fields=None):
+        """Configure the tiers of the chain."""
+        super().__init__(resolvers)
+        self.resolvers = self.wrapped
+        self.required_fields = [x for x in fields or [] if x not in META_FIELDS]
+        # Without requested fields, records hold the fields of every tier
+        self.fields = fields or list(
+            dict.fromkeys(x for tier in self.resolvers for x in tier.default_fields())
+        )
+        self.stats = {}  # Number of IPs sent to each tier
+
+    def query(self, data, force_single=False):
+        """Resolve IPs with each tier in turn, until all are resolved.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint of each tier rather than the batch endpoint.
+
+        Returns:
+            (list) List of merged records, in the order of ``data``.
+        """
+        ips = self._ips(data)
+        merged = {}
+        pending = ips
+        for resolver in self.resolvers:
+            if not pending:
+                break
+            self._count(resolver, pending)
+            records = resolver.query(pending, force_single=force_single)
+            pending = self._merge(merged, pending, records)
+        return [merged[ip] for ip in ips if ip in merged]
+
+    async def aquery(self, data, force_single=False, timeout=None):
+        """Asynchronous counterpart to ``self.query()``.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint of each tier rather than the batch endpoint.
+            timeout (float): Seconds to allow each tier before raising
+                ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            (list) List of merged records, in the order of ``data``.
+        """
+        ips = self._ips(data)
+        merged = {}
+        pending = ips
+        for resolver in self.resolvers:
+            if not pending:
+                break
+            self._count(resolver, pending)
+            records = await resolver.aquery(
+                pending, force_single=force_single, timeout=timeout
+            )
+            pending = self._merge(merged, pending, records)
+        return [merged[ip] for ip in ips if ip in merged]
+
+    def _count(self, resolver, ips):
+        """Record the number of IPs sent to a tier."""
+        name = type(resolver).__module__.rsplit(".", 1)[-1]
+        self.stats[name] = self.stats.get(name, 0) + len(ips)
+        logger.debug("Sending %s IPs to the %s resolver", len(ips), name)
+
+    def _merge(self, merged, ips, records):
+        """Merge a tier's records in to the results so far.
+
+        Args:
+            merged (dict): Records so far, keyed by IP. Updated in place.
+            ips (list): IPs sent to the tier.
+            records (list): Records returned by the tier.
+
+        Returns:
+            (list): IPs still missing data or requested fields.
+        """
+        by_ip = self.match(ips, records)
+        pending = []
+        for ip in ips:
+            record = by_ip.get(ip)
+            current = merged.get(ip)
+            if record is None:
+                pass
+            elif current is None or not self.has_data(current):
+                # Replace earlier failures, so the last tier's error is reported
+                merged[ip] = dict(record)
+            elif self.has_data(record):
+                for key, value in record.items():
+                    if current.get(key) in (None, ""):
+                        current[key] = value
+            if not self.is_complete(merged.get(ip)):
+                pending.append(ip)
+        return pending
+
+    @staticmethod
+    def _values(record):
+        """Get the resolved values of a record, excluding empty and meta fields."""
+        return {
+            k: v
+            for k, v in record.items()
+            if k not in META_FIELDS and v not in (None, "")
+        }
+
+    def has_data(self, record):
+        """Determine whether a tier found data for an IP address.
+
+        Args:
+            record (dict): Record returned by a tier.
+
+        Returns:
+            (bool): True if the record holds resolved values.
+        """
+        if record.get("status") in NO_DATA_STATUSES:
+            return False
+        return bool(self._values(record))
+
+    def is_complete(self, record):
+        """Determine whether an IP address needs no further tiers.
+
+        Args:
+            record (dict): Merged record, or None if not yet resolved.
+
+        Returns:
+            (bool): True if the record has data for every requested field.
+        """
+        if not record or not self.has_data(record):
+            return False
+        return all(record.get(x) not in (None, "") for x in self.required_fields)
@@ -0,0 +1,146 @@
+"""
+JSON Codec
+==========
+
+JSON encoding and decoding for resolver responses and reports.
+
+Decoding large VirusTotal responses and encoding JSON lines reports with
+millions of records is dominated by the JSON codec. When orjson is installed
+it is used to decode responses, otherwise the standard library ``json`` module
+is used.
+
+Reports are written by the standard library by default, exactly as earlier
+versions of chickadee did, with a space after each separator and non-ASCII
+characters escaped, whether or not orjson is installed. Compact reports,
+requested with ``--compact-json``, are written by orjson if installed, without
+spaces and with non-ASCII characters UTF-8 encoded, holding the same data.
+
+Records are encoded straight to bytes and written to the binary buffer of the
+output file, without building an intermediate string per record.
+
+Configuration
+^^^^^^^^^^^^^
+
+Optionally uses orjson, which may be installed with
+``pip install chickadee[orjson]``.
+
+Module Documentation
+--------------------
+"""
+import io
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+def backend():
+    """Name the JSON library in use.
+
+    Returns:
+        (str): ``orjson`` or ``json``.
+    """
+    return "orjson" if orjson is not None else "json"
+
+
+def dumps(obj, newline=False, compact=False):
+    """Encode an object as JSON.
+
+    The layout is the same with either library unless ``compact`` is set.
+
+    Args:
+        obj (dict or list): Object to encode.
+        newline (bool): Whether to end the output with a newline.
+        compact (bool): Whether to omit the spaces after separators and write
+            non-ASCII characters as UTF-8, using orjson if installed.
+
+    Returns:
+        (bytes): Encoded object.
+    """
+    if compact and orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if newline:
+            option |= orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(obj, option=option)
+    if compact:
+        encoded = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    else:
+        encoded = json.dumps(obj)
+    return (encoded + "\n" if newline else encoded).encode("utf-8")
+
+
+def item_separator(compact=False):
+    """Get the separator between the items of an array, matching ``dumps()``.
+
+    Args:
+        compact (bool): Whether the items are encoded compactly.
+
+    Returns:
+        (bytes): Separator to write between encoded items.
+    """
+    return b"," if compact else b", "
+
+
+def loads(data):
+    """Decode a JSON document.
+
+    Args:
+        data (bytes or str): Document to decode.
+
+    Returns:
+        (dict or list): Decoded object.
+
+    Raises:
+        ValueError: If the document is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def response_json(response):
+    """Decode the JSON body of a response.
+
+    Args:
+        response (requests.Response): Response from a data source.
+
+    Returns:
+        (dict or list): Decoded body.
+
+    Raises:
+        ValueError: If the body is not valid JSON.
+    """
+    content = getattr(response, "content", None)
+    if orjson is not None and isinstance(content, bytes):
+        return orjson.loads(content)
+    return response.json()
+
+
+def byte_writer(open_file):
+    """Get a function writing encoded output to a file object.
+
+    Binary files are written to directly. Text files are written to through
+    their binary buffer when UTF-8 encoded, after flushing any text already
+    written, and otherwise as decoded strings.
+
+    Args:
+        open_file (file_obj): Open binary or text file.
+
+    Returns:
+        (callable): Function taking bytes to write.
+    """
+    if isinstance(open_file, (io.RawIOBase, io.BufferedIOBase)):
+        return open_file.write
+    buffer = getattr(open_file, "buffer", None)
+    encoding = (getattr(open_file, "encoding", None) or "").lower().replace("-", "")
+    if buffer is not None and encoding == "utf8":
+        open_file.flush()
+        return buffer.write
+    return lambda data: open_file.write(data.decode("utf-8"))
@@ -65,7 +65,10 @@ Limitations
 This service has a free tier for non-commercial use, and is rate limited to
 15 requests per minute. The returned HTTP header ``X-Rl`` contains the number
 of requests remaining in the current rate limit window. ``X-Ttl`` contains the
-seconds until the limit is reset.
+seconds until the limit is reset. chickadee counts requests against these
+limits as they are sent, waiting for the limit to reset instead of sending
+requests that would be rejected. Should a request still be rate limited, only
+that request is retried, up to five times in total.
 
 The professional service is supported by chickadee and allows the execution
 of unlimited requests, commercial use, and https endpoints. More details are
@@ -77,12 +80,14 @@ Module Documentation
 """
 import logging
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import requests
-from tqdm import trange
+from tqdm import tqdm
 
-from . import ResolverBase
+from . import ResolverBase, codec
+from .rate_limit import RateLimiter, SharedRateLimiter
+from .retry import RequestFailed
 
 logger = logging.getLogger(__name__)
 
@@ -91,6 +96,8 @@ __date__ = 20200114
 __license__ = "MIT Copyright 2020 Chapin Bryce"
 __desc__ = """Yet another GeoIP resolution tool."""
 
+RATE_LIMIT_ATTEMPTS = 5  # Times to send a request while it is rate limited
+
 FIELDS = [  # Ordered list of fields to gather
     "query",
     "count",
@@ -112,6 +119,23 @@ FIELDS = [  # Ordered list of fields to gather
     "status",
     "message",
 ]
+DEFAULT_FIELDS = [  # Fields returned by ip-api when none are requested
+    "status",
+    "message",
+    "country",
+    "countryCode",
+    "region",
+    "regionName",
+    "city",
+    "zip",
+    "lat",
+    "lon",
+    "timezone",
+    "isp",
+    "org",
+    "as",
+    "query",
+]
 
 
 class Resolver(ResolverBase):
@@ -135,40 +159,55 @@ class Resolver(ResolverBase):
         self.uri = "http://ip-api.com/"
         self.api_key = None
         self.enable_sleep = True
-        self.wait_time = datetime.now()
-
-    def rate_limit(self, headers):
-        """Method to check rate limiting. Checks ``X-Rl`` and ``X-Ttl`` headers.
+        # The free API has separate quotas for each endpoint
+        self.batch_limiter = RateLimiter(15, 60)
+        self.single_limiter = RateLimiter(45, 60)
 
-        Will set timer for rate limiting if ``X-Rl`` is less than 1 for
-        duration of ``X-Ttl`` + 1 second.
+    @staticmethod
+    def rate_limit(limiter, headers):
+        """Synchronise a rate limiter with the ``X-Rl`` and ``X-Ttl`` headers.
 
         Args:
+            limiter (RateLimiter): Limiter for the endpoint requested. Ignored
+                if None.
             headers (dict, CaseInsensitiveDict): Request header information.
 
         Return:
             None
         """
-        if int(headers.get("X-Rl", "0")) < 1:
-            self.wait_time = datetime.now() + timedelta(
-                seconds=int(headers.get("X-Ttl", "0")) + 0.25
-            )
+        if limiter is None or "X-Rl" not in headers:
+            return
+        limiter.update(int(headers["X-Rl"]), int(headers.get("X-Ttl", "0")))
 
-    def sleeper(self):
-        """Method to sleep operations for rate limiting. Executes sleep.
+    def default_fields(self):
+        """Fields reported in the records of the resolver, as configured.
 
-        Return:
+        Returns:
+            (list): Requested fields, or those returned by ip-api when none
+                are requested.
+        """
+        return super().default_fields() or list(DEFAULT_FIELDS)
+
+    def share_limits(self, state_dir=None):
+        """Draw on the free API quotas shared with other processes on the host.
+
+        The free API limits requests per source IP address, so all chickadee
+        processes on the host share the same quotas.
+
+        Args:
+            state_dir (str): Directory holding the shared rate limit state.
+
+        Returns:
             None
         """
-        while True:
-            now = datetime.now()
-            wait_time = self.wait_time - now
-            if wait_time.total_seconds() < 0:
-                self.wait_time = datetime.now()
-                return
-            wt_sec = wait_time.total_seconds() + 1  # add a buffer
-            logger.info(f"Sleeping for {wt_sec} seconds due to rate limiting.")
-            time.sleep(wt_sec)
+        if self.batch_limiter is not None:
+            self.batch_limiter = SharedRateLimiter(
+                "ip-api-batch", 15, 60, state_dir=state_dir
+            )
+        if self.single_limiter is not None:
+            self.single_limiter = SharedRateLimiter(
+                "ip-api-single", 45, 60, state_dir=state_dir
+            )
 
     def batch(self):
         """Handle batch query operations.
@@ -179,13 +218,32 @@ class Resolver(ResolverBase):
         Returns:
             (list): List of resolved IP address records with specified fields.
         """
-        records = [{"query": ip} for ip in self.data]
+        units = self.request_units(self.data)
         resolved_recs = []
-        orig_recs = range(0, len(records), 100)
-        if self.pbar:
-            orig_recs = trange(
-                0, len(records), 100, desc="Resolving IPs", unit_scale=True
-            )
+        with ThreadPoolExecutor(max_workers=self.worker_count()) as executor:
+            # Map preserves the order of the chunks as results are collected
+            results = executor.map(lambda unit: unit(), units)
+            if self.pbar:
+                results = tqdm(
+                    results, total=len(units), desc="Resolving IPs", unit_scale=True
+                )
+            for chunk_recs in results:
+                resolved_recs += chunk_recs
+        return resolved_recs
+
+    def request_units(self, ips, force_single=False):
+        """Split IPs in to batch requests of up to 100 IPs each.
+
+        Args:
+            ips (list): IPs to resolve
+            force_single (bool): Resolve each IP with the single endpoint.
+
+        Returns:
+            (list): List of callables, one per request.
+        """
+        if force_single:
+            return super().request_units(ips, force_single)
+        records = [{"query": ip} for ip in ips]
         params = {
             "fields": ",".join(self.fields)
             if isinstance(self.fields, list)
@@ -194,42 +252,64 @@ class Resolver(ResolverBase):
         }
         if self.api_key:
             params["key"] = self.api_key
+        return [
+            partial(self._batch_chunk, records[x : x + 100], params)
+            for x in range(0, len(records), 100)
+        ]
+
+    def _batch_chunk(self, chunk, params):
+        """Resolve up to 100 records with a single batch request.
+
+        A rate limited chunk is retried by ``self.send()``, without affecting
+        other chunks. Server and network errors are retried by ``self.retry``,
+        and reported as failed records if they persist.
+
+        Args:
+            chunk (list): Records to resolve, as ``{"query": ip}`` dictionaries.
+            params (dict): URL parameters to include in the request.
 
-        for x in orig_recs:
-            if self.enable_sleep:
-                self.sleeper()
-            rdata = requests.post(
+        Returns:
+            (list): List of resolved records for the chunk.
+        """
+        try:
+            rdata = self.send(
+                self.batch_limiter,
+                "post",
                 f"{self.uri}batch",
-                json=records[x : x + 100],
+                json=chunk,
                 params=params,
                 timeout=60,
             )
+        except RequestFailed as e:
+            logger.error(str(e))
+            return [
+                {"query": result["query"], "status": "failed", "message": str(e)}
+                for result in chunk
+            ]
 
-            if rdata.status_code == 200:
-                self.rate_limit(rdata.headers)
-                resolved_recs += rdata.json()
-            elif rdata.status_code == 429:
-                self.rate_limit(rdata.headers)
-                self.sleeper()
-                return self.batch()
-            else:  # pragma: no cover
-                msg = f"Unknown error encountered: {rdata.status_code}"
-                logger.error(msg)
-                resolved_recs += [
-                    {"query": result, "status": "failed", "message": msg}
-                    for result in records[x : x + 100]
-                ]
-        return resolved_recs
-
-    def single(self):
+        if rdata.status_code == 200:
+            return codec.response_json(rdata)
+        msg = self.error_message(rdata)
+        logger.error(msg)
+        return [
+            {"query": result["query"], "status": "failed", "message": msg}
+            for result in chunk
+        ]
+
+    def single(self, ip=None):
         """Handle single item query operations.
 
         Generally not called directly, should be called by ``self.query()`` to
-        allow for the logic to handle which endpoint is preferred.
+        allow for the logic to handle which endpoint is preferred. Does not
+        modify the resolver state, so may be called from several threads.
+
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
 
         Returns:
             (list): List of resolved IP address records with specified fields.
         """
+        ip = self.data if ip is None else ip
         params = {
             "fields": ",".join(self.fields),
             "lang": self.lang,
@@ -237,36 +317,91 @@ class Resolver(ResolverBase):
         if self.api_key:
             params["key"] = self.api_key
 
-        if self.enable_sleep:
-            self.sleeper()
+        try:
+            rdata = self.send(
+                self.single_limiter,
+                "get",
+                f"{self.uri}json/{ip}",
+                params=params,
+                timeout=60,
+            )
+        except RequestFailed as e:
+            logger.error(str(e))
+            return [{"query": ip, "status": "failed", "message": str(e)}]
 
-        rdata = requests.get(f"{self.uri}json/{self.data}", params=params, timeout=60)
         if rdata.status_code == 200:
-            self.rate_limit(rdata.headers)
-            return [rdata.json()]
+            return [codec.response_json(rdata)]
+        msg = self.error_message(rdata)
+        logger.error(msg)
+        return [{"query": ip, "status": "failed", "message": msg}]
+
+    def send(self, limiter, method, url, **kwargs):
+        """Send a request, retrying it while it is rate limited.
+
+        The limiter is synchronised with the rate limit headers of each
+        response. Should a rate limited response lack these headers, or the
+        endpoint have no limiter, the retry backs off as ``self.retry`` does.
+        Rate limited requests are sent up to ``RATE_LIMIT_ATTEMPTS`` times.
+
+        Args:
+            limiter (RateLimiter): Limiter for the endpoint requested. Ignored
+                if None.
+            method (str): HTTP method, such as ``get`` or ``post``.
+            url (str): URL to request.
+            **kwargs: Further arguments for the request.
+
+        Returns:
+            (requests.Response): The first response that was not rate
+                limited, or the last response once all attempts are used.
+
+        Raises:
+            RequestFailed: If the request could not be completed.
+        """
+        for attempt in range(1, RATE_LIMIT_ATTEMPTS + 1):
+            if limiter is not None:
+                limiter.acquire()
+            rdata = self.request(method, url, **kwargs)
+            if rdata.status_code in (200, 429):
+                self.rate_limit(limiter, rdata.headers)
+            if rdata.status_code != 429 or attempt == RATE_LIMIT_ATTEMPTS:
+                return rdata
+            if limiter is None or "X-Rl" not in rdata.headers:
+                wait = self.retry.backoff(attempt)
+                logger.info("Rate limited, retrying in %.1f seconds", wait)
+                time.sleep(wait)
+            else:
+                logger.info("Rate limited, retrying once the limit resets")
+
+    @staticmethod
+    def error_message(rdata):
+        """Describe an unsuccessful response.
+
+        Args:
+            rdata (requests.Response): Response with an unexpected status.
+
+        Returns:
+            (str): Message for the failed records.
+        """
         if rdata.status_code == 429:
-            self.rate_limit(rdata.headers)
-            self.sleeper()
-            return self.single()
-        else:  # pragma: no cover
-            msg = f"Unknown error encountered: {rdata.status_code}"
-            logger.error(msg)
-            return [{"query": self.data, "status": "failed", "message": msg}]
+            return f"Rate limited after {RATE_LIMIT_ATTEMPTS} attempts"
+        return f"Unknown error encountered: {rdata.status_code}"
 
 
 class ProResolver(Resolver):
     """GeoIP resolver using the ip-api.com paid subscription.
 
     Sets endpoint to paid API, confirms support for requested language,
-    and disables sleep functionality.
+    and disables sleep functionality. As the paid API is not rate limited,
+    up to ``max_workers`` batch requests are sent concurrently.
 
     Args:
         api_key (str): IP-API.com paid API key for requests.
         fields (list): Collection of fields to request in resolution.
         lang (str): Language for returned results.
+        max_workers (int): Number of batch requests to have in flight at once.
     """
 
-    def __init__(self, api_key, fields=None, lang="en"):  # pragma: no cover
+    def __init__(self, api_key, fields=None, lang="en", max_workers=1):
         """Initialize class object and configure default values."""
         super().__init__()
         self.lang = "en" if lang not in self.supported_langs else lang
@@ -274,3 +409,7 @@ class ProResolver(Resolver):
         self.uri = "https://pro.ip-api.com/"
         self.api_key = api_key
         self.enable_sleep = False
+        self.batch_limiter = None
+        self.single_limiter = None
+        self.max_workers = max_workers
+        self.pool_size = max(self.pool_size, max_workers)
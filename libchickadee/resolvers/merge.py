@@ -0,0 +1,154 @@
+"""
+Merge Resolver
+==============
+
+Composite resolver querying several resolvers at once, merging their records.
+
+Each resolver resolves the same distinct IP addresses, on its own thread and
+under its own rate limits, so resolution takes as long as the slowest
+resolver rather than the total of all of them. The records for each IP address
+are merged in to one, with the fields of each resolver prefixed by its name,
+such as ``ip_api.country`` and ``virustotal.detected_url_count``. The
+``query`` and ``count`` fields are not prefixed.
+
+Unlike a chain of resolvers, every resolver is queried for every IP address,
+and the value of a field from one resolver never replaces another's.
+
+Configuration
+^^^^^^^^^^^^^
+
+Select the resolvers with a comma separated list, and merge their records with
+``--merge``, such as ``-r ip_api,virustotal --merge``. Each resolver is
+configured with its own option in the ``[resolvers]`` section of the
+configuration file.
+
+Module Documentation
+--------------------
+
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import CompositeResolver
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+SHARED_FIELDS = ("query", "count")  # Fields not prefixed by the resolver name
+
+
+def namespaced(name, field):
+    """Prefix a field with the name of the resolver providing it.
+
+    Args:
+        name (str): Resolver name, such as ``ip_api``.
+        field (str): Field name.
+
+    Returns:
+        (str): Prefixed field name, such as ``ip_api.country``.
+    """
+    return f"{name}.{field}"
+
+
+class MergeResolver(CompositeResolver):
+    """Class to resolve IP addresses with several resolvers concurrently.
+
+    Args:
+        resolvers (dict): Configured resolvers, keyed by the name to prefix
+            their fields with.
+
+    Raises:
+        ValueError: If no resolvers are provided.
+
+    Examples:
+        >>> resolver = MergeResolver(
+        ...     {'ip_api': ipapi.Resolver(), 'virustotal': virustotal.ProResolver(key)}
+        ... )
+        >>> resolver.query(['1.1.1.1'])
+        [{'query': '1.1.1.1', 'ip_api.country': 'Australia', ...,
+          'virustotal.asn': 'AS13335 CLOUDFLARENET', ...}]
+    """
+
+    def __init__(self, resolvers):
+        """Configure the resolvers to merge."""
+        resolvers = dict(resolvers)
+        super().__init__(resolvers.values())
+        self.resolvers = resolvers
+        defaults = {x: y.default_fields() for x, y in self.resolvers.items()}
+        shared = [x for x in SHARED_FIELDS if any(x in y for y in defaults.values())]
+        self.fields = shared + [
+            namespaced(name, x)
+            for name, fields in defaults.items()
+            for x in fields
+            if x not in SHARED_FIELDS
+        ]
+
+    def query(self, data, force_single=False):
+        """Resolve IPs with every resolver at once, merging their records.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint of each resolver rather than the batch endpoint.
+
+        Returns:
+            (list) List of merged records, in the order of ``data``.
+        """
+        ips = self._ips(data)
+        logger.debug("Sending %s IPs to %s resolvers", len(ips), len(self.resolvers))
+        with ThreadPoolExecutor(len(self.resolvers), "merge") as executor:
+            futures = {
+                name: executor.submit(resolver.query, ips, force_single=force_single)
+                for name, resolver in self.resolvers.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
+        return self.merge(ips, results)
+
+    async def aquery(self, data, force_single=False, timeout=None):
+        """Asynchronous counterpart to ``self.query()``.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint of each resolver rather than the batch endpoint.
+            timeout (float): Seconds to allow each resolver before raising
+                ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            (list) List of merged records, in the order of ``data``.
+        """
+        ips = self._ips(data)
+        records = await asyncio.gather(
+            *(
+                resolver.aquery(ips, force_single=force_single, timeout=timeout)
+                for resolver in self.resolvers.values()
+            )
+        )
+        return self.merge(ips, dict(zip(self.resolvers, records)))
+
+    @classmethod
+    def merge(cls, ips, results):
+        """Merge the records of each resolver in to one record per IP address.
+
+        Args:
+            ips (list): IPs resolved.
+            results (dict): Records returned by each resolver, keyed by name.
+
+        Returns:
+            (list): One record per IP address, in the order of ``ips``, with
+                the fields of each resolver prefixed by its name.
+        """
+        merged = {ip: {"query": ip} for ip in ips}
+        for name, records in results.items():
+            for ip, record in cls.match(ips, records).items():
+                if ip not in merged:
+                    continue
+                for key, value in record.items():
+                    if key not in SHARED_FIELDS:
+                        merged[ip][namespaced(name, key)] = value
+        return list(merged.values())
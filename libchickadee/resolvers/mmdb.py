@@ -0,0 +1,496 @@
+"""
+MMDB Resolver
+=============
+
+Offline resolver reading MaxMind DB (``.mmdb``) files.
+
+This resolver does not require an internet connection, making it suitable
+for air-gapped environments. It supports databases in the MaxMind DB format,
+such as MaxMind's GeoLite2 City, Country, and ASN databases and DB-IP's Lite
+databases. Records are mapped on to the field names used by the ip-api
+resolver, allowing the output formats to remain consistent between
+resolvers.
+
+Data Source Information
+-----------------------
+
+Databases must be downloaded separately and are subject to the terms of their
+providers. In no way is inclusion of a data source format in libchickadee an
+endorsement of the data source.
+
+**Format documentation:** https://maxmind.github.io/MaxMind-DB/
+
+Configuration
+^^^^^^^^^^^^^
+
+Select the resolver with ``-r mmdb`` and set the ``mmdb`` option in the
+``[resolvers]`` section of the configuration file to the path of the
+database. Several databases, such as a City and an ASN database, may be
+provided as a comma separated list. Fields are taken from the first database
+providing them.
+
+Fields
+^^^^^^
+
+These fields are in no particular order. Availability depends on the
+database used.
+
+* query
+* count
+* status
+* message
+* continent
+* continentCode
+* country
+* countryCode
+* region
+* regionName
+* city
+* zip
+* lat
+* lon
+* timezone
+* isp
+* org
+* as
+* asname
+* proxy
+
+Implementation
+^^^^^^^^^^^^^^
+
+Database files are memory mapped and searched by walking the binary search
+tree directly, without requiring a compiled extension. Recently decoded records
+are cached by their location in the file, as many networks share a record.
+
+Module Documentation
+--------------------
+
+"""
+import logging
+import mmap
+import struct
+from collections import OrderedDict
+
+from netaddr import AddrFormatError, IPAddress
+from tqdm import tqdm
+
+from . import ResolverBase
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+FIELDS = [  # Ordered list of fields to gather
+    "query",
+    "count",
+    "as",
+    "org",
+    "isp",
+    "continent",
+    "country",
+    "regionName",
+    "city",
+    "zip",
+    "lat",
+    "lon",
+    "timezone",
+    "status",
+    "message",
+]
+
+METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+DATA_SEPARATOR_SIZE = 16
+RECORD_CACHE_SIZE = 10000  # Decoded records kept in memory per database
+
+
+class InvalidDatabaseError(ValueError):
+    """Raised when a file is not a valid MaxMind DB."""
+
+
+class MMDBReader:
+    """Read records from a MaxMind DB file.
+
+    Args:
+        db_path (str): Path to the ``.mmdb`` file.
+        cache_size (int): Number of decoded records to keep in memory.
+
+    Raises:
+        InvalidDatabaseError: If the file is not a supported MaxMind DB.
+
+    Examples:
+        >>> reader = MMDBReader('GeoLite2-City.mmdb')
+        >>> reader.get('1.1.1.1')['country']['iso_code']
+        'AU'
+    """
+
+    def __init__(self, db_path, cache_size=RECORD_CACHE_SIZE):
+        """Memory map the database and read its metadata."""
+        self.db_path = db_path
+        with open(db_path, "rb") as open_file:
+            self._buffer = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        marker = self._buffer.rfind(
+            METADATA_MARKER, max(0, len(self._buffer) - 128 * 1024)
+        )
+        if marker < 0:
+            self._buffer.close()
+            raise InvalidDatabaseError(f"{db_path} is not a MaxMind DB file")
+        self._data_start = 0
+        self.metadata, _ = self._decode(marker + len(METADATA_MARKER))
+
+        self.node_count = self.metadata["node_count"]
+        self.record_size = self.metadata["record_size"]
+        self.ip_version = self.metadata["ip_version"]
+        if self.record_size not in (24, 28, 32):
+            self._buffer.close()
+            raise InvalidDatabaseError(
+                f"Unsupported record size {self.record_size} in {db_path}"
+            )
+        self._node_size = self.record_size // 4
+        self._tree_size = self._node_size * self.node_count
+        self._data_start = self._tree_size + DATA_SEPARATOR_SIZE
+        self._records = OrderedDict()  # LRU of decoded records, by offset
+        self.cache_size = cache_size
+        self._ipv4_start = None
+
+    def close(self):
+        """Release the memory mapped database.
+
+        Returns:
+            None
+        """
+        self._buffer.close()
+
+    def get(self, ip_addr):
+        """Look up the record for an IP address.
+
+        Args:
+            ip_addr (str or IPAddress): IP address to look up.
+
+        Returns:
+            (dict): Database record, or None if the address is not present.
+        """
+        ip = ip_addr if isinstance(ip_addr, IPAddress) else IPAddress(ip_addr)
+        if ip.version == 6 and self.ip_version == 4:
+            return None
+        if ip.version == 4 and self.ip_version == 6:
+            node = self._ipv4_node()
+        else:
+            node = 0
+        bit_count = 32 if ip.version == 4 else 128
+        value = int(ip)
+
+        for bit in range(bit_count - 1, -1, -1):
+            if node >= self.node_count:
+                break
+            node = self._read_node(node, (value >> bit) & 1)
+
+        if node == self.node_count:
+            return None  # Empty
+        if node < self.node_count:
+            raise InvalidDatabaseError(f"Invalid search tree in {self.db_path}")
+        return self._record(node - self.node_count - DATA_SEPARATOR_SIZE)
+
+    def _ipv4_node(self):
+        """Find the node for the IPv4 subtree (``::/96``) of an IPv6 database."""
+        if self._ipv4_start is None:
+            node = 0
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self._read_node(node, 0)
+            self._ipv4_start = node
+        return self._ipv4_start
+
+    def _read_node(self, node, index):
+        """Read the left (0) or right (1) record of a search tree node."""
+        offset = node * self._node_size
+        buf = self._buffer
+        if self.record_size == 24:
+            offset += index * 3
+            return int.from_bytes(buf[offset : offset + 3], "big")
+        if self.record_size == 28:
+            if index:
+                return ((buf[offset + 3] & 0x0F) << 24) | int.from_bytes(
+                    buf[offset + 4 : offset + 7], "big"
+                )
+            return ((buf[offset + 3] & 0xF0) << 20) | int.from_bytes(
+                buf[offset : offset + 3], "big"
+            )
+        offset += index * 4
+        return int.from_bytes(buf[offset : offset + 4], "big")
+
+    def _record(self, data_offset):
+        """Decode, and cache, the record at an offset in the data section."""
+        record = self._records.get(data_offset)
+        if record is None:
+            record, _ = self._decode(self._data_start + data_offset)
+            self._records[data_offset] = record
+            if len(self._records) > self.cache_size:
+                self._records.popitem(last=False)
+        else:
+            self._records.move_to_end(data_offset)
+        return record
+
+    def _decode(self, offset):
+        """Decode the value at an absolute offset in the file.
+
+        Args:
+            offset (int): Position of the value's control byte.
+
+        Returns:
+            (tuple): Decoded value, and the offset following it.
+        """
+        buf = self._buffer
+        ctrl = buf[offset]
+        offset += 1
+        type_num = ctrl >> 5
+
+        if type_num == 1:  # Pointer
+            return self._decode_pointer(ctrl, offset)
+
+        if type_num == 0:  # Extended type
+            type_num = 7 + buf[offset]
+            offset += 1
+
+        size, offset = self._decode_size(ctrl, offset)
+        decoder = self.DECODERS.get(type_num)
+        if decoder is None:
+            raise InvalidDatabaseError(
+                f"Unsupported data type {type_num} in {self.db_path}"
+            )
+        return decoder(self, offset, size)
+
+    def _decode_pointer(self, ctrl, offset):
+        """Follow a pointer to a value elsewhere in the data section."""
+        buf = self._buffer
+        size = (ctrl >> 3) & 0x3
+        pointer = int.from_bytes(buf[offset : offset + size + 1], "big")
+        if size < 3:
+            pointer |= (ctrl & 0x7) << (8 * (size + 1))
+            pointer += (0, 2048, 526336)[size]
+        value, _ = self._decode(self._data_start + pointer)
+        return value, offset + size + 1
+
+    def _decode_size(self, ctrl, offset):
+        """Read the size of a value, which may extend past its control byte."""
+        size = ctrl & 0x1F
+        if size >= 29:
+            extra = size - 28
+            size = (29, 285, 65821)[extra - 1] + int.from_bytes(
+                self._buffer[offset : offset + extra], "big"
+            )
+            offset += extra
+        return size, offset
+
+    def _decode_string(self, offset, size):
+        """Decode a UTF-8 string."""
+        return self._buffer[offset : offset + size].decode("utf-8"), offset + size
+
+    def _decode_double(self, offset, size):
+        """Decode a double precision float."""
+        return struct.unpack(">d", self._buffer[offset : offset + 8])[0], offset + 8
+
+    def _decode_bytes(self, offset, size):
+        """Decode a byte string."""
+        return bytes(self._buffer[offset : offset + size]), offset + size
+
+    def _decode_uint(self, offset, size):
+        """Decode an unsigned integer of up to 128 bits."""
+        return (
+            int.from_bytes(self._buffer[offset : offset + size], "big"),
+            offset + size,
+        )
+
+    def _decode_map(self, offset, size):
+        """Decode a map of ``size`` keys and values."""
+        value = {}
+        for _ in range(size):
+            key, offset = self._decode(offset)
+            value[key], offset = self._decode(offset)
+        return value, offset
+
+    def _decode_int32(self, offset, size):
+        """Decode a signed 32 bit integer."""
+        raw = self._buffer[offset : offset + size].rjust(4, b"\x00")
+        return struct.unpack(">i", raw)[0], offset + size
+
+    def _decode_array(self, offset, size):
+        """Decode an array of ``size`` values."""
+        value = []
+        for _ in range(size):
+            item, offset = self._decode(offset)
+            value.append(item)
+        return value, offset
+
+    def _decode_boolean(self, offset, size):
+        """Decode a boolean, stored in the size."""
+        return bool(size), offset
+
+    def _decode_float(self, offset, size):
+        """Decode a single precision float."""
+        return struct.unpack(">f", self._buffer[offset : offset + 4])[0], offset + 4
+
+    # Decoders for each data type, taking the offset and size of a value
+    DECODERS = {
+        2: _decode_string,
+        3: _decode_double,
+        4: _decode_bytes,
+        5: _decode_uint,
+        6: _decode_uint,
+        7: _decode_map,
+        8: _decode_int32,
+        9: _decode_uint,
+        10: _decode_uint,
+        11: _decode_array,
+        14: _decode_boolean,
+        15: _decode_float,
+    }
+
+
+class Resolver(ResolverBase):
+    """Class to resolve IP addresses from local MaxMind DB files.
+
+    Args:
+        db_paths (str or list): Path(s) to ``.mmdb`` files, as a list or a
+            comma separated string.
+        fields (list): Collection of fields to include in results.
+        lang (str): Language for place names.
+
+    Raises:
+        ValueError: If no database paths are provided.
+    """
+
+    cacheable = False  # Local lookups are faster than the resolution cache
+    stream_size = 1000
+
+    def __init__(self, db_paths, fields=None, lang="en"):
+        """Open the databases and configure default values."""
+        super().__init__()
+        self.supported_langs = ["en", "de", "es", "pt-BR", "fr", "ja", "zh-CN", "ru"]
+
+        self.lang = "en" if lang not in self.supported_langs else lang
+        self.fields = FIELDS if not fields else fields
+        if isinstance(db_paths, str):
+            db_paths = db_paths.split(",")
+        db_paths = [x.strip() for x in db_paths or [] if x and x.strip()]
+        if not db_paths:
+            raise ValueError("At least one MaxMind DB path is required")
+        self.readers = [MMDBReader(x) for x in db_paths]
+
+    def close(self):
+        """Close the databases.
+
+        Returns:
+            None
+        """
+        for reader in self.readers:
+            reader.close()
+        super().close()
+
+    def batch(self):
+        """Resolve multiple IP addresses.
+
+        Returns:
+            (list): List of resolved IP address records with specified fields.
+        """
+        ips = self.data
+        if self.pbar:
+            ips = tqdm(ips, desc="Resolving IPs", unit_scale=True)
+        return [self.lookup(ip) for ip in ips]
+
+    def single(self, ip=None):
+        """Resolve a single IP address.
+
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
+
+        Returns:
+            (list): List containing the resolved record.
+        """
+        return [self.lookup(self.data if ip is None else ip)]
+
+    def lookup(self, ip):
+        """Look up an IP address in each database, mapping the results.
+
+        Args:
+            ip (str): IP address to resolve.
+
+        Returns:
+            (dict): Record with the requested fields.
+        """
+        mapped = {}
+        try:
+            ip_addr = IPAddress(ip)
+        except (AddrFormatError, ValueError):
+            return self.format_record(ip, mapped, "Invalid IP address")
+
+        for reader in self.readers:
+            record = reader.get(ip_addr)
+            if record:
+                for key, value in self.map_record(record).items():
+                    mapped.setdefault(key, value)
+        return self.format_record(ip, mapped, None if mapped else "No record found")
+
+    def format_record(self, ip, mapped, message):
+        """Arrange mapped values in to a record with the requested fields.
+
+        Args:
+            ip (str): Queried IP address.
+            mapped (dict): Values mapped from the databases.
+            message (str): Failure description, or None if found.
+
+        Returns:
+            (dict): Record with the requested fields.
+        """
+        mapped.update(
+            {
+                "query": ip,
+                "status": "fail" if message else "success",
+                "message": message,
+            }
+        )
+        return {field: mapped.get(field) for field in self.fields}
+
+    def map_record(self, record):
+        """Map a MaxMind DB record on to ip-api style field names.
+
+        Args:
+            record (dict): Record from a City, Country, ASN, or ISP database.
+
+        Returns:
+            (dict): Mapped values, omitting those not in the record.
+        """
+
+        def name(section):
+            """Get the localized name of a place."""
+            names = (section or {}).get("names", {})
+            return names.get(self.lang) or names.get("en")
+
+        location = record.get("location", {})
+        subdivisions = record.get("subdivisions") or [{}]
+        asn = record.get("autonomous_system_number")
+        as_org = record.get("autonomous_system_organization")
+        mapped = {
+            "continent": name(record.get("continent")),
+            "continentCode": record.get("continent", {}).get("code"),
+            "country": name(record.get("country")),
+            "countryCode": record.get("country", {}).get("iso_code"),
+            "region": subdivisions[0].get("iso_code"),
+            "regionName": name(subdivisions[0]),
+            "city": name(record.get("city")),
+            "zip": record.get("postal", {}).get("code"),
+            "lat": location.get("latitude"),
+            "lon": location.get("longitude"),
+            "timezone": location.get("time_zone"),
+            "as": f"AS{asn} {as_org or ''}".strip() if asn else None,
+            "asname": as_org,
+            "isp": record.get("isp") or as_org,
+            "org": record.get("organization") or as_org,
+            "proxy": record.get("traits", {}).get("is_anonymous_proxy"),
+        }
+        return {k: v for k, v in mapped.items() if v is not None}
@@ -0,0 +1,265 @@
+"""
+Prefix Resolver
+===============
+
+Composite resolver querying one IP address per network prefix.
+
+Geolocation and network ownership rarely differ between addresses within the
+same /24 IPv4 network, or the same /48 IPv6 network. ``PrefixResolver`` groups
+IP addresses by prefix, resolves the first address of each group with another
+resolver, and copies the result to the other addresses in the group. This
+greatly reduces the requests needed for data sets with many addresses from
+few networks, such as logs of scanning activity.
+
+Copied records have an ``inferred_from`` field holding the IP address that
+was resolved. This field is None for IP addresses resolved directly.
+
+Only fields describing the network, such as the location and ASN, are copied.
+Fields describing the resolved IP address itself, such as its hostname, the
+URLs hosted on it, and the samples seen communicating with it, are set to None
+in copied records.
+
+Configuration
+^^^^^^^^^^^^^
+
+Enable with ``--resolve-granularity 24``, or ``--resolve-granularity 24,64``
+to also set the IPv6 prefix length, which defaults to 48.
+
+Module Documentation
+--------------------
+
+"""
+import logging
+
+from netaddr import AddrFormatError, IPAddress
+
+from . import CompositeResolver
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+INFERRED_FIELD = "inferred_from"
+DEFAULT_IPV6_PREFIX = 48
+PER_IP_FIELDS = (  # Fields describing an IP address rather than its network
+    "reverse",
+    "proxy",
+    "mobile",
+    "hosting",
+    "resolutions",
+    "resolution_count",
+    "detected_urls",
+    "detected_url_count",
+    "undetected_urls",
+    "undetected_url_count",
+    "detected_samples",
+    "detected_sample_count",
+    "undetected_samples",
+    "undetected_sample_count",
+    "raw",
+)
+
+
+def parse_granularity(value):
+    """Parse prefix lengths to group IP addresses by.
+
+    Args:
+        value (str): IPv4 prefix length, optionally followed by a comma and
+            the IPv6 prefix length, such as ``24`` or ``24,64``.
+
+    Returns:
+        (tuple): IPv4 and IPv6 prefix lengths.
+
+    Raises:
+        ValueError: If the prefix lengths are not valid.
+    """
+    parts = [x.strip() for x in str(value).split(",")]
+    if len(parts) > 2 or not all(x.isdigit() for x in parts):
+        raise ValueError(f"Invalid prefix lengths: {value}")
+    ipv4_prefix = int(parts[0])
+    ipv6_prefix = int(parts[1]) if len(parts) > 1 else DEFAULT_IPV6_PREFIX
+    if ipv4_prefix > 32 or ipv6_prefix > 128:
+        raise ValueError(f"Invalid prefix lengths: {value}")
+    return ipv4_prefix, ipv6_prefix
+
+
+def is_per_ip(field):
+    """Determine whether a field describes an IP address rather than its network.
+
+    Fields prefixed with the name of a resolver, as in merged records, are
+    identified by the name following the prefix.
+
+    Args:
+        field (str): Field name, such as ``reverse`` or ``virustotal.reverse``.
+
+    Returns:
+        (bool): True if the field is not shared across a network prefix.
+    """
+    return str(field).rsplit(".", 1)[-1] in PER_IP_FIELDS
+
+
+class PrefixResolver(CompositeResolver):
+    """Class to resolve one IP address per prefix, sharing the result.
+
+    Args:
+        resolver (ResolverBase): Configured resolver to query.
+        ipv4_prefix (int): Prefix length to group IPv4 addresses by.
+        ipv6_prefix (int): Prefix length to group IPv6 addresses by.
+
+    Examples:
+        >>> resolver = PrefixResolver(ipapi.Resolver(), ipv4_prefix=24)
+        >>> resolver.query(['1.1.1.1', '1.1.1.2'])  # Only queries 1.1.1.1
+        [{'query': '1.1.1.1', ..., 'inferred_from': None},
+         {'query': '1.1.1.2', ..., 'inferred_from': '1.1.1.1'}]
+    """
+
+    def __init__(self, resolver, ipv4_prefix=24, ipv6_prefix=DEFAULT_IPV6_PREFIX):
+        """Configure the wrapped resolver and prefix lengths."""
+        super().__init__([resolver])
+        self.resolver = resolver
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.fields = resolver.default_fields()
+        if INFERRED_FIELD not in self.fields:
+            self.fields.append(INFERRED_FIELD)
+
+    def query(self, data, force_single=False):
+        """Resolve the first IP of each prefix, copying results to the others.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+
+        Returns:
+            (list) List of records, in the order of ``data``.
+        """
+        groups = self.group(data)
+        representatives = list(dict.fromkeys(groups.values()))
+        records = self.resolver.query(representatives, force_single=force_single)
+        return self.fan_out(groups, representatives, records)
+
+    def iquery(self, data, force_single=False):
+        """Streaming counterpart to ``self.query()``.
+
+        Records are yielded as the wrapped resolver streams them, with the
+        records of each prefix following one another, rather than in the
+        order of ``data``.
+
+        Records are matched to their prefix by the ``query`` field. Records
+        without it are yielded as streamed, without copies for the other IP
+        addresses in the prefix.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+
+        Yields:
+            (dict): Records for every IP address in the prefix of each
+                resolved IP address.
+        """
+        members = {}
+        for ip, representative in self.group(data).items():
+            members.setdefault(representative, []).append(ip)
+        representatives = list(members)
+
+        records = self.resolver.iquery(representatives, force_single=force_single)
+        for record in records:
+            representative = str(record.get("query", ""))
+            if representative not in members:
+                yield {**record, INFERRED_FIELD: None}
+                continue
+            groups = {ip: representative for ip in members[representative]}
+            yield from self.fan_out(groups, [representative], [record])
+
+    async def aquery(self, data, force_single=False, timeout=None):
+        """Asynchronous counterpart to ``self.query()``.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+            timeout (float): Seconds to wait for resolution to complete before
+                raising ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            (list) List of records, in the order of ``data``.
+        """
+        groups = self.group(data)
+        representatives = list(dict.fromkeys(groups.values()))
+        records = await self.resolver.aquery(
+            representatives, force_single=force_single, timeout=timeout
+        )
+        return self.fan_out(groups, representatives, records)
+
+    def prefix(self, ip):
+        """Identify the network prefix of an IP address.
+
+        Args:
+            ip (str): IP address.
+
+        Returns:
+            (tuple): IP version and network address, or the IP address itself
+                if it cannot be parsed.
+        """
+        try:
+            ip_addr = IPAddress(ip)
+        except (AddrFormatError, ValueError, TypeError):
+            return ip
+        bits, prefix = (32, self.ipv4_prefix)
+        if ip_addr.version == 6:
+            bits, prefix = (128, self.ipv6_prefix)
+        mask = ((1 << prefix) - 1) << (bits - prefix)
+        return ip_addr.version, int(ip_addr) & mask
+
+    def group(self, data):
+        """Group IP addresses by prefix.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs.
+
+        Returns:
+            (dict): Each IP address, in the order of ``data``, mapped to the
+                first IP address within its prefix.
+        """
+        ips = [data] if isinstance(data, str) else [str(x) for x in data]
+        representatives = {}
+        groups = {ip: representatives.setdefault(self.prefix(ip), ip) for ip in ips}
+        logger.debug(
+            "Resolving %s prefixes for %s IP addresses", len(representatives), len(ips)
+        )
+        return groups
+
+    @classmethod
+    def fan_out(cls, groups, representatives, records):
+        """Copy the record of each resolved IP address to its group.
+
+        Args:
+            groups (dict): Groups from ``self.group()``.
+            representatives (list): IP addresses resolved, one per group.
+            records (list): Records for ``representatives``.
+
+        Returns:
+            (list): Records for every IP address. Copied records have the
+                ``inferred_from`` field set, and fields from ``PER_IP_FIELDS``
+                set to None.
+        """
+        by_ip = cls.match(representatives, records)
+        results = []
+        for ip, representative in groups.items():
+            record = by_ip.get(representative)
+            if record is None:
+                continue
+            if ip == representative:
+                results.append({**record, INFERRED_FIELD: None})
+                continue
+            inferred = {k: None if is_per_ip(k) else v for k, v in record.items()}
+            inferred[INFERRED_FIELD] = representative
+            if "query" in record:
+                inferred["query"] = ip
+            results.append(inferred)
+        return results
@@ -0,0 +1,691 @@
+"""
+Range Table Resolver
+====================
+
+Offline resolver reading sorted IP range tables, such as the ip2asn and
+IP2Location LITE datasets.
+
+These datasets list the first and last address of each range along with the
+values assigned to it. The table is loaded once in to NumPy arrays and each
+batch of IP addresses is resolved with a single vectorized binary search,
+making this the fastest resolver for large batches. Records are mapped on to
+the field names used by the ip-api resolver, allowing the output formats to
+remain consistent between resolvers.
+
+Data Source Information
+-----------------------
+
+Datasets must be downloaded separately and are subject to the terms of their
+providers. In no way is inclusion of a data source format in libchickadee an
+endorsement of the data source.
+
+Supported formats:
+
+* ip2asn (https://iptoasn.com/) - Tab separated ``range_start``,
+  ``range_end``, ``AS_number``, ``country_code``, and ``AS_description``
+  columns, with dotted IPv4 or IPv6 addresses. The ``v4``, ``v6``, and
+  ``combined`` files are supported, compressed or not.
+* IP2Location LITE (https://lite.ip2location.com/) - Comma separated
+  ``ip_from`` and ``ip_to`` integers, followed by the country code, country,
+  region, city, latitude, longitude, zip code, and time zone columns present
+  in the chosen database (DB1 through DB11). IPv6 editions are supported.
+
+Configuration
+^^^^^^^^^^^^^
+
+Requires NumPy, which may be installed with ``pip install chickadee[range-table]``
+or ``pip install numpy``.
+
+Select the resolver with ``-r range_table`` and set the ``range_table`` option
+in the ``[resolvers]`` section of the configuration file to the path of the
+dataset. Several datasets, such as ip2asn and an IP2Location database, may be
+provided as a comma separated list. Fields are taken from the first dataset
+providing them.
+
+Fields
+^^^^^^
+
+These fields are in no particular order. Availability depends on the
+dataset used.
+
+* query
+* count
+* status
+* message
+* country
+* countryCode
+* regionName
+* city
+* zip
+* lat
+* lon
+* timezone
+* isp
+* org
+* as
+* asname
+
+Implementation
+^^^^^^^^^^^^^^
+
+IPv4 ranges are held as 32 bit integers and IPv6 ranges as 16 byte big endian
+strings, each sorted by the first address of the range. Text columns are
+stored once per distinct value with an integer code for each range.
+
+Parsing a large dataset takes several seconds, so the loaded arrays are saved
+to a ``.npz`` file within ``range_tables`` in the cache directory, and reused
+while the size and modification time of the dataset are unchanged.
+
+Module Documentation
+--------------------
+
+"""
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import logging
+import os
+import socket
+
+from . import ResolverBase
+from .cache import default_cache_dir
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+FIELDS = [  # Ordered list of fields to gather
+    "query",
+    "count",
+    "as",
+    "org",
+    "isp",
+    "country",
+    "countryCode",
+    "regionName",
+    "city",
+    "zip",
+    "lat",
+    "lon",
+    "timezone",
+    "status",
+    "message",
+]
+
+IP2ASN_COLUMNS = ["asn", "countryCode", "asname"]
+IP2LOCATION_COLUMNS = [
+    "countryCode",
+    "country",
+    "regionName",
+    "city",
+    "lat",
+    "lon",
+    "zip",
+    "timezone",
+]
+CACHE_VERSION = 1  # Increment when the layout of cached tables changes
+
+
+class InvalidTableError(ValueError):
+    """Raised when a file is not a supported range table."""
+
+
+def default_table_cache_dir():
+    """Directory holding the binary cache of loaded range tables.
+
+    Returns:
+        (str): ``range_tables`` within ``default_cache_dir()``.
+    """
+    return os.path.join(default_cache_dir(), "range_tables")
+
+
+def _require_numpy():
+    """Raise a helpful error if NumPy is not installed."""
+    if np is None:
+        raise ImportError(
+            "The range_table resolver requires NumPy. Install it with "
+            "`pip install chickadee[range-table]` or `pip install numpy`."
+        )
+
+
+def _open_text(path):
+    """Open a dataset for reading, decompressing if gzipped."""
+    with open(path, "rb") as open_file:
+        gzipped = open_file.read(2) == b"\x1f\x8b"
+    if gzipped:
+        return io.TextIOWrapper(gzip.open(path), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def _parse_address(value):
+    """Convert a range boundary in to an address family and integer.
+
+    Args:
+        value (str): Dotted IPv4, IPv6, or integer address.
+
+    Returns:
+        (tuple): IP version and integer value of the address. IPv4-mapped
+            IPv6 addresses are returned as IPv4.
+    """
+    if value.isdigit():
+        number = int(value)
+    elif ":" in value:
+        number = int.from_bytes(socket.inet_pton(socket.AF_INET6, value), "big")
+    else:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+    if number < 2**32:
+        return 4, number
+    if number >> 32 == 0xFFFF:
+        return 4, number & 0xFFFFFFFF
+    return 6, number
+
+
+def _table_columns(row, delimiter):
+    """Identify the value columns of a dataset from its first row.
+
+    Args:
+        row (list): First row of the dataset.
+        delimiter (str): Delimiter of the dataset.
+
+    Returns:
+        (list): Names of the value columns.
+
+    Raises:
+        InvalidTableError: If the format is not recognized.
+    """
+    if len(row) < 3:
+        raise InvalidTableError("Unable to identify the range table format")
+    if delimiter == "\t":
+        return IP2ASN_COLUMNS
+    return IP2LOCATION_COLUMNS[: len(row) - 2]
+
+
+def _parse_range(row, columns):
+    """Parse the boundaries of a range from a row of a dataset.
+
+    Args:
+        row (list): Row of the dataset.
+        columns (list): Names of the value columns.
+
+    Returns:
+        (tuple): IP version, first and last address of the range, or None if
+            the row is incomplete or has no data for the range.
+
+    Raises:
+        InvalidTableError: If the range boundaries are not IP addresses.
+    """
+    if len(row) < 2 + len(columns):
+        return None
+    try:
+        version, start = _parse_address(row[0])
+        end_version, end = _parse_address(row[1])
+    except (OSError, ValueError):
+        raise InvalidTableError(f"Invalid IP range: {row[0]} - {row[1]}")
+    if row[2] in ("0", "-"):  # Not routed, or no data for the range
+        return None
+    if end_version != version:  # Range spanning in to IPv6 space
+        end = 0xFFFFFFFF
+    return version, start, end
+
+
+def _read_ranges(open_file):
+    """Read the ranges of a dataset and the values assigned to them.
+
+    Args:
+        open_file (file): Text file object of the dataset.
+
+    Returns:
+        (tuple): Names of the value columns, the ranges of each IP version as
+            ``(start, end, value index)`` tuples, and the values of each range.
+
+    Raises:
+        InvalidTableError: If the file is not a supported format.
+    """
+    first_line = open_file.readline()
+    delimiter = "\t" if "\t" in first_line else ","
+    columns = None
+    ranges = {4: [], 6: []}
+    values = []
+    for row in csv.reader(
+        itertools.chain([first_line], open_file), delimiter=delimiter
+    ):
+        if not row:
+            continue
+        if columns is None:
+            columns = _table_columns(row, delimiter)
+        parsed = _parse_range(row, columns)
+        if parsed is None:
+            continue
+        version, start, end = parsed
+        ranges[version].append((start, end, len(values)))
+        values.append(row[2 : 2 + len(columns)])
+    if columns is None:
+        raise InvalidTableError("Range table is empty")
+    return columns, ranges, values
+
+
+def _range_arrays(version, dtype, ranges):
+    """Sort the ranges of an IP version in to search arrays.
+
+    Args:
+        version (int): IP version of the ranges.
+        dtype: NumPy type of the range boundaries.
+        ranges (list): ``(start, end, value index)`` tuples.
+
+    Returns:
+        (dict): Arrays of the first and last address, and value index, of
+            each range, sorted by first address.
+    """
+    ranges = sorted(ranges)
+    if version == 4:
+        starts = [x[0] for x in ranges]
+        ends = [x[1] for x in ranges]
+    else:
+        starts = [x[0].to_bytes(16, "big") for x in ranges]
+        ends = [x[1].to_bytes(16, "big") for x in ranges]
+    return {
+        f"starts{version}": np.array(starts, dtype=dtype),
+        f"ends{version}": np.array(ends, dtype=dtype),
+        f"rows{version}": np.array([x[2] for x in ranges], dtype=np.int64),
+    }
+
+
+class RangeTable:
+    """Sorted IP ranges and their values, held in NumPy arrays.
+
+    Use ``RangeTable.load()`` to read a dataset.
+
+    Args:
+        arrays (dict): Arrays making up the table, as produced by
+            ``RangeTable.parse()``.
+        columns (list): Names of the value columns.
+
+    Examples:
+        >>> table = RangeTable.load('ip2asn-combined.tsv.gz')
+        >>> table.lookup(['1.1.1.1', '10.0.0.1'])
+        [{'asn': '13335', 'countryCode': 'US', 'asname': 'CLOUDFLARENET'}, None]
+    """
+
+    def __init__(self, arrays, columns):
+        """Hold the loaded arrays."""
+        self.arrays = arrays
+        self.columns = list(columns)
+
+    @classmethod
+    def load(cls, path, cache_dir=None):
+        """Load a dataset, using the binary cache if it is current.
+
+        Args:
+            path (str): Path to the dataset.
+            cache_dir (str): Directory of the binary cache. Defaults to
+                ``default_table_cache_dir()``. Set to ``False`` to disable.
+
+        Returns:
+            (RangeTable): Loaded table.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+            InvalidTableError: If the file is not a supported format.
+        """
+        _require_numpy()
+        stat = os.stat(path)
+        source = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        cache_path = None
+        if cache_dir is not False:
+            cache_dir = cache_dir or default_table_cache_dir()
+            digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+            name = os.path.basename(path).split(".")[0]
+            cache_path = os.path.join(cache_dir, f"{name}-{digest}.npz")
+            table = cls.from_cache(cache_path, source)
+            if table is not None:
+                return table
+
+        with _open_text(path) as open_file:
+            table = cls.parse(open_file)
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                table.save(cache_path, source)
+            except OSError as err:
+                logger.warning("Unable to cache range table %s: %s", path, err)
+        return table
+
+    @classmethod
+    def from_cache(cls, cache_path, source):
+        """Read a table saved by ``self.save()``.
+
+        Args:
+            cache_path (str): Path to the ``.npz`` file.
+            source (str): Identifier of the dataset, which must match the
+                identifier stored with the table.
+
+        Returns:
+            (RangeTable): Loaded table, or None if the cache is missing,
+                stale, or unreadable.
+        """
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path, allow_pickle=False) as stored:
+                arrays = {k: stored[k] for k in stored.files}
+        except (OSError, ValueError) as err:
+            logger.debug(
+                "Ignoring unreadable range table cache %s: %s", cache_path, err
+            )
+            return None
+        meta = arrays.pop("_meta", None)
+        if meta is None or list(meta[:2]) != [str(CACHE_VERSION), source]:
+            return None
+        return cls(arrays, meta[2:])
+
+    def save(self, cache_path, source):
+        """Write the table to a ``.npz`` file for fast loading.
+
+        Args:
+            cache_path (str): Path to write to.
+            source (str): Identifier of the dataset, such as its path, size,
+                and modification time.
+
+        Returns:
+            None
+        """
+        meta = np.array([str(CACHE_VERSION), source, *self.columns])
+        partial_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(partial_path, "wb") as open_file:
+            np.savez(open_file, _meta=meta, **self.arrays)
+        os.replace(partial_path, cache_path)
+
+    @classmethod
+    def parse(cls, open_file):
+        """Parse a dataset in to a table.
+
+        Rows without data, such as the "Not routed" ranges of ip2asn or the
+        ``-`` country of IP2Location, are skipped.
+
+        Args:
+            open_file (file): Text file object of the dataset.
+
+        Returns:
+            (RangeTable): Parsed table.
+
+        Raises:
+            InvalidTableError: If the file is not a supported format.
+        """
+        _require_numpy()
+        columns, ranges, values = _read_ranges(open_file)
+        arrays = {}
+        for version, dtype in ((4, np.uint32), (6, "S16")):
+            arrays.update(_range_arrays(version, dtype, ranges[version]))
+        for index, column in enumerate(columns):
+            labels, codes = np.unique(
+                np.array([row[index] for row in values], dtype=str),
+                return_inverse=True,
+            )
+            arrays[f"labels_{column}"] = labels
+            arrays[f"codes_{column}"] = codes.astype(np.int32).ravel()
+        return cls(arrays, columns)
+
+    def __len__(self):
+        """Number of ranges in the table."""
+        return len(self.arrays["starts4"]) + len(self.arrays["starts6"])
+
+    def search(self, version, keys):
+        """Find the rows containing each address, in one vectorized search.
+
+        Args:
+            version (int): IP version of the addresses.
+            keys (numpy.ndarray): Addresses as ``uint32`` for IPv4 or 16 byte
+                big endian strings for IPv6.
+
+        Returns:
+            (numpy.ndarray): Row of each address, or -1 if not in a range.
+        """
+        starts = self.arrays[f"starts{version}"]
+        if not len(starts) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        index = np.searchsorted(starts, keys, side="right") - 1
+        clipped = np.maximum(index, 0)
+        found = (index >= 0) & (keys <= self.arrays[f"ends{version}"][clipped])
+        return np.where(found, self.arrays[f"rows{version}"][clipped], -1)
+
+    def lookup(self, ips):
+        """Look up a batch of IP addresses.
+
+        Args:
+            ips (list): IP addresses to look up.
+
+        Returns:
+            (list): Dictionary of column values for each IP address, or None
+                if it is not within a range. Invalid addresses are also None.
+        """
+        ips = list(ips)
+        return self.values(self.rows(parse_keys(ips), len(ips)))
+
+    def rows(self, keys, count):
+        """Find the row containing each IP address.
+
+        Args:
+            keys (tuple): Search keys, as returned by ``parse_keys()``.
+            count (int): Number of IP addresses the keys were parsed from.
+
+        Returns:
+            (numpy.ndarray): Row of each address, or -1 if not in a range or
+                invalid.
+        """
+        keys4, index4, keys6, index6 = keys
+        rows = np.full(count, -1, dtype=np.int64)
+        rows[index4] = self.search(4, keys4)
+        rows[index6] = self.search(6, keys6)
+        return rows
+
+    def values(self, rows):
+        """Decode the column values of rows.
+
+        Args:
+            rows (numpy.ndarray): Rows, as returned by ``self.rows()``.
+
+        Returns:
+            (list): Dictionary of column values for each row, or None for -1.
+        """
+        found = rows >= 0
+        if not found.any():
+            return [None] * len(rows)
+        matched = rows[found]
+        decoded = [
+            self.arrays[f"labels_{column}"][
+                self.arrays[f"codes_{column}"][matched]
+            ].tolist()
+            for column in self.columns
+        ]
+        records = iter(dict(zip(self.columns, x)) for x in zip(*decoded))
+        return [next(records) if x else None for x in found.tolist()]
+
+
+def parse_keys(ips):
+    """Convert IP addresses in to search keys for ``RangeTable.search()``.
+
+    Args:
+        ips (list): IP addresses to convert.
+
+    Returns:
+        (tuple): Arrays of IPv4 integers and their positions within ``ips``,
+            followed by IPv6 16 byte strings and their positions. Invalid
+            addresses are omitted.
+    """
+    packed4, index4, packed6, index6 = [], [], [], []
+    inet_pton = socket.inet_pton
+    mapped_prefix = b"\x00" * 10 + b"\xff\xff"
+    for i, ip in enumerate(ips):
+        ip = str(ip)
+        try:
+            if ":" not in ip:
+                packed4.append(inet_pton(socket.AF_INET, ip))
+                index4.append(i)
+                continue
+            packed = inet_pton(socket.AF_INET6, ip)
+        except (OSError, ValueError):
+            continue
+        if packed[:12] == mapped_prefix:
+            packed4.append(packed[12:])
+            index4.append(i)
+        else:
+            packed6.append(packed)
+            index6.append(i)
+    return (
+        np.frombuffer(b"".join(packed4), dtype=">u4").astype(np.uint32),
+        np.array(index4, dtype=np.int64),
+        np.frombuffer(b"".join(packed6), dtype="S16"),
+        np.array(index6, dtype=np.int64),
+    )
+
+
+class Resolver(ResolverBase):
+    """Class to resolve IP addresses from local range tables.
+
+    Args:
+        table_paths (str or list): Path(s) to range table datasets, as a list
+            or a comma separated string.
+        fields (list): Collection of fields to include in results.
+        lang (str): Language for results. Only English is supported.
+        cache_dir (str): Directory of the binary table cache. Defaults to
+            ``default_table_cache_dir()``. Set to ``False`` to disable.
+
+    Raises:
+        ValueError: If no dataset paths are provided.
+        ImportError: If NumPy is not installed.
+    """
+
+    cacheable = False  # Local lookups are faster than the resolution cache
+    stream_size = 50000  # Large chunks keep the vectorized lookups efficient
+
+    def __init__(self, table_paths, fields=None, lang="en", cache_dir=None):
+        """Load the tables and configure default values."""
+        super().__init__()
+        self.supported_langs = ["en"]
+
+        self.lang = "en"
+        self.fields = FIELDS if not fields else fields
+        if isinstance(table_paths, str):
+            table_paths = table_paths.split(",")
+        table_paths = [x.strip() for x in table_paths or [] if x and x.strip()]
+        if not table_paths:
+            raise ValueError("At least one range table path is required")
+        self.tables = [RangeTable.load(x, cache_dir) for x in table_paths]
+
+    def batch(self):
+        """Resolve multiple IP addresses.
+
+        Returns:
+            (list): List of resolved IP address records with specified fields.
+        """
+        return self.lookup(self.data)
+
+    def single(self, ip=None):
+        """Resolve a single IP address.
+
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
+
+        Returns:
+            (list): List containing the resolved record.
+        """
+        return self.lookup([self.data if ip is None else ip])
+
+    def lookup(self, ips):
+        """Look up IP addresses in each table, mapping the results.
+
+        Args:
+            ips (list): IP addresses to resolve.
+
+        Returns:
+            (list): Records with the requested fields, in the order of ``ips``.
+        """
+        ips = list(ips)
+        keys = parse_keys(ips)
+        # Column per table of the row matched, with -2 marking invalid addresses
+        matches = np.full((len(ips), len(self.tables)), -2, dtype=np.int64)
+        valid = np.concatenate([keys[1], keys[3]])
+        for column, table in enumerate(self.tables):
+            matches[valid, column] = table.rows(keys, len(ips))[valid]
+
+        # Many addresses share a range, so only map each combination once
+        if len(self.tables) == 1:
+            combinations, inverse = np.unique(matches[:, 0], return_inverse=True)
+            combinations = combinations[:, np.newaxis]
+        else:
+            combinations, inverse = np.unique(matches, axis=0, return_inverse=True)
+        templates = []
+        decoded = [
+            table.values(combinations[:, column])
+            for column, table in enumerate(self.tables)
+        ]
+        for combination, values in zip(combinations.tolist(), zip(*decoded)):
+            mapped = {}
+            for table_values in values:
+                for key, value in self.map_record(table_values or {}).items():
+                    mapped.setdefault(key, value)
+            message = None
+            if combination[0] == -2:
+                message = "Invalid IP address"
+            elif not mapped:
+                message = "No record found"
+            templates.append(self.format_record(None, mapped, message))
+
+        if "query" not in self.fields:
+            return [dict(templates[x]) for x in inverse.ravel().tolist()]
+        return [
+            {**templates[x], "query": ip}
+            for ip, x in zip(ips, inverse.ravel().tolist())
+        ]
+
+    def format_record(self, ip, mapped, message):
+        """Arrange mapped values in to a record with the requested fields.
+
+        Args:
+            ip (str): Queried IP address.
+            mapped (dict): Values mapped from the tables.
+            message (str): Failure description, or None if found.
+
+        Returns:
+            (dict): Record with the requested fields.
+        """
+        mapped.update(
+            {
+                "query": ip,
+                "status": "fail" if message else "success",
+                "message": message,
+            }
+        )
+        return {field: mapped.get(field) for field in self.fields}
+
+    @staticmethod
+    def map_record(values):
+        """Map range table columns on to ip-api style field names.
+
+        Args:
+            values (dict): Column values from ``RangeTable.lookup()``.
+
+        Returns:
+            (dict): Mapped values, omitting those not in the table.
+        """
+        mapped = {k: v for k, v in values.items() if v not in ("", "-", None)}
+        asn = mapped.pop("asn", None)
+        if "asname" in mapped:
+            mapped.setdefault("org", mapped["asname"])
+            mapped.setdefault("isp", mapped["asname"])
+        if asn:
+            mapped["as"] = f"AS{asn} {mapped.get('asname', '')}".strip()
+        for key in ("lat", "lon"):
+            if key in mapped:
+                mapped[key] = float(mapped[key])
+        return mapped
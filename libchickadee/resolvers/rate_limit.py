@@ -0,0 +1,329 @@
+"""
+Rate Limiting
+=============
+
+Pace requests to third-party data sources that enforce a request quota.
+
+``RateLimiter`` is a token bucket holding the number of requests remaining in
+the data source's current quota window. Each request takes a token before it
+is sent, and once the bucket is empty the limiter waits for the window to
+reset, rather than sending a request that will be rejected. When the data
+source reports its own view of the quota (for example, ip-api's ``X-Rl`` and
+``X-Ttl`` headers) the limiter is synchronised with it.
+
+A limiter is safe to share between threads, and between resolvers using the
+same quota. ``SharedRateLimiter`` extends this to separate processes on the
+same host, such as concurrent analysts or scheduled jobs using the same API
+key, by keeping the bucket in a file locked for each update. State files are
+stored in ``rate_limits`` within the cache directory by default, named for
+the quota they track.
+
+Module Documentation
+--------------------
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .cache import default_cache_dir
+
+if os.name == "nt":  # pragma: no cover
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class RateLimiter:
+    """Token bucket pacing requests to a fixed window quota.
+
+    Args:
+        limit (int): Number of requests allowed per window.
+        period (float): Length of the quota window, in seconds.
+        buffer (float): Seconds to add to reported reset times, allowing for
+            clock differences with the data source.
+
+    Examples:
+        >>> limiter = RateLimiter(15, 60)
+        >>> limiter.acquire()  # Returns immediately for the first 15 requests
+        0.0
+        >>> limiter.update(remaining=0, reset=30)  # Quota exhausted early
+        >>> limiter.acquire()  # Sleeps until the window resets
+        31.0
+    """
+
+    def __init__(self, limit, period, buffer=1.0):
+        """Start with a full window of requests."""
+        self.limit = limit
+        self.period = period
+        self.buffer = buffer
+        self.tokens = limit
+        self.reset_at = time.time() + period
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Hold exclusive access to the bucket while it is read or modified."""
+        with self._lock:
+            yield
+
+    def _reserve(self, now):
+        """Take a token if one is available to use now.
+
+        Args:
+            now (float): Current time, in seconds since the epoch.
+
+        Returns:
+            (float): Seconds to wait before trying again, or 0 if a token was
+                taken.
+        """
+        if now >= self.reset_at:
+            # New window, with a full quota
+            self.tokens = self.limit
+            self.reset_at = now + self.period
+        if self.tokens < 1:
+            return self.reset_at - now
+        self.tokens -= 1
+        return 0
+
+    def try_acquire(self):
+        """Take a token if one is available, without waiting.
+
+        Returns:
+            (float): Seconds until a token may be available, or 0 if a token
+                was taken.
+        """
+        with self._state():
+            return max(0, self._reserve(time.time()))
+
+    def acquire(self):
+        """Wait until a request may be sent within the quota.
+
+        Returns:
+            (float): Number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            if wait > 1:
+                logger.info(f"Sleeping for {wait:.2f} seconds due to rate limiting.")
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, remaining, reset):
+        """Synchronise the limiter with the quota reported by the data source.
+
+        Args:
+            remaining (int): Requests remaining in the current window.
+            reset (float): Seconds until the current window resets.
+
+        Returns:
+            None
+        """
+        with self._state():
+            now = time.time()
+            self.tokens = max(0, remaining)
+            self.reset_at = now + reset + (self.buffer if remaining < 1 else 0)
+
+
+def default_state_dir():
+    """Directory holding rate limit and quota state shared between processes.
+
+    Returns:
+        (str): ``rate_limits`` within ``default_cache_dir()``.
+    """
+    return os.path.join(default_cache_dir(), "rate_limits")
+
+
+def quota_name(*parts):
+    """Build a file name safe identifier for a quota.
+
+    Secrets, such as API keys, should be included as parts rather than in
+    the prefix as they are hashed rather than stored.
+
+    Args:
+        *parts (str): Values identifying the quota. The first is kept as a
+            readable prefix.
+
+    Returns:
+        (str): Identifier for use with ``SharedRateLimiter``.
+    """
+    prefix, *rest = parts
+    if not rest:
+        return prefix
+    digest = hashlib.sha256("\0".join(rest).encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}-{digest}"
+
+
+@contextmanager
+def locked_state(state_path):
+    """Hold an exclusive lock on a JSON state file while it is modified.
+
+    The state is read when the lock is taken, and written back when the
+    context exits without error. Other processes using the same file wait for
+    the lock to be released.
+
+    Args:
+        state_path (str): Path to the state file. Created if missing.
+
+    Yields:
+        (dict): Stored state, or an empty dictionary if missing or unreadable.
+    """
+    fd = os.open(state_path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as state_file:
+        _lock_file(state_file)
+        try:
+            try:
+                state = json.loads(state_file.read())
+            except ValueError:
+                state = {}
+            if not isinstance(state, dict):
+                state = {}
+            yield state
+            state_file.seek(0)
+            state_file.truncate()
+            json.dump(state, state_file)
+            state_file.flush()
+        finally:
+            _unlock_file(state_file)
+
+
+def _lock_file(open_file):
+    """Block until an exclusive lock on the file is held."""
+    if os.name == "nt":  # pragma: no cover
+        open_file.seek(0)
+        msvcrt.locking(open_file.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        fcntl.flock(open_file.fileno(), fcntl.LOCK_EX)
+    open_file.seek(0)
+
+
+def _unlock_file(open_file):
+    """Release the lock taken by ``_lock_file()``."""
+    if os.name == "nt":  # pragma: no cover
+        open_file.seek(0)
+        msvcrt.locking(open_file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(open_file.fileno(), fcntl.LOCK_UN)
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket shared by all processes on the host using the same quota.
+
+    The bucket is read from, and written back to, a state file while holding
+    an exclusive lock on it, so every chickadee process drawing on the quota
+    sees the requests sent by the others.
+
+    Args:
+        name (str): Identifier of the quota, used as the state file name. See
+            ``quota_name()``.
+        limit (int): Number of requests allowed per window.
+        period (float): Length of the quota window, in seconds.
+        buffer (float): Seconds to add to reported reset times.
+        state_dir (str): Directory for the state file. Defaults to
+            ``default_state_dir()``.
+
+    Examples:
+        >>> limiter = SharedRateLimiter('ip-api-batch', 15, 60)
+        >>> limiter.acquire()  # Counts against the quota for all processes
+        0.0
+    """
+
+    def __init__(self, name, limit, period, buffer=1.0, state_dir=None):
+        """Configure the limiter and create the state directory if needed."""
+        super().__init__(limit, period, buffer)
+        state_dir = state_dir or default_state_dir()
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, f"{name}.json")
+
+    @contextmanager
+    def _state(self):
+        """Load the bucket from the locked state file, saving any changes."""
+        with self._lock, locked_state(self.state_path) as state:
+            self._load(state)
+            yield
+            state.update(tokens=self.tokens, reset_at=self.reset_at)
+
+    def _load(self, state):
+        """Replace the in-memory bucket with the stored state.
+
+        Missing or invalid state, such as from a new or interrupted process,
+        is ignored in favour of the in-memory bucket.
+
+        Args:
+            state (dict): Content of the state file.
+
+        Returns:
+            None
+        """
+        try:
+            tokens = min(int(state["tokens"]), self.limit)
+            reset_at = float(state["reset_at"])
+        except (ValueError, TypeError, KeyError):
+            return
+        self.tokens = tokens
+        self.reset_at = reset_at
+
+
+class RequestBudget:
+    """Cap on the number of requests sent, shared by the resolvers given it.
+
+    Args:
+        limit (int): Maximum number of requests to send.
+
+    Examples:
+        >>> budget = RequestBudget(1000)
+        >>> resolver.set_budget(budget)
+        >>> resolver.query(ips)  # Stops sending requests after 1000
+        >>> budget.sent
+        1000
+    """
+
+    def __init__(self, limit):
+        """Start with the full budget available."""
+        self.limit = limit
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def exhausted(self):
+        """Whether the budget has been spent.
+
+        Returns:
+            (bool): True if no further requests may be sent.
+        """
+        with self._lock:
+            return self.sent >= self.limit
+
+    def spend(self):
+        """Count a request against the budget, if any remains.
+
+        Returns:
+            (bool): True if the request may be sent.
+        """
+        with self._lock:
+            if self.sent >= self.limit:
+                return False
+            self.sent += 1
+            return True
+
+    def refund(self):
+        """Return a request to the budget, as it was never sent.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.sent = max(0, self.sent - 1)
@@ -0,0 +1,273 @@
+"""
+Retry Policy
+============
+
+Retry transient request failures, without hammering a failing data source.
+
+``RetryPolicy`` wraps each request sent by a resolver. Requests raising a
+network error, such as a connection reset or timeout, or receiving a server
+error response, are retried after an exponential backoff with full jitter, up
+to a bounded number of attempts. Jitter spreads the retries of concurrent
+workers, so they do not arrive at the data source at the same moment.
+
+Each policy holds a ``CircuitBreaker``. After a run of consecutive failed
+requests the circuit opens, and requests are rejected without being sent
+until the reset timeout passes. A single trial request is then allowed
+through, closing the circuit if it succeeds. Resolvers report rejected
+requests as ``failed`` records, which are not cached, so they are resolved
+again by a later run.
+
+Rate limit responses, such as ip-api's 429 and VirusTotal's 204, are paced by
+the resolvers' rate limiters rather than this policy.
+
+Module Documentation
+--------------------
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+RETRY_STATUSES = (500, 502, 503, 504)  # Server errors worth retrying
+
+
+class RequestFailed(Exception):
+    """A request could not be completed, after any retries."""
+
+
+class CircuitOpenError(RequestFailed):
+    """A request was not sent, as the data source is failing.
+
+    Args:
+        message (str): Description of the error.
+        attempts (int): Attempts sent before the circuit opened. If 0, the
+            request was never sent.
+    """
+
+    def __init__(self, message, attempts=0):
+        """Record the attempts sent before the request was rejected."""
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class CircuitBreaker:
+    """Stop sending requests to a data source after repeated failures.
+
+    Args:
+        failure_threshold (int): Consecutive failures to open the circuit after.
+        reset_timeout (float): Seconds to wait before sending a trial request.
+
+    Examples:
+        >>> breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        >>> breaker.record_failure()
+        >>> breaker.record_failure()
+        >>> breaker.allow()  # Open for the next 30 seconds
+        False
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        """Start with the circuit closed."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False  # Whether a trial request is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Current state of the circuit: ``closed``, ``open``, or ``half-open``."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.time() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def allow(self):
+        """Determine whether a request may be sent.
+
+        Once the reset timeout passes, a single trial request is allowed.
+
+        Returns:
+            (bool): True if the request may be sent.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        """Close the circuit after a successful request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failed request, opening the circuit at the threshold.
+
+        Returns:
+            (bool): True if the circuit was opened by this failure.
+        """
+        with self._lock:
+            self.failures += 1
+            was_trial, self._trial = self._trial, False
+            if was_trial or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.time()
+                return True
+            return False
+
+
+class RetryPolicy:
+    """Retry failed requests with exponential backoff, behind a circuit breaker.
+
+    A policy is safe to share between threads. Counters of the requests sent,
+    retried, and rejected are available from ``self.stats()``.
+
+    Args:
+        max_attempts (int): Number of times to send a request before giving up.
+        base_delay (float): Seconds to wait, before jitter, after the first
+            failure. Doubled for each further failure.
+        max_delay (float): Longest wait between attempts, in seconds.
+        retry_statuses (tuple): Response status codes to retry.
+        failure_threshold (int): Consecutive failures to open the circuit after.
+        reset_timeout (float): Seconds the circuit stays open.
+
+    Examples:
+        >>> policy = RetryPolicy(max_attempts=3)
+        >>> response = policy.call(lambda: session.get(url, timeout=60))
+        >>> policy.stats()
+        {'requests': 2, 'retries': 1, 'failures': 1, ...}
+    """
+
+    def __init__(
+        self,
+        max_attempts=4,
+        base_delay=1.0,
+        max_delay=30.0,
+        retry_statuses=RETRY_STATUSES,
+        failure_threshold=5,
+        reset_timeout=60.0,
+    ):
+        """Configure the backoff and circuit breaker."""
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """Increment a counter reported by ``self.stats()``.
+
+        Args:
+            name (str): Name of the counter.
+            value (int): Amount to add.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.metrics[name] += value
+
+    def stats(self):
+        """Report the retry counters.
+
+        Returns:
+            (dict): Requests sent, retries, failed attempts, requests given up
+                on, requests rejected by the open circuit, and times the
+                circuit opened.
+        """
+        keys = ("requests", "retries", "failures", "gave_up", "rejected", "opened")
+        with self._lock:
+            stats = dict.fromkeys(keys, 0)
+            stats.update(self.metrics)
+        return stats
+
+    def backoff(self, attempt):
+        """Determine the wait before the next attempt, with full jitter.
+
+        Args:
+            attempt (int): Number of attempts made so far.
+
+        Returns:
+            (float): Seconds to wait.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)  # nosec - not used for security
+
+    def call(self, send):
+        """Send a request, retrying transient failures.
+
+        Args:
+            send (callable): Sends the request, taking no arguments and
+                returning a ``requests.Response``.
+
+        Returns:
+            (requests.Response): The first response without a retryable
+                status, or the last response once all attempts are used.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            RequestFailed: If every attempt raised a network error.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                self.count("rejected")
+                raise CircuitOpenError(
+                    "Circuit open, data source is failing", attempts=attempt - 1
+                )
+
+            self.count("requests")
+            error = None
+            response = None
+            try:
+                response = send()
+            except requests.RequestException as e:
+                error = e
+
+            if error is None and response.status_code not in self.retry_statuses:
+                self.breaker.record_success()
+                return response
+
+            self.count("failures")
+            if self.breaker.record_failure():
+                self.count("opened")
+                logger.warning(
+                    "Opened circuit after %s consecutive failures",
+                    self.breaker.failures,
+                )
+            reason = error if error is not None else f"status {response.status_code}"
+            if attempt == self.max_attempts:
+                self.count("gave_up")
+                logger.error("Request failed after %s attempts: %s", attempt, reason)
+                if error is not None:
+                    raise RequestFailed(f"Request failed: {error}") from error
+                return response
+
+            wait = self.backoff(attempt)
+            self.count("retries")
+            logger.info("Request failed (%s), retrying in %.1f seconds", reason, wait)
+            time.sleep(wait)
@@ -0,0 +1,417 @@
+"""
+Reverse DNS Resolver
+====================
+
+Composite resolver adding the hostname of each IP address to its record.
+
+The ip-api single endpoint reports reverse DNS, but is far slower than the
+batch endpoint. ``ReverseDNSResolver`` instead looks up the PTR record of each
+IP address with the system resolver, on a pool of threads, while another
+resolver resolves the same IP addresses. The hostname is set in the
+``reverse`` field of each record:
+
+* The hostname, if one was found.
+* An empty string, if the IP address has no PTR record.
+* None, if the lookup did not complete within the timeout.
+
+If the wrapped resolver reports the ``reverse`` field, as ip-api does when it
+is requested, only IP addresses whose records lack it are looked up.
+
+Hostnames are cached in memory for an hour, and in the resolution cache if
+enabled. Lookups that timed out are not cached.
+
+Lookups through the system resolver cannot be given a timeout, so a lookup
+that hangs holds its thread until the system resolver gives up. Lookups run on
+at most ``max_workers`` daemon threads, so hung lookups neither accumulate
+threads nor delay exit. While every thread is held by a lookup running past
+the timeout, further lookups are skipped, leaving the ``reverse`` field None.
+
+Configuration
+^^^^^^^^^^^^^
+
+Enable with ``--reverse-dns``. Works with any resolver.
+
+Module Documentation
+--------------------
+
+"""
+import asyncio
+import logging
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from . import CompositeResolver
+from .cache import MemoryCache
+
+logger = logging.getLogger(__name__)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+REVERSE_FIELD = "reverse"
+CACHE_KEY = ("reverse_dns", "", REVERSE_FIELD)  # Key of cached hostnames
+DEFAULT_TIMEOUT = 2.0  # Seconds to wait for each lookup
+DEFAULT_WORKERS = 16  # Concurrent lookups
+DEFAULT_TTL = 3600  # Seconds to cache hostnames in memory for
+IDLE_TIMEOUT = 5.0  # Seconds a lookup thread waits for work before exiting
+
+
+def system_lookup(ip):
+    """Look up the hostname of an IP address with the system resolver.
+
+    Args:
+        ip (str): IP address.
+
+    Returns:
+        (str): Hostname, or an empty string if there is no PTR record.
+    """
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except (socket.herror, socket.gaierror):
+        return ""
+
+
+class LookupPool:
+    """Bounded pool of daemon threads running blocking lookups.
+
+    Unlike ``ThreadPoolExecutor``, the threads are not joined when the
+    interpreter exits, so a hung lookup does not prevent it from exiting.
+    Threads exit after ``IDLE_TIMEOUT`` seconds without work.
+
+    Args:
+        max_workers (int): Maximum number of threads.
+    """
+
+    def __init__(self, max_workers):
+        """Start without threads, creating them as work is submitted."""
+        self.max_workers = max(1, max_workers)
+        self._queue = queue.SimpleQueue()
+        self._threads = 0
+        self._running = {}  # Start time of the work on each busy thread
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Run a function on a pool thread.
+
+        Args:
+            fn (callable): Function to run.
+            *args: Arguments for the function.
+
+        Returns:
+            (Future): Result of the function.
+        """
+        future = Future()
+        self._queue.put((future, fn, args))
+        with self._lock:
+            if self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(
+                    target=self._work, name="reverse-dns", daemon=True
+                ).start()
+        return future
+
+    def stalled(self, timeout):
+        """Determine whether every thread is held by work running too long.
+
+        Args:
+            timeout (float): Seconds after which work is considered hung.
+
+        Returns:
+            (bool): True if no thread is expected to be free for new work.
+        """
+        now = time.monotonic()
+        with self._lock:
+            hung = sum(1 for x in self._running.values() if now - x > timeout)
+        return hung >= self.max_workers
+
+    def _work(self):
+        """Run submitted work until idle for ``IDLE_TIMEOUT`` seconds."""
+        ident = threading.get_ident()
+        while True:
+            try:
+                future, fn, args = self._queue.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._lock:
+                    # Work submitted while timing out is left for this thread
+                    if self._queue.empty():
+                        self._threads -= 1
+                        return
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue  # Cancelled before it started
+            with self._lock:
+                self._running[ident] = time.monotonic()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running.pop(ident, None)
+
+
+class ReverseDNSResolver(CompositeResolver):
+    """Class to add reverse DNS to the records of another resolver.
+
+    Args:
+        resolver (ResolverBase): Configured resolver to query.
+        lookup (callable): Takes an IP address and returns its hostname, or an
+            empty string if it has none. Uses the system resolver by default.
+        timeout (float): Seconds to wait for each lookup.
+        max_workers (int): Number of lookups to run concurrently.
+        ttl (int): Seconds to cache hostnames in memory for.
+        cache (ResolutionCache): Optional persistent cache for hostnames.
+
+    Examples:
+        >>> resolver = ReverseDNSResolver(ipapi.Resolver())
+        >>> resolver.query(['1.1.1.1'])
+        [{'query': '1.1.1.1', ..., 'reverse': 'one.one.one.one'}]
+    """
+
+    cacheable = False  # Hostnames are cached separately from records
+
+    def __init__(
+        self,
+        resolver,
+        lookup=system_lookup,
+        timeout=DEFAULT_TIMEOUT,
+        max_workers=DEFAULT_WORKERS,
+        ttl=DEFAULT_TTL,
+        cache=None,
+    ):
+        """Configure the wrapped resolver and lookups."""
+        super().__init__([resolver])
+        self.resolver = resolver
+        self.lookup = lookup
+        self.timeout = timeout
+        self.lookup_workers = max_workers
+        self.hostnames = MemoryCache(backend=cache, ttl=ttl)
+        # Look up hostnames up front, unless the wrapped resolver reports them
+        self.eager = REVERSE_FIELD not in resolver.default_fields()
+        self.fields = resolver.default_fields()
+        if REVERSE_FIELD not in self.fields:
+            self.fields.append(REVERSE_FIELD)
+        self._pool = None
+
+    @property
+    def pool(self):
+        """Threads running lookups, created on first use.
+
+        Returns:
+            (LookupPool)
+        """
+        if self._pool is None:
+            self._pool = LookupPool(self.lookup_workers)
+        return self._pool
+
+    def query(self, data, force_single=False):
+        """Resolve IPs, looking up their hostnames at the same time.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+
+        Returns:
+            (list) List of records, with the ``reverse`` field set.
+        """
+        lookups = self.start(self._ips(data)) if self.eager else {}
+        try:
+            records = self.resolver.query(data, force_single=force_single)
+            lookups.update(self.start(self.missing(records, lookups)))
+            return [self.finish(x, lookups) for x in records]
+        finally:
+            self.cancel(lookups)
+
+    def iquery(self, data, force_single=False):
+        """Streaming counterpart to ``self.query()``.
+
+        Lookups are started a few chunks ahead of the records streamed by the
+        wrapped resolver, rather than all at once.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+
+        Yields:
+            (dict): Records, with the ``reverse`` field set.
+        """
+        ips = self._ips(data) if self.eager else []
+        ahead = max(self.resolver.stream_chunk(), self.lookup_workers) * 2
+        lookups = self.start(ips[:ahead])
+        started = min(ahead, len(ips))
+        try:
+            records = self.resolver.iquery(data, force_single=force_single)
+            for position, record in enumerate(records):
+                if started < position + ahead and started < len(ips):
+                    end = position + ahead
+                    pending = [x for x in ips[started:end] if x not in lookups]
+                    lookups.update(self.start(pending))
+                    started = min(end, len(ips))
+                # Streamed out of order, such as grouped by prefix
+                lookups.update(self.start(self.missing([record], lookups)))
+                yield self.finish(record, lookups)
+        finally:
+            self.cancel(lookups)
+
+    async def aquery(self, data, force_single=False, timeout=None):
+        """Asynchronous counterpart to ``self.query()``.
+
+        Args:
+            data (list, tuple, set, str): One or more IPs to resolve
+            force_single (bool): Resolve multiple IPs with the single
+                endpoint rather than the batch endpoint.
+            timeout (float): Seconds to wait for resolution to complete before
+                raising ``asyncio.TimeoutError``. Waits indefinitely if None.
+
+        Returns:
+            (list) List of records, with the ``reverse`` field set.
+        """
+        loop = asyncio.get_running_loop()
+        lookups = self.start(self._ips(data)) if self.eager else {}
+        try:
+            records = await self.resolver.aquery(
+                data, force_single=force_single, timeout=timeout
+            )
+            lookups.update(self.start(self.missing(records, lookups)))
+            return await loop.run_in_executor(
+                None, lambda: [self.finish(x, lookups) for x in records]
+            )
+        finally:
+            self.cancel(lookups)
+
+    @staticmethod
+    def missing(records, lookups):
+        """Find IP addresses still to look up for records of the wrapped resolver.
+
+        Args:
+            records (list): Records from the wrapped resolver.
+            lookups (dict): Lookups already started by ``self.start()``.
+
+        Returns:
+            (list): IP addresses of records without the ``reverse`` field,
+                and not yet looked up.
+        """
+        ips = (str(x.get("query", "")) for x in records if x.get(REVERSE_FIELD) is None)
+        return list(dict.fromkeys(x for x in ips if x and x not in lookups))
+
+    def start(self, ips):
+        """Start looking up the hostnames of IP addresses not in the cache.
+
+        Lookups are skipped while every lookup thread is held by a lookup
+        running past ``self.timeout``.
+
+        Args:
+            ips (list): IP addresses to look up.
+
+        Returns:
+            (dict): IP addresses mapped to their cached hostname, None if the
+                lookup was skipped, or a ``Future`` of the lookup and the time
+                it started.
+        """
+        if not ips:
+            return {}
+        cached = self.hostnames.get_many(CACHE_KEY, ips)
+        stalled = self.pool.stalled(self.timeout)
+        if stalled:
+            logger.warning("Reverse DNS lookups are not responding, skipping")
+        lookups = {}
+        for ip in ips:
+            if ip in cached:
+                lookups[ip] = cached[ip].get(REVERSE_FIELD, "")
+            elif stalled:
+                lookups[ip] = None
+            elif ip not in lookups:
+                started = {}
+                lookups[ip] = (self.pool.submit(self._lookup, ip, started), started)
+        logger.debug(
+            "Looking up %s hostnames, %s cached",
+            len(lookups) - len(cached),
+            len(cached),
+        )
+        return lookups
+
+    def _lookup(self, ip, started):
+        """Run a lookup, recording when it started.
+
+        Args:
+            ip (str): IP address to look up.
+            started (dict): Updated with the start time of the lookup.
+
+        Returns:
+            (str): Hostname, or an empty string if there is none.
+        """
+        started["at"] = time.monotonic()
+        return self.lookup(ip)
+
+    def finish(self, record, lookups):
+        """Add the hostname of the queried IP address to a record.
+
+        Waits for the lookup to complete, for up to ``self.timeout`` seconds
+        from when it started.
+
+        Args:
+            record (dict): Record from the wrapped resolver.
+            lookups (dict): Lookups from ``self.start()``.
+
+        Returns:
+            (dict): Copy of the record, with the ``reverse`` field set.
+        """
+        if record.get(REVERSE_FIELD) is not None:
+            return dict(record)  # Already provided by the wrapped resolver
+        ip = str(record.get("query", ""))
+        hostname = lookups.get(ip)
+        if isinstance(hostname, tuple):
+            future, started = hostname
+            hostname = self.wait(ip, future, started)
+            if hostname is not None:
+                lookups[ip] = hostname
+                self.hostnames.put_many(
+                    CACHE_KEY,
+                    [{"query": ip, REVERSE_FIELD: hostname, "status": "success"}],
+                )
+        return {**record, REVERSE_FIELD: hostname}
+
+    def wait(self, ip, future, started):
+        """Wait for a lookup to complete.
+
+        Args:
+            ip (str): IP address looked up.
+            future (Future): Running lookup.
+            started (dict): Start time of the lookup, once it starts.
+
+        Returns:
+            (str): Hostname, an empty string if there is none, or None if the
+                lookup failed or timed out.
+        """
+        remaining = self.timeout
+        if "at" in started:
+            remaining = max(0.0, started["at"] + self.timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logger.debug("Reverse DNS lookup of %s timed out", ip)
+        except Exception as e:
+            logger.debug("Reverse DNS lookup of %s failed: %s", ip, e)
+        return None
+
+    @staticmethod
+    def cancel(lookups):
+        """Cancel lookups that have not started, such as once a stream closes.
+
+        Args:
+            lookups (dict): Lookups from ``self.start()``.
+
+        Returns:
+            None
+        """
+        for lookup in lookups.values():
+            if isinstance(lookup, tuple):
+                lookup[0].cancel()
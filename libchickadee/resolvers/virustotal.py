@@ -50,9 +50,17 @@ These fields are in no particular order.
 * detected_urls
 * undetected_url_count
 * undetected_urls
+* continent
+* whois
+* raw
 * status
 * message
 
+Only the requested fields are extracted from each response. The
+``resolutions``, samples, URLs, and ``whois`` fields are costly to extract for
+busy IP addresses, and are not requested by default. The ``raw`` field holds
+the unparsed response, and is only kept if requested.
+
 Limitations
 ^^^^^^^^^^^
 
@@ -62,8 +70,17 @@ This service has a free tier for non-commercial use, and is rate limited to:
 * 5760 requests per day
 * 172800 requests per month
 
-A 204 response code indicates that you have exceeded your rate limit. The script will
-sleep for 15 seconds if a 204 is returned.
+Requests are paced to 4 per minute per API key, and the daily and monthly
+requests made with each key are counted. A 204 response code indicates that you have
+exceeded your rate limit, pausing the key for 15 seconds. An IP address still rate limited
+after the retry policy's number of attempts is reported as ``failed``. When run from the
+command line, the pacing is shared by all chickadee processes on the host.
+
+Several API keys may be provided, as a list or comma separated string. Requests are
+sent concurrently, one key at a time per request, and keys are rotated out once their
+daily or monthly quota is used. When run from the command line, the usage of each key
+is persisted between runs. The ``--budget`` option caps the requests made by a run,
+with any IP addresses not resolved reported as ``skipped``.
 
 Module Documentation
 --------------------
@@ -73,13 +90,21 @@ import collections
 import functools
 import logging
 import operator
+import os
+import threading
 import time
-from datetime import datetime
-
-import requests
-from tqdm import tqdm
-
-from . import ResolverBase
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from . import ResolverBase, codec
+from .rate_limit import (
+    RateLimiter,
+    SharedRateLimiter,
+    default_state_dir,
+    locked_state,
+    quota_name,
+)
+from .retry import CircuitOpenError, RequestFailed
 
 logger = logging.getLogger(__name__)
 
@@ -111,16 +136,270 @@ NON_DEFAULT_FIELDS = [
     "undetected_urls",
 ]
 
+RAW_FIELD = "raw"  # Field holding the unparsed response, if requested
+
+DETECTED_SAMPLE_KEYS = [
+    "detected_communicating_samples",
+    "detected_downloaded_samples",
+    "detected_referrer_samples",
+]
+
+UNDETECTED_SAMPLE_KEYS = [
+    "undetected_communicating_samples",
+    "undetected_downloaded_samples",
+    "undetected_referrer_samples",
+]
+
+DAILY_LIMIT = 5760
+MONTHLY_LIMIT = 172800
+
+
+class APIKey:
+    """VirusTotal API key with its request pacing and quota usage.
+
+    Usage is counted in memory unless ``usage_path`` is set, in which case
+    it is stored in a file shared by all processes, and across runs.
+
+    Args:
+        value (str): API key.
+        daily_limit (int): Requests allowed per day.
+        monthly_limit (int): Requests allowed per month.
+        usage_path (str): Optional path to a file persisting the usage counts.
+    """
+
+    def __init__(
+        self,
+        value,
+        daily_limit=DAILY_LIMIT,
+        monthly_limit=MONTHLY_LIMIT,
+        usage_path=None,
+    ):
+        """Configure the key with a fresh pacer and usage counters."""
+        self.value = value
+        self.limiter = RateLimiter(4, 60, buffer=0.25)
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.usage_path = usage_path
+        self.usage = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _usage(self):
+        """Hold exclusive access to the usage counts, persisting any changes."""
+        with self._lock:
+            if self.usage_path is None:
+                yield self.usage
+            else:
+                with locked_state(self.usage_path) as usage:
+                    yield usage
+
+    @staticmethod
+    def _count(usage, name, period):
+        """Read a usage count, if it is for the current period."""
+        try:
+            stored_period, count = usage[name]
+            return int(count) if stored_period == period else 0
+        except (KeyError, TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def periods():
+        """Identify the current quota periods.
+
+        Returns:
+            (dict): Current day and month, in UTC, as strings.
+        """
+        now = datetime.now(timezone.utc)
+        return {"day": now.strftime("%Y-%m-%d"), "month": now.strftime("%Y-%m")}
+
+    def used(self):
+        """Requests made within the current quota periods.
+
+        Returns:
+            (dict): Requests made in the current day and month.
+        """
+        current = self.periods()
+        with self._usage() as usage:
+            return {
+                name: self._count(usage, name, period)
+                for name, period in current.items()
+            }
+
+    def remaining(self):
+        """Requests remaining before either quota is exhausted.
+
+        Returns:
+            (int): Number of requests remaining.
+        """
+        used = self.used()
+        return min(self.daily_limit - used["day"], self.monthly_limit - used["month"])
+
+    def try_use(self):
+        """Count a request against the key's quotas, if neither is exhausted.
+
+        Checked and counted together, so concurrent requests from other
+        threads and processes can't overrun the quotas.
+
+        Returns:
+            (bool): True if the request may be sent.
+        """
+        current = self.periods()
+        with self._usage() as usage:
+            used = {name: self._count(usage, name, x) for name, x in current.items()}
+            if used["day"] >= self.daily_limit or used["month"] >= self.monthly_limit:
+                return False
+            for name, period in current.items():
+                usage[name] = [period, used[name] + 1]
+            return True
+
+    def record_use(self, count=1):
+        """Count requests against the key's quotas.
+
+        Args:
+            count (int): Number of requests to count. Negative to return
+                requests that were never sent.
+
+        Returns:
+            None
+        """
+        current = self.periods()
+        with self._usage() as usage:
+            for name, period in current.items():
+                used = self._count(usage, name, period) + count
+                usage[name] = [period, max(0, used)]
+
+
+class KeyPool:
+    """Schedule requests across several VirusTotal API keys.
+
+    Each request is assigned the first key with quota remaining that may be
+    used without waiting on its pacer. Keys with an exhausted daily or
+    monthly quota are skipped until the quota resets. Once the optional
+    ``budget`` is spent, no further keys are handed out.
+
+    Args:
+        api_keys (str or list): API keys, as a list or comma separated string.
+
+    Raises:
+        ValueError: If no API keys are provided.
+    """
+
+    def __init__(self, api_keys):
+        """Create the pool of keys."""
+        if isinstance(api_keys, str):
+            api_keys = api_keys.split(",")
+        values = [x.strip() for x in api_keys or [] if x and x.strip()]
+        # Preserve order, dropping duplicates
+        self.keys = [APIKey(x) for x in dict.fromkeys(values)]
+        if not self.keys:
+            raise ValueError("At least one VirusTotal API key is required")
+        self.budget = None  # Optional RequestBudget
+
+    def __len__(self):
+        """Number of keys within the pool."""
+        return len(self.keys)
+
+    def track_usage(self, state_dir=None):
+        """Persist each key's usage counts, sharing them across processes and runs.
+
+        Args:
+            state_dir (str): Directory holding the usage files. Defaults to
+                ``default_state_dir()``.
+
+        Returns:
+            None
+        """
+        state_dir = state_dir or default_state_dir()
+        os.makedirs(state_dir, exist_ok=True)
+        for key in self.keys:
+            name = quota_name("virustotal-usage", key.value)
+            key.usage_path = os.path.join(state_dir, f"{name}.json")
+
+    def skip_reason(self):
+        """Explain why no key is available.
+
+        Returns:
+            (str): Message for records that were not resolved.
+        """
+        if self.budget is not None and self.budget.exhausted():
+            return f"Skipped, request budget of {self.budget.limit} reached"
+        return "Skipped, all VirusTotal API key quotas are exhausted"
+
+    def active(self):
+        """Keys with quota remaining.
+
+        Returns:
+            (list): Keys that may be used.
+        """
+        return [key for key in self.keys if key.remaining() > 0]
+
+    def acquire(self):
+        """Wait for a key that may be used for a request.
+
+        The request is counted against the key's quotas, and the budget. If
+        it is not sent after all, return it with ``self.release()``. The
+        budget is spent first, so no rate limit token is taken for a request
+        the budget does not allow.
+
+        Returns:
+            (APIKey): Key to use, or None if every key's quota, or the
+                budget, is exhausted.
+        """
+        if self.budget is not None and not self.budget.spend():
+            return None
+        key = self._next_key()
+        if key is None and self.budget is not None:
+            self.budget.refund()
+        return key
+
+    def _next_key(self):
+        """Wait for a key with quota remaining and a rate limit token free.
+
+        Returns:
+            (APIKey): Key, with the request counted against its quotas, or
+                None if every key's quota is exhausted.
+        """
+        while True:
+            keys = self.active()
+            if not keys:
+                return None
+            waits = []
+            for key in keys:
+                wait = key.limiter.try_acquire()
+                if wait > 0:
+                    waits.append(wait)
+                elif key.try_use():
+                    return key
+            # Check again soon, as keys may free up in other threads
+            if waits:
+                time.sleep(min(min(waits), 1))
+
+    def release(self, key):
+        """Return a request that was never sent to the key's quotas and budget.
+
+        Args:
+            key (APIKey): Key returned by ``self.acquire()``.
+
+        Returns:
+            None
+        """
+        if self.budget is not None:
+            self.budget.refund()
+        key.record_use(-1)
+
 
 class ProResolver(ResolverBase):
     """VirusTotal authenticated API resolver. Requires an API key.
     Full API documentation here: https://developers.virustotal.com/reference"""
 
+    stream_size = 1  # Each IP is a separate request, so stream every response
+
     def __init__(self, api_key, fields=None, lang="en"):
         """Initialize class object and configure default values.
 
         Args:
-            api_key (str): API key to authenticate with
+            api_key (str or list): API key to authenticate with. Several keys
+                may be provided as a list or comma separated string.
             fields (list): Fields to filter responses
             lang (str): Language to use in the API request
         """
@@ -130,82 +409,144 @@ class ProResolver(ResolverBase):
         self.lang = "en" if lang not in self.supported_langs else lang
         self.fields = FIELDS if not fields else fields
         self.uri = "https://www.virustotal.com/vtapi/v2/ip-address/report"
-        self.api_key = api_key
+        self.pool = KeyPool(api_key)
+        self.api_key = self.pool.keys[0].value
         self.enable_sleep = True
-        self.last_request = datetime.now()
-        logger.debug("API key found")
+        logger.debug("%s API key(s) found", len(self.pool))
+
+    def share_limits(self, state_dir=None):
+        """Pace requests using the API keys' quotas, shared with other processes.
+
+        Daily and monthly usage counts are also persisted, so they carry over
+        between runs.
+
+        Args:
+            state_dir (str): Directory holding the shared rate limit state.
 
-    def sleeper(self):
-        """Method to sleep operations for rate limiting.
+        Returns:
+            None
+        """
+        self.pool.track_usage(state_dir)
+        for key in self.pool.keys:
+            key.limiter = SharedRateLimiter(
+                quota_name("virustotal", key.value),
+                key.limiter.limit,
+                key.limiter.period,
+                key.limiter.buffer,
+                state_dir=state_dir,
+            )
 
-        Will ensure that 4 requests per minute limit is not exceeded if a 204 encountered.
+    def worker_count(self):
+        """Send one request at a time per API key, as each key is paced separately.
 
-        Return:
+        Returns:
+            (int): Number of worker threads to use.
+        """
+        return max(1, len(self.pool), self.max_workers)
+
+    def set_budget(self, budget):
+        """Limit the number of requests sent by the resolver.
+
+        IPs not resolved once the budget is spent are returned with a
+        ``skipped`` status.
+
+        Args:
+            budget (RequestBudget): Budget to spend requests from, or None for
+                no limit.
+
+        Returns:
             None
         """
-        current_request = datetime.now()
-        time_since_last_request = current_request - self.last_request
-        if time_since_last_request.total_seconds() > 15:
-            return
-        time_to_sleep = (
-            15 - time_since_last_request.total_seconds()
-        ) + 0.25  # Add padding
-        logger.info(f"Sleeping for {time_to_sleep} seconds due to rate limiting.")
-        time.sleep(time_to_sleep)
+        self.pool.budget = budget
 
     def batch(self):
         """Resolve multiple IP addresses.
 
         Due to API limitations, each IP address must be resolved individually.
+        Requests are spread across the API keys in ``self.pool``.
 
         Returns:
             (list): List of resolved results
         """
-        # Not supported
-        all_ips = self.data
-        records = []
-        if self.pbar:
-            all_ips = tqdm(self.data)
-        for x in all_ips:
-            self.data = x
-            if resp := self.single():
-                records.append(resp[0])
-        return records
-
-    def single(self):
+        return self.single_many(self.data)
+
+    def request_units(self, ips, force_single=False):
+        """Split IPs in to requests, one per IP as no batch endpoint exists.
+
+        Args:
+            ips (list): IPs to resolve
+            force_single (bool): Unused, all IPs use the single endpoint.
+
+        Returns:
+            (list): List of callables, one per request.
+        """
+        return super().request_units(ips, force_single=True)
+
+    def single(self, ip=None):
         """Gathers VirusTotal report data for a single IP address.
 
+        Args:
+            ip (str): IP address to resolve. Uses ``self.data`` if not provided.
+
         Returns:
             (list): Report information
         """
-        params = {"apikey": self.api_key, "ip": self.data}
-
-        self.last_request = datetime.now()
-        rdata = requests.get(
-            self.uri,
-            params=params,
-            timeout=60,
-        )
+        ip = self.data if ip is None else ip
+        for _ in range(self.retry.max_attempts):
+            key = self.pool.acquire()
+            if key is None:
+                msg = self.pool.skip_reason()
+                logger.debug("%s: %s", msg, ip)
+                return [{"query": ip, "status": "skipped", "message": msg}]
+            params = {"apikey": key.value, "ip": ip}
+
+            try:
+                rdata = self.request("get", self.uri, params=params, timeout=60)
+            except RequestFailed as e:
+                if isinstance(e, CircuitOpenError) and not e.attempts:
+                    self.pool.release(key)  # Rejected without being sent
+                logger.error("%s: %s", e, ip)
+                return [{"query": ip, "status": "failed", "message": str(e)}]
+
+            if rdata.status_code != 204:
+                break
+            # Rate limit, pause this key and try again with the next available
+            key.limiter.update(0, 15)
+            self.retry.count("rate_limited")
+        else:
+            msg = "Rate limit exceeded"
+            logger.error("%s: %s", msg, ip)
+            return [{"query": ip, "status": "failed", "message": msg}]
 
         if rdata.status_code == 200:
-            return [self.parse_vt_resp(self.data, rdata.json())]
-        if rdata.status_code == 204:
-            # Rate limit
-            self.sleeper()
-            # Try again
-            return self.single()
-        elif rdata.status_code == 400:
-            logger.error("Incorrect request. Please check input data")
+            return [self.parse_vt_resp(ip, codec.response_json(rdata))]
+        msg = self.error_message(rdata)
+        logger.error("%s: %s", msg, ip)
+        return [{"query": ip, "status": "failed", "message": msg}]
+
+    @staticmethod
+    def error_message(rdata):
+        """Describe an unsuccessful response.
+
+        Args:
+            rdata (requests.Response): Response with an unexpected status.
+
+        Returns:
+            (str): Message for the failed record.
+        """
+        if rdata.status_code == 400:
+            return "Incorrect request. Please check input data"
         elif rdata.status_code == 403:
-            logger.error("Authorization error. Please check API key")
-        else:
-            logger.error(
-                f"Unknown error occurred, status code {rdata.status_code}, please report"
-            )
+            return "Authorization error. Please check API key"
+        return f"Unknown error occurred, status code {rdata.status_code}, please report"
 
     def parse_vt_resp(self, query, vt_resp):
         """Transform the raw response from VirusTotal in to a dictionary easier for analysis
 
+        Only the fields in ``self.fields`` are extracted, so the sample, URL,
+        and whois parsing is skipped unless those fields are requested. The
+        ``query``, ``status``, and ``message`` fields are always included.
+
         Args:
             query (str): Queried value
             vt_resp (dict): Raw API response
@@ -213,71 +554,105 @@ class ProResolver(ResolverBase):
         Returns:
             (dict): Formatted response for analysis
         """
-        attributes = dict.fromkeys(self.fields.copy())
+        fields = self.fields.split(",") if isinstance(self.fields, str) else self.fields
+        attributes = dict.fromkeys(fields)
+        extractors = self.extractors()
+        for field in fields:
+            extract = extractors.get(field)
+            if extract is not None:
+                attributes[field] = extract(vt_resp)
         attributes.update(
             {
                 "query": query,
-                "asn": "",
-                "continent": vt_resp.get("continent"),
-                "country": vt_resp.get("country"),
-                "subnet": vt_resp.get("network"),
                 "status": vt_resp.get("response_code"),
                 "message": vt_resp.get("IP address in dataset"),
-                "whois": "",
             }
         )
+        return attributes
 
-        # ASNs
-        if vt_resp.get("asn"):
-            attributes["asn"] = f'AS{vt_resp.get("asn")} {vt_resp.get("as_owner")}'
+    def extractors(self):
+        """Map each supported field to the function extracting its value.
 
-        # Parse WhoIs
-        self._extract_whois(attributes, vt_resp)
+        Returns:
+            (dict): Field names mapped to callables taking the raw response.
+        """
+        return {
+            "asn": self._extract_asn,
+            "continent": lambda vt_resp: vt_resp.get("continent"),
+            "country": lambda vt_resp: vt_resp.get("country"),
+            "subnet": lambda vt_resp: vt_resp.get("network"),
+            "whois": self._extract_whois,
+            "resolution_count": lambda vt_resp: self._count(vt_resp, ["resolutions"]),
+            "resolutions": self._extract_resolutions,
+            "detected_sample_count": lambda vt_resp: self._count(
+                vt_resp, DETECTED_SAMPLE_KEYS
+            ),
+            "detected_samples": self._extract_detected_samples,
+            "undetected_sample_count": lambda vt_resp: self._count(
+                vt_resp, UNDETECTED_SAMPLE_KEYS
+            ),
+            "undetected_samples": self._extract_undetected_samples,
+            "detected_url_count": lambda vt_resp: self._count(
+                vt_resp, ["detected_urls"]
+            ),
+            "detected_urls": self._extract_detected_urls,
+            "undetected_url_count": lambda vt_resp: self._count(
+                vt_resp, ["undetected_urls"]
+            ),
+            "undetected_urls": self._extract_undetected_urls,
+            # The unparsed response, only kept if requested
+            RAW_FIELD: lambda vt_resp: vt_resp,
+        }
 
-        # Parse Resolutions
-        self._extract_resolutions(attributes, vt_resp)
+    @staticmethod
+    def _count(vt_resp, keys):
+        """Count the entries of one or more lists in the VirusTotal API response
 
-        # Parse Detected Communicating, Download, and Referrer Samples
-        self._extract_detected_samples(attributes, vt_resp)
+        Args:
+            vt_resp (dict): Raw information from the VT API
+            keys (list): Names of the lists to count
 
-        # Parse Undetected Communicating Samples
-        self._extract_undetected_samples(attributes, vt_resp)
+        Returns:
+            (int): Total number of entries
+        """
+        return sum(len(vt_resp.get(key, [])) for key in keys)
 
-        # Parse Detected URLs
-        self._extract_detected_urls(attributes, vt_resp)
+    @staticmethod
+    def _extract_asn(vt_resp):
+        """Format the ASN and its owner
 
-        # Parse Undetected URLs
-        self._extract_undetected_urls(attributes, vt_resp)
+        Args:
+            vt_resp (dict): Raw information from the VT API
 
-        return attributes
+        Returns:
+            (str): ASN and owner, or an empty string if not known
+        """
+        if vt_resp.get("asn"):
+            return f'AS{vt_resp.get("asn")} {vt_resp.get("as_owner")}'
+        return ""
 
     @staticmethod
-    def _extract_resolutions(attributes, vt_resp):
+    def _extract_resolutions(vt_resp):
         """Extract information about associated domain resolutions
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (list): Sorted, distinct hostnames
         """
-        attributes["resolution_count"] = len(vt_resp.get("resolutions", []))
         hostname_set = {x.get("hostname") for x in vt_resp.get("resolutions", [])}
-        attributes["resolutions"] = sorted(list(hostname_set))
+        return sorted(list(hostname_set))
 
-    def _extract_undetected_urls(self, attributes, vt_resp):
+    def _extract_undetected_urls(self, vt_resp):
         """Extract information about undetected URLs
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (list): Sorted, distinct defanged URLs
         """
-        # * Get count
-        # * Get all defanged URLs
         # The API does not expose this as a key/value object
         # but instead as a list where the elements are:
         # * 0: URL
@@ -285,117 +660,77 @@ class ProResolver(ResolverBase):
         # * 2: Number of positive detections
         # * 3: Number of scanners
         # * 4: Time of last scan
-        attributes["undetected_url_count"] = len(vt_resp.get("undetected_urls", []))
-        detected_urls = {
+        undetected_urls = {
             self.defang_ioc(x[0]) for x in vt_resp.get("undetected_urls", [])
         }
-        attributes["undetected_urls"] = sorted(list(detected_urls))
+        return sorted(list(undetected_urls))
 
-    def _extract_detected_urls(self, attributes, vt_resp):
+    def _extract_detected_urls(self, vt_resp):
         """Extract information about detected URLs
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (dict): Defanged URLs mapped to their number of positive detections
         """
-        # * Get count
-        # * Get all defanged URLs
-        attributes["detected_url_count"] = len(vt_resp.get("detected_urls", []))
-        detected_urls = {
+        return {
             self.defang_ioc(x.get("url")): x.get("positives")
             for x in vt_resp.get("detected_urls", [])
         }
-        attributes["detected_urls"] = detected_urls
 
     @staticmethod
-    def _extract_undetected_samples(attributes, vt_resp):
+    def _extract_undetected_samples(vt_resp):
         """Extract information about undetected samples
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (list): Sorted, distinct SHA256 hashes
         """
-        # * Get count
-        # * Get all hashes
-        attributes["undetected_sample_count"] = (
-            len(vt_resp.get("undetected_communicating_samples", []))
-            + len(vt_resp.get("undetected_downloaded_samples", []))
-            + len(vt_resp.get("undetected_referrer_samples", []))
-        )
-
         undetected_samples = {
-            x.get("sha256") for x in vt_resp.get("undetected_communicating_samples", [])
+            x.get("sha256")
+            for key in UNDETECTED_SAMPLE_KEYS
+            for x in vt_resp.get(key, [])
         }
-        undetected_samples = undetected_samples.union(
-            {x.get("sha256") for x in vt_resp.get("undetected_downloaded_samples", [])}
-        )
-        undetected_samples = undetected_samples.union(
-            {x.get("sha256") for x in vt_resp.get("undetected_referrer_samples", [])}
-        )
-        attributes["undetected_samples"] = sorted(list(undetected_samples))
+        return sorted(list(undetected_samples))
 
     @staticmethod
-    def _extract_detected_samples(attributes, vt_resp):
+    def _extract_detected_samples(vt_resp):
         """Extract information about detected samples
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (dict): SHA256 hashes mapped to their number of positive detections
         """
-        # * Get count
-        # * Get all hashes
-        attributes["detected_sample_count"] = (
-            len(vt_resp.get("detected_communicating_samples", []))
-            + len(vt_resp.get("detected_downloaded_samples", []))
-            + len(vt_resp.get("detected_referrer_samples", []))
-        )
-
-        detected_communicating_samples = {
-            x.get("sha256"): x.get("positives")
-            for x in vt_resp.get("detected_communicating_samples", [])
-        }
-        detected_downloaded_samples = {
-            x.get("sha256"): x.get("positives")
-            for x in vt_resp.get("detected_downloaded_samples", [])
-        }
-        detected_referrer_samples = {
-            x.get("sha256"): x.get("positives")
-            for x in vt_resp.get("detected_referrer_samples", [])
-        }
         # Sum up the counts across categories for the same samples
-        attributes["detected_samples"] = dict(
+        return dict(
             functools.reduce(
                 operator.add,
-                map(
-                    collections.Counter,
-                    [
-                        detected_communicating_samples,
-                        detected_downloaded_samples,
-                        detected_referrer_samples,
-                    ],
+                (
+                    collections.Counter(
+                        {
+                            x.get("sha256"): x.get("positives")
+                            for x in vt_resp.get(key, [])
+                        }
+                    )
+                    for key in DETECTED_SAMPLE_KEYS
                 ),
             )
         )
 
     @staticmethod
-    def _extract_whois(attributes, vt_resp):
+    def _extract_whois(vt_resp):
         """Extract whois data from the VirusTotal API response
 
         Args:
-            attributes (dict): Formatted data to present for analysis
             vt_resp (dict): Raw information from the VT API
 
         Returns:
-            None. Updates attributes dictionary
+            (dict): Whois values, by name
         """
         # OtherRemarks holds info not stored in key/value config
         whois = {"OtherRemarks": ""}
@@ -407,4 +742,4 @@ class ProResolver(ResolverBase):
                 continue
             split_line = line.split(":", 1)
             whois[split_line[0].strip()] = split_line[1].strip()
-        attributes["whois"] = whois
+        return whois
@@ -0,0 +1,352 @@
+"""Local stand-in for the ip-api and VirusTotal APIs.
+
+Serves the ip-api ``/batch`` and ``/json/{ip}`` endpoints and the VirusTotal
+``ip-address/report`` endpoint from a thread on the loopback interface, so
+resolvers can be tested and benchmarked without using any quota.
+
+Requests without an API key are held to the ip-api free quotas, reported in
+the ``X-Rl`` and ``X-Ttl`` headers, with 429 responses once a quota is used.
+VirusTotal requests are paced per API key, with 204 responses once a key's
+quota is used. Quota windows and response latency are configurable, so runs
+that take hours against the real services complete in seconds.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+BATCH_LIMIT = 15  # Free ip-api batch requests per window
+SINGLE_LIMIT = 45  # Free ip-api single requests per window
+VT_LIMIT = 4  # VirusTotal requests per key per window
+
+
+class Quota:
+    """Fixed window request quota, as enforced by the data sources."""
+
+    def __init__(self, limit, window):
+        """Start with a full window."""
+        self.limit = limit
+        self.window = window
+        self.used = 0
+        self.reset_at = time.time() + window
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Count a request against the quota.
+
+        Returns:
+            (tuple): Whether the request is allowed, the requests remaining,
+                and the seconds until the window resets.
+        """
+        with self._lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.used = 0
+                self.reset_at = now + self.window
+            allowed = self.used < self.limit
+            if allowed:
+                self.used += 1
+            ttl = max(0, int(round(self.reset_at - now)))
+            return allowed, self.limit - self.used, ttl
+
+
+def ipapi_record(ip, fields=None):
+    """Build a deterministic ip-api style record for an IP address.
+
+    Args:
+        ip (str): IP address queried.
+        fields (list): Fields to include. All fields are included if empty.
+
+    Returns:
+        (dict): Resolved record.
+    """
+    digest = hashlib.sha256(ip.encode()).digest()
+    record = {
+        "status": "success",
+        "country": ["Australia", "France", "United States"][digest[0] % 3],
+        "countryCode": ["AU", "FR", "US"][digest[0] % 3],
+        "city": f"City {digest[1]}",
+        "lat": digest[2] - 90.0,
+        "lon": digest[3] - 180.0,
+        "isp": f"ISP {digest[4]}",
+        "org": f"Org {digest[5]}",
+        "as": f"AS{digest[6] * 256 + digest[7]} Example",
+        "proxy": bool(digest[8] % 2),
+        "query": ip,
+    }
+    if fields:
+        record = {k: v for k, v in record.items() if k in fields}
+    return record
+
+
+def vt_report(ip):
+    """Build a deterministic VirusTotal style report for an IP address.
+
+    Args:
+        ip (str): IP address queried.
+
+    Returns:
+        (dict): Raw report, as returned by the ``ip-address/report`` endpoint.
+    """
+    digest = hashlib.sha256(ip.encode()).digest()
+    samples = [
+        {
+            "date": "2023-06-01 00:00:00",
+            "positives": x % 5,
+            "total": 70,
+            "sha256": f"{x:064x}",
+        }
+        for x in range(digest[0] % 8)
+    ]
+    return {
+        "response_code": 1,
+        "verbose_msg": "IP address in dataset",
+        "asn": digest[1] * 256 + digest[2],
+        "as_owner": "Example",
+        "country": "US",
+        "continent": "NA",
+        "network": f"{ip}/24",
+        "whois": "NetName: EXAMPLE\nCountry: US\n",
+        "resolutions": [
+            {"hostname": f"host{x}.example.com", "last_resolved": "2023-06-01"}
+            for x in range(digest[3] % 4)
+        ],
+        "detected_communicating_samples": samples,
+        "undetected_communicating_samples": samples[::-1],
+        "detected_urls": [
+            {
+                "url": f"http://{ip}/{x}",
+                "positives": 1,
+                "total": 90,
+                "scan_date": "2023-06-01",
+            }
+            for x in range(digest[4] % 4)
+        ],
+        "undetected_urls": [],
+    }
+
+
+class StubServer:
+    """Threaded HTTP server standing in for the ip-api and VirusTotal APIs.
+
+    Args:
+        latency (float): Seconds to wait before responding to each request.
+        window (float): Length of the quota windows, in seconds.
+        batch_limit (int): Free ip-api batch requests allowed per window.
+        single_limit (int): Free ip-api single requests allowed per window.
+        vt_limit (int): VirusTotal requests allowed per key per window.
+
+    Examples:
+        >>> with StubServer(latency=0.05, window=2) as server:
+        ...     resolver = ipapi.Resolver()
+        ...     resolver.uri = server.ipapi_uri
+        ...     resolver.query(ips)
+        >>> server.stats
+        Counter({'batch': 12, 'batch_429': 2})
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        window=60.0,
+        batch_limit=BATCH_LIMIT,
+        single_limit=SINGLE_LIMIT,
+        vt_limit=VT_LIMIT,
+    ):
+        """Configure the endpoints, without starting the server."""
+        self.latency = latency
+        self.window = window
+        self.batch_quota = Quota(batch_limit, window)
+        self.single_quota = Quota(single_limit, window)
+        self.vt_limit = vt_limit
+        self.vt_quotas = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self.httpd = None
+        self._thread = None
+
+    @property
+    def uri(self):
+        """Base URI of the running server."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def ipapi_uri(self):
+        """URI to assign to ``ipapi.Resolver.uri``."""
+        return self.uri
+
+    @property
+    def vt_uri(self):
+        """URI to assign to ``virustotal.ProResolver.uri``."""
+        return f"{self.uri}vtapi/v2/ip-address/report"
+
+    def count(self, name):
+        """Count a request or response type.
+
+        Args:
+            name (str): Counter to increment.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.stats[name] += 1
+
+    def vt_quota(self, api_key):
+        """Get the request quota for a VirusTotal API key.
+
+        Args:
+            api_key (str): API key provided with the request.
+
+        Returns:
+            (Quota)
+        """
+        with self._lock:
+            if api_key not in self.vt_quotas:
+                self.vt_quotas[api_key] = Quota(self.vt_limit, self.window)
+            return self.vt_quotas[api_key]
+
+    def start(self):
+        """Start serving on a free loopback port.
+
+        Returns:
+            (StubServer): This server.
+        """
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.stub = self
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and close its socket.
+
+        Returns:
+            None
+        """
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self._thread.join()
+            self.httpd = None
+
+    def __enter__(self):
+        """Start the server for the duration of a ``with`` block."""
+        return self.start()
+
+    def __exit__(self, *exc):
+        """Stop the server at the end of a ``with`` block."""
+        self.stop()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Respond to ip-api and VirusTotal requests.
+
+    Quotas and statistics are kept by the ``StubServer`` set as the ``stub``
+    attribute of the HTTP server.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep connections alive, like the real APIs
+
+    @property
+    def stub(self):
+        """The ``StubServer`` holding the quotas and statistics."""
+        return self.server.stub
+
+    def log_message(self, *args):
+        """Silence request logging."""
+
+    def send_json(self, status, body, headers=None):
+        """Send a JSON response."""
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def ipapi_quota(self, quota, params, name):
+        """Apply the free quota to requests without an API key."""
+        if "key" in params:
+            return True, {}
+        allowed, remaining, ttl = quota.take()
+        headers = {"X-Rl": remaining, "X-Ttl": ttl}
+        if not allowed:
+            self.stub.count(f"{name}_429")
+            self.send_json(429, {"message": "Too many requests"}, headers)
+        return allowed, headers
+
+    def parse(self):
+        """Split the request path and query parameters, after the latency."""
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.stub.latency)
+        return url.path, params
+
+    def do_POST(self):
+        """Serve the ip-api batch endpoint."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path, params = self.parse()
+        if path == "/batch":
+            self.serve_batch(params, body)
+        else:
+            self.send_json(404, None)
+
+    def do_GET(self):
+        """Serve the ip-api single and VirusTotal report endpoints."""
+        path, params = self.parse()
+        if path.startswith("/json/"):
+            self.serve_single(path[len("/json/") :], params)
+        elif path == "/vtapi/v2/ip-address/report":
+            self.serve_vt_report(params)
+        else:
+            self.send_json(404, None)
+
+    def serve_batch(self, params, body):
+        """Serve the ip-api batch endpoint, resolving up to 100 IPs."""
+        allowed, headers = self.ipapi_quota(self.stub.batch_quota, params, "batch")
+        if not allowed:
+            return
+        self.stub.count("batch")
+        queries = json.loads(body or b"[]")
+        fields = [x for x in params.get("fields", "").split(",") if x]
+        records = [
+            ipapi_record(x["query"] if isinstance(x, dict) else x, fields)
+            for x in queries[:100]
+        ]
+        self.send_json(200, records, headers)
+
+    def serve_single(self, ip, params):
+        """Serve the ip-api single endpoint."""
+        allowed, headers = self.ipapi_quota(self.stub.single_quota, params, "single")
+        if not allowed:
+            return
+        self.stub.count("single")
+        fields = [x for x in params.get("fields", "").split(",") if x]
+        self.send_json(200, ipapi_record(ip, fields), headers)
+
+    def serve_vt_report(self, params):
+        """Serve the VirusTotal IP address report endpoint."""
+        if not params.get("apikey"):
+            self.stub.count("vt_403")
+            self.send_json(403, None)
+            return
+        allowed, _, _ = self.stub.vt_quota(params["apikey"]).take()
+        if not allowed:
+            self.stub.count("vt_204")
+            self.send_json(204, None)
+            return
+        self.stub.count("vt")
+        self.send_json(200, vt_report(params.get("ip", "")))
@@ -1,17 +1,27 @@
 """Chickadee script tests."""
+import asyncio
 import io
 import os
 import sys
+import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from libchickadee.chickadee import (
     Chickadee,
     arg_handling,
     config_handing,
+    configure_chickadee,
+    configure_resolution,
     find_config_file,
     join_config_args,
+    query_arg_handling,
+    query_index,
 )
+from libchickadee.parsers.ip_filter import CIDRRangeTable, IPFilter
+from libchickadee.parsers.ip_index import OccurrenceIndex
+from libchickadee.resolvers import ResolverBase, ipapi
+from libchickadee.resolvers.cache import MemoryCache
 
 __author__ = "Chapin Bryce"
 __date__ = 20200407
@@ -19,6 +29,66 @@ __license__ = "MIT Copyright 2020 Chapin Bryce"
 __desc__ = """Yet another GeoIP resolution tool."""
 
 
+class MockResolver(ResolverBase):
+    """Fake resolver, answering each IP address with ``answer()``.
+
+    As with ``ipapi.Resolver``, no fields are requested by default, leaving the
+    fields reported to the data source, listed in ``source_fields``. Create
+    subclasses with ``mock_resolver()``, which records the IP addresses queried
+    and the fields requested by every instance.
+    """
+
+    source_fields = ["query"]
+    queried = []
+    requested = []
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """Set defaults, recording the fields requested"""
+        super().__init__()
+        self.fields = fields or []
+        self.requested.append(fields)
+
+    @staticmethod
+    def answer(ip):
+        """Answer with the IP address queried, or None for no record"""
+        return {"query": ip}
+
+    def default_fields(self):
+        """Report the fields of the data source if none are requested"""
+        return super().default_fields() or list(self.source_fields)
+
+    def single(self, ip=None):
+        """Mock the single method, answering one IP"""
+        ip = self.data if ip is None else ip
+        self.queried.append(ip)
+        record = self.answer(ip)
+        return [] if record is None else [dict(record)]
+
+    def batch(self):
+        """Mock the batch method, answering every IP"""
+        self.queried.extend(self.data)
+        records = (self.answer(ip) for ip in self.data)
+        return [dict(x) for x in records if x is not None]
+
+
+def mock_resolver(answer=MockResolver.answer, **attributes):
+    """Create a fake resolver class for chickadee to use in place of another.
+
+    Args:
+        answer (callable): Takes an IP address and returns its record, or None.
+        **attributes: Further class attributes, such as ``source_fields``.
+
+    Returns:
+        (type): Subclass of ``MockResolver``, with its own ``queried`` and
+            ``requested`` lists.
+    """
+    return type(
+        "MockResolver",
+        (MockResolver,),
+        {"answer": staticmethod(answer), "queried": [], "requested": [], **attributes},
+    )
+
+
 class ChickadeeConfigTestCase(unittest.TestCase):
     """Test case handling configuration file functionality"""
 
@@ -73,16 +143,60 @@ class ChickadeeConfigTestCase(unittest.TestCase):
                 "verbose": True,
                 "resolver": "ip_api",
                 "virustotal": "",
+                "mmdb": "",
+                "range_table": "",
                 "ip_api": "",
                 "no-count": False,
+                "min-count": None,
+                "top": None,
                 "no-resolve": True,
                 "include-bogon": False,
+                "include-cidrs": None,
+                "exclude-cidrs": None,
+                "build-index": None,
+                "no-cache": False,
+                "refresh-cache": False,
+                "cache-ttl": 86400,
+                "no-shared-limits": False,
+                "budget": None,
+                "journal": None,
+                "merge": False,
+                "resolve-granularity": None,
+                "workers": 1,
                 "single": True,
+                "reverse-dns": False,
                 "output-format": "csv",
                 "output-file": "test.out",
+                "compact-json": False,
             },
         )
 
+    def test_argparse_count_filters(self):
+        """Validate parsing of the frequency filter arguments."""
+        parsed = arg_handling(["1.1.1.1", "--min-count", "3", "--top", "10"])
+        self.assertEqual(parsed.min_count, 3)
+        self.assertEqual(parsed.top, 10)
+
+        joined = join_config_args({}, parsed)
+        self.assertEqual(joined["min-count"], 3)
+        self.assertEqual(joined["top"], 10)
+
+        for value in ["0", "-1", "x"]:
+            for option in ["--min-count", "--top", "--workers"]:
+                with self.subTest(option=option, value=value), patch(
+                    "sys.stderr", new_callable=io.StringIO
+                ), self.assertRaises(SystemExit):
+                    arg_handling(["1.1.1.1", option, value])
+
+        self.assertEqual(arg_handling(["1.1.1.1", "--budget", "0"]).budget, 0)
+        self.assertEqual(arg_handling(["1.1.1.1", "--cache-ttl", "0"]).cache_ttl, 0)
+        for value in ["-1", "x"]:
+            for option in ["--budget", "--cache-ttl"]:
+                with self.subTest(option=option, value=value), patch(
+                    "sys.stderr", new_callable=io.StringIO
+                ), self.assertRaises(SystemExit):
+                    arg_handling(["1.1.1.1", option, value])
+
     def test_configparse(self):
         """Test the parsing of configuration file and command line arguments"""
         args = ["1.1.1.1", "-f", self.default_columns]
@@ -102,12 +216,30 @@ class ChickadeeConfigTestCase(unittest.TestCase):
                 "resolver": "ip_api",
                 "ip_api": "",
                 "virustotal": "",
+                "mmdb": "",
+                "range_table": "",
                 "no-count": False,
+                "min-count": None,
+                "top": None,
                 "no-resolve": False,
                 "include-bogon": False,
+                "include-cidrs": None,
+                "exclude-cidrs": None,
+                "build-index": None,
+                "no-cache": False,
+                "refresh-cache": False,
+                "cache-ttl": 86400,
+                "no-shared-limits": False,
+                "budget": None,
+                "journal": None,
+                "merge": False,
+                "resolve-granularity": None,
+                "workers": 1,
                 "single": False,
+                "reverse-dns": False,
                 "output-format": "jsonl",
                 "output-file": sys.stdout,
+                "compact-json": False,
             },
         )
 
@@ -133,12 +265,23 @@ ip_api = not-an-api-key
                 "output-format": "csv",
                 "verbose": True,
                 "fields": "query,country",
+                "compact-json": None,
                 "progress": None,
                 "no-resolve": None,
                 "include-bogon": None,
+                "include-cidrs": None,
+                "exclude-cidrs": None,
+                "no-cache": None,
+                "cache-ttl": None,
+                "no-shared-limits": None,
+                "resolve-granularity": None,
+                "reverse-dns": None,
                 "log": None,
                 "resolver": "ip_api",
+                "merge": None,
                 "virustotal": None,
+                "mmdb": None,
+                "range_table": None,
                 "ip_api": "not-an-api-key",
             },
         )
@@ -157,6 +300,43 @@ ip_api = not-an-api-key
             os.remove(conf_path)
             self.assertEqual(conf_path, actual)
 
+    def test_configure_chickadee(self):
+        """Test applying the run options to a Chickadee instance"""
+        args = arg_handling(
+            [
+                "-f",
+                "query,country",
+                "--resolve-granularity",
+                "24",
+                "--no-cache",
+                "--no-shared-limits",
+                "-t",
+                "csv",
+                "--compact-json",
+                "1.1.1.1",
+            ]
+        )
+        params = join_config_args({}, args)
+        chickadee = configure_chickadee(params)
+        configure_resolution(chickadee, params)
+        self.assertEqual(chickadee.fields, ["query", "country"])
+        self.assertEqual(chickadee.out_format, "csv")
+        self.assertTrue(chickadee.compact_json)
+        self.assertEqual(chickadee.granularity, (24, 48))
+        self.assertIsNone(chickadee.cache)
+        self.assertIsNone(chickadee.rate_limit_dir)
+
+    def test_configure_resolver_names(self):
+        """Test validating resolver names from the config file"""
+        args = arg_handling(["1.1.1.1"])
+        params = join_config_args({"resolver": " ip_api, virustotal"}, args)
+        self.assertEqual(configure_chickadee(params).resolver, "ip_api,virustotal")
+
+        params = join_config_args({"resolver": "ip_api,nope"}, args)
+        with self.assertRaises(SystemExit) as err:
+            configure_chickadee(params)
+        self.assertIn("invalid choice: nope", str(err.exception.code))
+
 
 class ChickadeeStringTestCase(unittest.TestCase):
     """Chickadee script tests."""
@@ -185,6 +365,7 @@ class ChickadeeStringTestCase(unittest.TestCase):
         ]
 
         self.fields = ["query", "count", "as", "country", "org", "proxy"]
+        self.answer = {x["query"]: x for x in self.expected_result}.get
 
     def test_no_resolve(self, resolve="No resolve"):
         """Confirm the handling when no resolution is requested"""
@@ -224,26 +405,315 @@ class ChickadeeStringTestCase(unittest.TestCase):
 
     def test_chickadee_force_single(self):
         """Batch Query Method Test"""
-        expected_results = self.expected_result
+        resolver = mock_resolver(self.answer)
+        chickadee = Chickadee()
+        chickadee.ignore_bogon = False
+        chickadee.force_single = True
+        chickadee.fields = self.fields
+        with patch("libchickadee.chickadee.ipapi.Resolver", resolver):
+            data = chickadee.run(",".join(self.test_data_ips))
+        self.assertCountEqual(data, self.expected_result)
+        self.assertCountEqual(resolver.queried, self.test_data_ips)
+
+    def test_chickadee_arun(self):
+        """Async run test"""
+        chickadee = Chickadee()
+        chickadee.ignore_bogon = False
+        chickadee.force_single = True
+        chickadee.fields = self.fields
+        with patch("libchickadee.chickadee.ipapi.Resolver", mock_resolver(self.answer)):
+            data = asyncio.run(chickadee.arun(",".join(self.test_data_ips)))
+        self.assertCountEqual(data, self.expected_result)
 
-        class MockResolver:
-            """Fake resolver"""
+        chickadee.resolve_ips = False
+        data = asyncio.run(chickadee.arun(self.test_data_ips[0]))
+        self.assertEqual(data[0]["message"], "No resolve")
 
-            def __init__(self, *args, **kwargs):
-                """Set defaults"""
-                self.data = None
+    def test_report_skipped(self):
+        """Test the reporting of IPs skipped by the resolver"""
+        results = [
+            {"query": "1.1.1.1", "status": 1},
+            {"query": "2.2.2.2", "status": "skipped", "message": "Budget reached"},
+        ]
+        with self.assertLogs("libchickadee.chickadee", level="WARNING") as mock_log:
+            skipped = Chickadee.report_skipped(results)
+        self.assertEqual(skipped, results[1:])
+        self.assertEqual(
+            mock_log.records[0].message,
+            "1 of 2 IP addresses were not resolved. Budget reached",
+        )
+
+    def test_chickadee_irun(self):
+        """Test streaming records as each chunk is resolved"""
+        resolver = mock_resolver(
+            lambda ip: {
+                "query": ip,
+                "status": "skipped" if ip == "4.4.4.4" else "success",
+            },
+            stream_size=2,
+        )
+        chickadee = Chickadee()
+        chickadee.fields = ["query", "status", "count"]
+        with patch("libchickadee.chickadee.ipapi.Resolver", resolver):
+            stream = chickadee.irun("1.1.1.1,2.2.2.2,1.1.1.1,3.3.3.3,4.4.4.4")
+            self.assertEqual(resolver.queried, [])
+            self.assertEqual(
+                next(stream), {"query": "1.1.1.1", "status": "success", "count": 2}
+            )
+            self.assertEqual(resolver.queried, ["1.1.1.1", "2.2.2.2"])
+            outfile = io.StringIO()
+            chickadee.out_format = "jsonl"
+            chickadee.outfile = outfile
+            chickadee.compact_json = True
+            with self.assertLogs("libchickadee.chickadee", level="WARNING") as mock_log:
+                chickadee.write_output(stream)
+        self.assertEqual(resolver.queried, ["1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"])
+        self.assertEqual(
+            outfile.getvalue().splitlines(),
+            [
+                '{"query":"2.2.2.2","status":"success","count":1}',
+                '{"query":"3.3.3.3","status":"success","count":1}',
+                '{"query":"4.4.4.4","status":"skipped","count":1}',
+            ],
+        )
+        self.assertEqual(
+            mock_log.records[0].message,
+            "1 of 4 IP addresses were not resolved. Skipped",
+        )
 
-            def single(self):
-                """Mock the single method, returning a list of data."""
-                return [x for x in expected_results if x["query"] == self.data]
+        chickadee.resolve_ips = False
+        stream = chickadee.irun("1.1.1.1")
+        self.assertEqual(next(stream)["message"], "No resolve")
 
+    def test_chickadee_chain(self):
+        """Test resolving with a chain of resolvers"""
+        # The offline resolver only has data for 8.8.8.8
+        local = mock_resolver(
+            lambda ip: self.answer(ip) if ip == "8.8.8.8" else {"query": ip}
+        )
+        remote = mock_resolver(self.answer)
         chickadee = Chickadee()
         chickadee.ignore_bogon = False
-        chickadee.force_single = True
         chickadee.fields = self.fields
-        with patch("libchickadee.chickadee.ipapi.Resolver", MockResolver):
-            data = chickadee.run(",".join(self.test_data_ips))
+        chickadee.resolver = "mmdb,ip_api"
+        with patch("libchickadee.chickadee.mmdb.Resolver", local), patch(
+            "libchickadee.chickadee.ipapi.Resolver", remote
+        ):
+            data = chickadee.run(
+                ",".join(self.test_data_ips), {"mmdb": "db.mmdb", "ip_api": None}
+            )
         self.assertCountEqual(data, self.expected_result)
+        self.assertCountEqual(remote.queried, ["10.0.1.2", "2001:4860:4860::8888"])
+
+        with self.assertRaises(SystemExit), patch("sys.stderr"):
+            arg_handling(["-r", "mmdb,unknown", "1.1.1.1"])
+        self.assertEqual(
+            arg_handling(["-r", "mmdb, ip_api", "1.1.1.1"]).resolver, "mmdb,ip_api"
+        )
+
+    def test_chickadee_merge(self):
+        """Test merging the records of several resolvers"""
+        source_fields = ["query", "count", "source"]
+        local = mock_resolver(
+            lambda ip: {"query": ip, "source": "LocalResolver"},
+            source_fields=source_fields,
+        )
+        remote = mock_resolver(
+            lambda ip: {"query": ip, "source": "RemoteResolver"},
+            source_fields=source_fields,
+        )
+        chickadee = Chickadee()
+        chickadee.ignore_bogon = False
+        chickadee.resolver = "mmdb,ip_api"
+        chickadee.merge = True
+        with patch("libchickadee.chickadee.mmdb.Resolver", local), patch(
+            "libchickadee.chickadee.ipapi.Resolver", remote
+        ):
+            data = chickadee.run(
+                "1.1.1.1,8.8.8.8,1.1.1.1", {"mmdb": "db.mmdb", "ip_api": None}
+            )
+        self.assertEqual(local.queried, ["1.1.1.1", "8.8.8.8"])
+        self.assertEqual(remote.queried, ["1.1.1.1", "8.8.8.8"])
+        self.assertEqual(local.requested, [None])
+        self.assertEqual(
+            chickadee.report_fields,
+            ["query", "count", "mmdb.source", "ip_api.source"],
+        )
+        self.assertIsNone(chickadee.fields)
+        self.assertEqual(
+            data,
+            [
+                {
+                    "query": "1.1.1.1",
+                    "mmdb.source": "LocalResolver",
+                    "ip_api.source": "RemoteResolver",
+                    "count": 2,
+                },
+                {
+                    "query": "8.8.8.8",
+                    "mmdb.source": "LocalResolver",
+                    "ip_api.source": "RemoteResolver",
+                    "count": 1,
+                },
+            ],
+        )
+        self.assertTrue(arg_handling(["-r", "mmdb,ip_api", "--merge", "1.1.1.1"]).merge)
+
+    def test_chickadee_merge_default_fields(self):
+        """Test merged ip-api default fields are reported across runs"""
+        response = MagicMock()
+        response.status_code = 200
+        response.headers = {"X-Rl": "14", "X-Ttl": "60"}
+        response.json.return_value = [{"query": "8.8.8.8", "country": "US"}]
+
+        vt_resolver = mock_resolver(
+            lambda ip: {"query": ip, "asn": "AS15169"},
+            source_fields=["query", "count", "asn"],
+        )
+        chickadee = Chickadee()
+        chickadee.resolver = "ip_api,virustotal"
+        chickadee.merge = True
+        chickadee.session = MagicMock()
+        chickadee.session.post.return_value = response
+        expected = ["query", "count"]
+        expected += [f"ip_api.{x}" for x in ipapi.DEFAULT_FIELDS if x != "query"]
+        expected += ["virustotal.asn"]
+        with patch("libchickadee.chickadee.virustotal.ProResolver", vt_resolver):
+            for _ in range(2):
+                data = chickadee.run("8.8.8.8", {"virustotal": "key"})
+                self.assertIsNone(chickadee.fields)
+                self.assertEqual(chickadee.report_fields, expected)
+                self.assertEqual(
+                    data,
+                    [
+                        {
+                            "query": "8.8.8.8",
+                            "ip_api.country": "US",
+                            "virustotal.asn": "AS15169",
+                            "count": 1,
+                        }
+                    ],
+                )
+        params = chickadee.session.post.call_args.kwargs["params"]
+        self.assertEqual(params["fields"], "")
+
+    def test_chickadee_granularity(self):
+        """Test resolving one IP address per prefix"""
+        resolver = mock_resolver(lambda ip: {"query": ip, "country": "Australia"})
+        chickadee = Chickadee()
+        chickadee.ignore_bogon = False
+        chickadee.fields = ["query", "country", "count"]
+        chickadee.granularity = (24, 48)
+        with patch("libchickadee.chickadee.ipapi.Resolver", resolver):
+            data = chickadee.run("1.1.1.1,1.1.1.2,1.1.2.1,2001:db8::1,2001:db8:0:1::1")
+        self.assertEqual(resolver.queried, ["1.1.1.1", "1.1.2.1", "2001:db8::1"])
+        self.assertEqual(
+            chickadee.fields, ["query", "country", "count", "inferred_from"]
+        )
+        self.assertCountEqual(
+            [(x["query"], x["inferred_from"], x["count"]) for x in data],
+            [
+                ("1.1.1.1", None, 1),
+                ("1.1.1.2", "1.1.1.1", 1),
+                ("1.1.2.1", None, 1),
+                ("2001:db8::1", None, 1),
+                ("2001:db8:0:1::1", "2001:db8::1", 1),
+            ],
+        )
+        chickadee.fields = ["country", "inferred_from"]
+        self.assertEqual(chickadee.resolver_fields(), ["query", "country"])
+        self.assertEqual(
+            arg_handling(
+                ["--resolve-granularity", "16,32", "1.1.1.1"]
+            ).resolve_granularity,
+            (16, 32),
+        )
+        with self.assertRaises(SystemExit), patch("sys.stderr"):
+            arg_handling(["--resolve-granularity", "33", "1.1.1.1"])
+
+    def test_chickadee_reverse_dns(self):
+        """Test adding hostnames alongside the batch resolver"""
+        resolver = mock_resolver(lambda ip: {"query": ip, "country": "Australia"})
+        chickadee = Chickadee()
+        chickadee.fields = ["query", "country", "count"]
+        chickadee.reverse_dns = True
+        with patch("libchickadee.chickadee.ipapi.Resolver", resolver), patch(
+            "socket.gethostbyaddr", return_value=("one.one.one.one", [], [])
+        ):
+            data = chickadee.run("1.1.1.1")
+        self.assertEqual(resolver.requested, [["query", "country", "count"]])
+        self.assertEqual(chickadee.fields, ["query", "country", "count", "reverse"])
+        self.assertEqual(
+            data,
+            [
+                {
+                    "query": "1.1.1.1",
+                    "country": "Australia",
+                    "reverse": "one.one.one.one",
+                    "count": 1,
+                }
+            ],
+        )
+        self.assertTrue(arg_handling(["--reverse-dns", "1.1.1.1"]).reverse_dns)
+
+    def test_filter_counts(self):
+        """Test the frequency threshold and top N filtering of extracted IPs"""
+        data_dict = {"1.1.1.1": 5, "2.2.2.2": 1, "3.3.3.3": 3, "4.4.4.4": 3}
+        chickadee = Chickadee()
+        self.assertDictEqual(chickadee.filter_counts(data_dict), data_dict)
+
+        chickadee.min_count = 3
+        self.assertDictEqual(
+            chickadee.filter_counts(data_dict),
+            {"1.1.1.1": 5, "3.3.3.3": 3, "4.4.4.4": 3},
+        )
+
+        chickadee.min_count = None
+        chickadee.top = 2
+        self.assertDictEqual(
+            chickadee.filter_counts(data_dict), {"1.1.1.1": 5, "3.3.3.3": 3}
+        )
+
+        chickadee.min_count = 4
+        self.assertDictEqual(chickadee.filter_counts(data_dict), {"1.1.1.1": 5})
+
+    def test_filter_counts_totalled(self):
+        """Test frequency filters apply to counts totalled across inputs"""
+        chickadee = Chickadee()
+        chickadee.resolve_ips = False
+        chickadee.top = 1
+        data = chickadee.run(["1.1.1.1,8.8.8.8,8.8.8.8", "1.1.1.1,1.1.1.1"])
+        self.assertEqual(
+            data, [{"query": "1.1.1.1", "count": 3, "message": "No resolve"}]
+        )
+
+        chickadee.top = None
+        chickadee.min_count = 3
+        data = chickadee.run(["1.1.1.1,8.8.8.8,8.8.8.8", "1.1.1.1,1.1.1.1"])
+        self.assertEqual([x["query"] for x in data], ["1.1.1.1"])
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.batch")
+    def test_filter_before_resolve(self, mock_batch):
+        """Confirm that filtered IPs are never sent to the resolver"""
+        chickadee = Chickadee(fields=self.fields)
+        chickadee.min_count = 2
+        mock_batch.return_value = [self.expected_result[1]]
+        data = chickadee.run("8.8.8.8,8.8.8.8,1.1.1.1")
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual(data, [{**self.expected_result[1], "count": 2}])
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.batch")
+    def test_memory_cache_counts(self, mock_batch):
+        """Confirm counts are reattached to cached records for each run"""
+        chickadee = Chickadee(fields=self.fields)
+        chickadee.cache = MemoryCache()
+        mock_batch.return_value = [dict(self.expected_result[1])]
+        first = chickadee.run("8.8.8.8,8.8.8.8")
+        second = chickadee.run("8.8.8.8")
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual(first[0]["count"], 2)
+        self.assertEqual(second, [self.expected_result[1]])
+        self.assertEqual(chickadee.cache.stats()["hits"], 1)
 
     def test_improper_type(self):
         """Test error handling when the wrong data type is provided via API"""
@@ -512,6 +982,62 @@ class ChickadeeFileTestCase(unittest.TestCase):
         ips = Chickadee.file_handler(stream, ignore_bogon=True)
         self.assertDictEqual(ips, {"1.1.1.1": 1})
 
+    def test_file_handler_ip_filter(self):
+        """Validate that excluded ranges are dropped during extraction"""
+        ip_filter = IPFilter(exclude=CIDRRangeTable(["2001:4860::/32", "1.1.1.0/24"]))
+        ips = Chickadee.file_handler(
+            os.path.join(self.test_data_dir, "txt_ips.txt"),
+            ignore_bogon=True,
+            ip_filter=ip_filter,
+        )
+        self.assertDictEqual(ips, {"8.8.8.8": 1, "2.2.2.2": 1, "4.4.4.4": 1})
+
+
+class ChickadeeIndexTestCase(unittest.TestCase):
+    """Test building and querying the IP occurrence index"""
+
+    def setUp(self):
+        """Test setup."""
+        self.test_data_dir = os.path.join(os.path.dirname(__file__), "test_data")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmp_dir.name, "test.idx")
+
+    def tearDown(self):
+        """Remove the temporary index."""
+        self.tmp_dir.cleanup()
+
+    def test_build_and_query(self):
+        """Test that an index built during extraction answers queries"""
+        chickadee = Chickadee()
+        chickadee.resolve_ips = False
+        chickadee.ignore_bogon = False
+        chickadee.index = OccurrenceIndex(self.index_path)
+        chickadee.run(os.path.join(self.test_data_dir, "txt_ips.txt"))
+        chickadee.index.close()
+
+        actual = query_index(self.index_path, ["1.1.1.1"])
+        self.assertEqual(len(actual), 2)
+        self.assertTrue(actual[0]["file"].endswith("txt_ips.txt"))
+        self.assertEqual(actual[0]["unit"], "byte")
+
+        actual = query_index(self.index_path, ["2001:4860::/32"])
+        self.assertEqual(
+            {x["query"] for x in actual},
+            {"2001:4860:4860::8844", "2001:4860:4860::8888"},
+        )
+
+    def test_query_missing_index(self):
+        """Test error handling of a missing index file"""
+        with self.assertRaises(FileNotFoundError):
+            query_index(self.index_path, ["1.1.1.1"])
+
+    def test_query_argparse(self):
+        """Validate query subcommand argument parsing."""
+        parsed = query_arg_handling(["test.idx", "1.1.1.1", "10.0.0.0/8", "-t", "csv"])
+        self.assertEqual(parsed.index, "test.idx")
+        self.assertEqual(parsed.values, ["1.1.1.1", "10.0.0.0/8"])
+        self.assertEqual(parsed.output_format, "csv")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,85 @@
+"""CIDR filter tests"""
+import os
+import tempfile
+import unittest
+
+from libchickadee.parsers import ParserBase
+from libchickadee.parsers.ip_filter import CIDRRangeTable, IPFilter
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class CIDRRangeTableTestCase(unittest.TestCase):
+    """Test cases for the CIDR range table"""
+
+    def test_contains(self):
+        """Test membership checks against IPv4 and IPv6 ranges"""
+        table = CIDRRangeTable(["1.1.1.0/24", "8.8.8.8", "2001:4860::/32"])
+        for ip in ["1.1.1.0", "1.1.1.255", "8.8.8.8", "2001:4860:4860::8888"]:
+            self.assertIn(ip, table)
+        for ip in ["1.1.2.0", "1.1.0.255", "8.8.8.9", "2001:4861::1", "::1"]:
+            self.assertNotIn(ip, table)
+
+    def test_merge(self):
+        """Test that overlapping and adjacent ranges are merged"""
+        table = CIDRRangeTable(["10.0.0.0/24", "10.0.1.0/24", "10.0.0.128/25"])
+        self.assertEqual(len(table), 1)
+        self.assertIn("10.0.1.200", table)
+        table.add("10.0.3.0/24")
+        self.assertEqual(len(table), 2)
+        self.assertNotIn("10.0.2.1", table)
+
+    def test_invalid(self):
+        """Test error handling for malformed ranges"""
+        with self.assertRaises(ValueError):
+            CIDRRangeTable(["not-a-cidr"])
+
+    def test_from_file(self):
+        """Test loading ranges from a file, ignoring comments and blank lines"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "ranges.txt")
+            with open(file_path, "w") as open_file:
+                open_file.write("# Netblocks\n\n1.1.1.0/24  # CDN\n2001:db8::/32\n")
+            table = CIDRRangeTable.from_file(file_path)
+
+            with open(file_path, "a") as open_file:
+                open_file.write("bad value\n")
+            with self.assertRaisesRegex(ValueError, "line 5"):
+                CIDRRangeTable.from_file(file_path)
+
+        self.assertEqual(len(table), 2)
+        self.assertIn("1.1.1.1", table)
+        self.assertIn("2001:db8::1", table)
+
+
+class IPFilterTestCase(unittest.TestCase):
+    """Test cases for the include/exclude filter"""
+
+    def test_is_excluded(self):
+        """Test the combination of include and exclude ranges"""
+        ip_filter = IPFilter(
+            include=CIDRRangeTable(["1.0.0.0/8"]),
+            exclude=CIDRRangeTable(["1.1.1.0/24"]),
+        )
+        self.assertFalse(ip_filter.is_excluded("1.2.3.4"))
+        self.assertTrue(ip_filter.is_excluded("1.1.1.1"))
+        self.assertTrue(ip_filter.is_excluded("8.8.8.8"))
+
+    def test_from_files(self):
+        """Test that no filter is built when no files are provided"""
+        self.assertIsNone(IPFilter.from_files())
+
+    def test_check_ips_filter(self):
+        """Test the check_ips function with a CIDR filter"""
+        parser = ParserBase(
+            ip_filter=IPFilter(exclude=CIDRRangeTable(["2001:4860::/32", "8.8.8.8"]))
+        )
+        parser.check_ips("2001:4860:4860::8844 8.8.8.8 1.1.1.1 1.1.1.1")
+        self.assertDictEqual(parser.ips, {"1.1.1.1": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
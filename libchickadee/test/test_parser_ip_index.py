@@ -0,0 +1,160 @@
+"""IP occurrence index tests"""
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from libchickadee.parsers.evtx import EVTXParser
+from libchickadee.parsers.ip_index import OccurrenceIndex, ip_to_key, key_to_ip
+from libchickadee.parsers.plain_text import PlainTextParser
+from libchickadee.parsers.xlsx import XLSXParser
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class OccurrenceIndexTestCase(unittest.TestCase):
+    """Test cases for the IP occurrence index"""
+
+    def setUp(self):
+        """Test config"""
+        self.test_data_dir = os.path.join(os.path.dirname(__file__), "test_data")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = OccurrenceIndex(os.path.join(self.tmp_dir.name, "test.idx"))
+
+    def tearDown(self):
+        """Clean up test data"""
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test_key_round_trip(self):
+        """Test conversion of IP addresses to and from index keys"""
+        for ip in ["1.1.1.1", "0.0.0.0", "2001:4860:4860::8888", "::1"]:
+            self.assertEqual(ip, key_to_ip(ip_to_key(ip)))
+        self.assertEqual("::ffff:1.1.1.1", key_to_ip(ip_to_key("::ffff:1.1.1.1")))
+        self.assertLess(ip_to_key("1.1.1.1"), ip_to_key("1.1.1.2"))
+        self.assertNotEqual(ip_to_key("1.1.1.1"), ip_to_key("::ffff:1.1.1.1"))
+
+    def test_index_plain_text(self):
+        """Test recording line offsets from plain text files"""
+        file_path = os.path.join(self.test_data_dir, "txt_ips.txt")
+        parser = PlainTextParser(ignore_bogon=False, index=self.index)
+        parser.parse_file(file_path)
+
+        hits = self.index.query("1.1.1.1")
+        self.assertEqual(len(hits), 2)
+        with open(file_path, "rb") as open_file:
+            for hit in hits:
+                open_file.seek(hit["location"])
+                self.assertIn(b"1.1.1.1", open_file.readline())
+
+    def test_index_gzip(self):
+        """Test that gzipped files are indexed by decompressed offset"""
+        parser = PlainTextParser(ignore_bogon=False, index=self.index)
+        parser.parse_file(os.path.join(self.test_data_dir, "txt_ips.txt"))
+        parser.parse_file(os.path.join(self.test_data_dir, "txt_ips.txt.gz"))
+        hits = self.index.query("8.8.8.8")
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(hits[0]["location"], hits[1]["location"])
+
+    def test_index_evtx(self):
+        """Test recording record numbers from EVTX files"""
+        parser = EVTXParser(ignore_bogon=False, index=self.index)
+        parser.parse_file(os.path.join(self.test_data_dir, "System2.evtx"))
+        hits = self.index.query("127.0.0.0/8")
+        self.assertGreater(len(hits), 0)
+        self.assertTrue(all(x["unit"] == "record" for x in hits))
+        self.assertEqual(
+            hits[0]["file"], os.path.join(self.test_data_dir, "System2.evtx")
+        )
+
+    def test_index_xlsx_relative(self):
+        """Test sheets of XLSX files given by relative path are indexed absolutely"""
+        parser = XLSXParser(ignore_bogon=False, index=self.index)
+        cwd = os.getcwd()
+        os.chdir(self.test_data_dir)
+        try:
+            parser.parse_file("test_ips.xlsx")
+        finally:
+            os.chdir(cwd)
+        files = {x["file"] for x in self.index.query("0.0.0.0/0")}
+        self.assertTrue(files)
+        for file_path in files:
+            path, sheet = file_path.rsplit("#", 1)
+            self.assertEqual(path, os.path.join(self.test_data_dir, "test_ips.xlsx"))
+            self.assertTrue(sheet)
+
+        # Indexing again from another directory finds the same entries
+        parser.parse_file(os.path.join(self.test_data_dir, "test_ips.xlsx"))
+        self.assertEqual({x["file"] for x in self.index.query("0.0.0.0/0")}, files)
+
+    def test_query_range(self):
+        """Test querying a CIDR range across address families"""
+        file_id = self.index.add_file("manual.log")
+        self.index.add("10.0.0.1", file_id, 0)
+        self.index.add("10.0.0.200", file_id, 10)
+        self.index.add("10.0.1.1", file_id, 20)
+        self.index.add("2001:db8::1", file_id, 30)
+        self.assertEqual(
+            [x["query"] for x in self.index.query("10.0.0.0/24")],
+            ["10.0.0.1", "10.0.0.200"],
+        )
+        self.assertEqual(len(self.index.query("2001:db8::/32")), 1)
+        self.assertEqual(self.index.query("192.0.2.1"), [])
+
+    def test_query_families(self):
+        """Test IPv4 addresses are not matched by IPv6 ranges"""
+        file_id = self.index.add_file("manual.log")
+        self.index.add("1.1.1.1", file_id, 0)
+        self.index.add("::ffff:1.1.1.1", file_id, 10)
+        self.assertEqual(
+            [x["query"] for x in self.index.query("::/0")], ["::ffff:1.1.1.1"]
+        )
+        self.assertEqual(
+            [x["location"] for x in self.index.query("::ffff:0:0/96")], [10]
+        )
+        self.assertEqual([x["location"] for x in self.index.query("0.0.0.0/0")], [0])
+
+    def test_reindex_changed_file(self):
+        """Test hits of a modified file are replaced when it is indexed again"""
+        file_path = os.path.join(self.tmp_dir.name, "changing.log")
+        with open(file_path, "w") as open_file:
+            open_file.write("first 1.1.1.1\n")
+        parser = PlainTextParser(ignore_bogon=False, index=self.index)
+        parser.parse_file(file_path)
+        parser.parse_file(file_path)
+        self.assertEqual(len(self.index.query("1.1.1.1")), 1)
+
+        with open(file_path, "w") as open_file:
+            open_file.write("then 8.8.8.8\n")
+        os.utime(file_path, (0, 0))
+        parser.parse_file(file_path)
+        self.assertEqual(self.index.query("1.1.1.1"), [])
+        self.assertEqual(len(self.index.query("8.8.8.8")), 1)
+
+    def test_stdin_not_indexed(self):
+        """Test data read from STDIN is not recorded in the index"""
+        parser = PlainTextParser(ignore_bogon=False, index=self.index)
+        parser.parse_file(
+            io.TextIOWrapper(io.StringIO("test 1.1.1.1 ip")), is_stream=True
+        )
+        self.assertIn("1.1.1.1", parser.ips)
+        self.assertEqual(self.index.query("0.0.0.0/0"), [])
+
+    def test_old_schema_rebuilt(self):
+        """Test indexes with an older schema are rebuilt when opened"""
+        index_path = os.path.join(self.tmp_dir.name, "old.idx")
+        conn = sqlite3.connect(index_path)
+        conn.execute("CREATE TABLE hits (addr BLOB, file_id INTEGER, location INTEGER)")
+        conn.execute("INSERT INTO hits VALUES (?, 1, 0)", (b"\x00" * 16,))
+        conn.commit()
+        conn.close()
+        with OccurrenceIndex(index_path) as index:
+            self.assertEqual(index.query("::/0"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
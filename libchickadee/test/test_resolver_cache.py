@@ -0,0 +1,322 @@
+"""Resolution cache tests."""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from libchickadee.resolvers.cache import (
+    MemoryCache,
+    ResolutionCache,
+    ResolutionJournal,
+    default_cache_dir,
+)
+from libchickadee.resolvers.ipapi import Resolver
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class ResolutionCacheTestCase(unittest.TestCase):
+    """Resolution cache tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "cache.sqlite")
+        self.cache = ResolutionCache(self.cache_path)
+        self.key = ("ipapi", "en", "query,country")
+        self.records = [
+            {"query": "1.1.1.1", "country": "Australia", "count": 4},
+            {"query": "8.8.8.8", "country": "United States"},
+            {"query": "2.2.2.2", "status": "failed", "message": "Unknown error"},
+        ]
+
+    def tearDown(self):
+        """Clean up test data"""
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_default_cache_dir(self):
+        """Test the cache location uses the XDG variable when set"""
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name}), patch(
+            "libchickadee.resolvers.cache.sys.platform", "linux"
+        ):
+            self.assertEqual(
+                default_cache_dir(), os.path.join(self.tmp_dir.name, "chickadee")
+            )
+
+    def test_put_get(self):
+        """Test storing records, excluding counts and failures"""
+        self.cache.put_many(self.key, self.records)
+        actual = self.cache.get_many(self.key, ["1.1.1.1", "8.8.8.8", "2.2.2.2"])
+        self.assertDictEqual(
+            actual,
+            {
+                "1.1.1.1": {"query": "1.1.1.1", "country": "Australia"},
+                "8.8.8.8": {"query": "8.8.8.8", "country": "United States"},
+            },
+        )
+        # Different language or fields are cached separately
+        self.assertEqual(
+            self.cache.get_many(("ipapi", "de", "query,country"), ["1.1.1.1"]), {}
+        )
+        self.assertEqual(self.cache.get_many(("ipapi", "en", "query"), ["1.1.1.1"]), {})
+
+    def test_ttl(self):
+        """Test that expired records are ignored and purged"""
+        self.cache.put_many(self.key, self.records)
+        self.cache.ttl = 60
+        with patch(
+            "libchickadee.resolvers.cache.time.time", return_value=time.time() + 120
+        ):
+            self.assertEqual(self.cache.get_many(self.key, ["1.1.1.1"]), {})
+            self.assertEqual(self.cache.purge_expired(), 2)
+
+    def test_ttl_zero(self):
+        """Test that a TTL of 0 ignores every record, and None keeps them"""
+        self.cache.put_many(self.key, self.records)
+        self.cache.ttl = 0
+        self.assertEqual(self.cache.get_many(self.key, ["1.1.1.1"]), {})
+        self.cache.ttl = None
+        with patch(
+            "libchickadee.resolvers.cache.time.time", return_value=time.time() + 10**9
+        ):
+            self.assertIn("1.1.1.1", self.cache.get_many(self.key, ["1.1.1.1"]))
+            self.assertEqual(self.cache.purge_expired(), 0)
+
+    def test_refresh(self):
+        """Test that refreshing skips reads"""
+        self.cache.put_many(self.key, self.records)
+        refresh_cache = ResolutionCache(self.cache_path, refresh=True)
+        self.assertEqual(refresh_cache.get_many(self.key, ["1.1.1.1"]), {})
+        refresh_cache.close()
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.batch")
+    def test_resolver_query(self, mock_batch):
+        """Test that only cache misses are sent to the resolver, in order"""
+        resolver = Resolver(fields=["query", "country"])
+        resolver.cache = self.cache
+        self.cache.put_many(resolver.cache_key(), self.records[:1])
+
+        def batch():
+            """Resolve whatever was passed to the resolver"""
+            return [{"query": ip, "country": "Somewhere"} for ip in resolver.data]
+
+        mock_batch.side_effect = batch
+        actual = resolver.query(["8.8.8.8", "1.1.1.1", "4.4.4.4"])
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual(
+            [x["query"] for x in actual], ["8.8.8.8", "1.1.1.1", "4.4.4.4"]
+        )
+        self.assertEqual(actual[1]["country"], "Australia")
+
+        # All hits, no further requests
+        actual = resolver.query(["4.4.4.4", "1.1.1.1"])
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual([x["query"] for x in actual], ["4.4.4.4", "1.1.1.1"])
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.single")
+    def test_resolver_query_single(self, mock_single):
+        """Test the cache with single queries"""
+        resolver = Resolver(fields=["query", "country"])
+        resolver.cache = self.cache
+        mock_single.return_value = [self.records[1]]
+        self.assertEqual(resolver.query("8.8.8.8"), [self.records[1]])
+        self.assertEqual(resolver.query("8.8.8.8"), [self.records[1]])
+        self.assertEqual(mock_single.call_count, 1)
+
+    @patch("libchickadee.resolvers.ipapi.Resolver._batch_chunk")
+    def test_resolver_aquery(self, mock_chunk):
+        """Test that the async interface only resolves cache misses"""
+        resolver = Resolver(fields=["query", "country"])
+        resolver.cache = self.cache
+        self.cache.put_many(resolver.cache_key(), self.records[:1])
+        mock_chunk.side_effect = lambda chunk, params: [
+            dict(x, country="Somewhere") for x in chunk
+        ]
+
+        actual = asyncio.run(resolver.aquery(["8.8.8.8", "1.1.1.1", "4.4.4.4"]))
+        self.assertEqual(mock_chunk.call_count, 1)
+        self.assertEqual(len(mock_chunk.call_args[0][0]), 2)
+        self.assertEqual(
+            [x["query"] for x in actual], ["8.8.8.8", "1.1.1.1", "4.4.4.4"]
+        )
+        self.assertEqual(actual[1]["country"], "Australia")
+
+
+class MemoryCacheTestCase(unittest.TestCase):
+    """In-memory LRU cache tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.key = ("ipapi", "en", "query,country")
+
+    def test_lru(self):
+        """Test least recently used eviction and counters"""
+        cache = MemoryCache(max_size=2)
+        cache.put_many(self.key, [{"query": "1.1.1.1"}, {"query": "2.2.2.2"}])
+        self.assertEqual(len(cache.get_many(self.key, ["1.1.1.1"])), 1)
+        cache.put_many(self.key, [{"query": "3.3.3.3"}])
+        actual = cache.get_many(self.key, ["1.1.1.1", "2.2.2.2", "3.3.3.3"])
+        self.assertEqual(sorted(actual), ["1.1.1.1", "3.3.3.3"])
+        self.assertDictEqual(
+            cache.stats(),
+            {"hits": 3, "misses": 1, "coalesced": 0, "evictions": 1, "size": 2},
+        )
+
+    def test_copies(self):
+        """Test that callers modifying records do not alter the cache"""
+        cache = MemoryCache()
+        cache.put_many(self.key, [{"query": "1.1.1.1", "count": 3}])
+        record = cache.get_many(self.key, ["1.1.1.1"])["1.1.1.1"]
+        self.assertNotIn("count", record)
+        record["count"] = 5
+        self.assertNotIn("count", cache.get_many(self.key, ["1.1.1.1"])["1.1.1.1"])
+
+    def test_backend(self):
+        """Test reading through to a persistent cache"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = ResolutionCache(os.path.join(tmp_dir, "cache.sqlite"))
+            backend.put_many(self.key, [{"query": "1.1.1.1"}])
+            cache = MemoryCache(backend=backend)
+            self.assertIn("1.1.1.1", cache.get_many(self.key, ["1.1.1.1"]))
+            cache.put_many(self.key, [{"query": "2.2.2.2"}])
+            self.assertIn("2.2.2.2", backend.get_many(self.key, ["2.2.2.2"]))
+            backend.close()
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.batch")
+    def test_coalescing(self, mock_batch):
+        """Test that concurrent requests for the same IP share one request"""
+        cache = MemoryCache()
+        started = threading.Event()
+        release = threading.Event()
+        resolved = []
+
+        def batch():
+            """Block until the second caller is waiting on this request"""
+            started.set()
+            release.wait(5)
+            return [{"query": ip, "country": "Australia"} for ip in ["1.1.1.1"]]
+
+        mock_batch.side_effect = batch
+
+        def worker():
+            """Resolve the same IP from another thread"""
+            resolver = Resolver(fields=["query", "country"])
+            resolver.cache = cache
+            resolved.append(resolver.query(["1.1.1.1"]))
+
+        first = threading.Thread(target=worker)
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=worker)
+        second.start()
+        while cache.stats()["coalesced"] < 1:
+            time.sleep(0.01)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual(len(resolved), 2)
+        self.assertEqual(resolved[0], resolved[1])
+        self.assertEqual(cache.stats()["coalesced"], 1)
+
+
+class ResolutionJournalTestCase(unittest.TestCase):
+    """Resolution journal tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.tmp_dir.name, "job.journal")
+        self.key = ("ipapi", "en", "query,country")
+
+    def tearDown(self):
+        """Clean up test data"""
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        """Test that journaled records are read by a later run"""
+        journal = ResolutionJournal(self.journal_path)
+        journal.put_many(
+            self.key,
+            [
+                {"query": "1.1.1.1", "country": "Australia", "count": 2},
+                {"query": "2.2.2.2", "status": "skipped"},
+            ],
+        )
+        journal.close()
+        # Simulate a write interrupted part way through a line
+        with open(self.journal_path, "a") as open_file:
+            open_file.write('{"key": ["ipapi", "en"')
+
+        with self.assertLogs("libchickadee.resolvers.cache", level="WARNING"):
+            journal = ResolutionJournal(self.journal_path)
+        self.assertEqual(len(journal), 1)
+        self.assertEqual(
+            journal.get_many(self.key, ["1.1.1.1", "2.2.2.2"]),
+            {"1.1.1.1": {"query": "1.1.1.1", "country": "Australia"}},
+        )
+        self.assertEqual(journal.get_many(("ipapi", "de", ""), ["1.1.1.1"]), {})
+        journal.put_many(self.key, [{"query": "2.2.2.2", "country": "France"}])
+        journal.close()
+
+        with open(self.journal_path) as open_file:
+            self.assertEqual(len(open_file.readlines()), 2)
+        journal = ResolutionJournal(self.journal_path)
+        self.assertEqual(len(journal), 2)
+        journal.close()
+
+    def test_backend(self):
+        """Test that records found in the backend are journaled"""
+        backend = MemoryCache()
+        backend.put_many(self.key, [{"query": "1.1.1.1", "country": "Australia"}])
+        journal = ResolutionJournal(self.journal_path, backend)
+        self.assertIn("1.1.1.1", journal.get_many(self.key, ["1.1.1.1"]))
+        journal.put_many(self.key, [{"query": "2.2.2.2"}])
+        self.assertIn("2.2.2.2", backend.get_many(self.key, ["2.2.2.2"]))
+        journal.close()
+        self.assertEqual(len(ResolutionJournal(self.journal_path)), 2)
+
+    @patch("libchickadee.resolvers.ipapi.Resolver.batch")
+    def test_interrupted_stream(self, mock_batch):
+        """Test that a resumed stream matches an uninterrupted one"""
+        ips = [f"10.0.0.{x}" for x in range(1, 6)]
+        resolver = Resolver(fields=["query", "country"])
+        resolver.stream_size = 2
+        interrupt = []
+
+        def batch():
+            """Resolve the IPs, failing on the last chunk when interrupted"""
+            if "10.0.0.5" in resolver.data and interrupt:
+                raise ConnectionError()
+            return [{"query": ip, "country": "Somewhere"} for ip in resolver.data]
+
+        mock_batch.side_effect = batch
+        expected = list(resolver.iquery(ips))
+
+        resolver.cache = ResolutionJournal(self.journal_path)
+        streamed = []
+        interrupt.append(True)
+        with self.assertRaises(ConnectionError):
+            for record in resolver.iquery(ips):
+                streamed.append(record)
+        resolver.cache.close()
+        self.assertEqual(streamed, expected[:4])
+
+        interrupt.clear()
+        resolver.cache = ResolutionJournal(self.journal_path)
+        self.assertEqual(list(resolver.iquery(ips)), expected)
+        self.assertEqual(mock_batch.call_count, 7)
+        self.assertEqual(resolver.data, ["10.0.0.5"])
+        resolver.cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
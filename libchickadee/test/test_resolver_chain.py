@@ -0,0 +1,119 @@
+"""Chain Resolver Tests."""
+import asyncio
+import unittest
+
+from libchickadee.resolvers import ResolverBase, ipapi
+from libchickadee.resolvers.chain import ChainResolver
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class StaticResolver(ResolverBase):
+    """Resolver answering from a dictionary of records."""
+
+    def __init__(self, records, fields):
+        """Set the records to answer with"""
+        super().__init__()
+        self.records = records
+        self.fields = fields
+        self.queried = []
+
+    def batch(self):
+        """Return the known records, or a failure"""
+        self.queried += self.data
+        return [
+            dict(
+                self.records.get(ip, {"status": "fail", "message": "No record found"}),
+                query=ip,
+            )
+            for ip in self.data
+        ]
+
+
+class ChainResolverTestCase(unittest.TestCase):
+    """Chain resolver tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.local = StaticResolver(
+            {
+                "1.1.1.1": {"as": "AS13335", "city": "Sydney", "status": "success"},
+                "8.8.8.8": {"as": "AS15169", "city": None, "status": "success"},
+            },
+            ["query", "as", "city", "status", "message"],
+        )
+        self.remote = StaticResolver(
+            {
+                "8.8.8.8": {"as": "AS15169 GOOGLE", "city": "Mountain View"},
+                "9.9.9.9": {"as": "AS19281", "city": "Berkeley"},
+            },
+            ["query", "as", "city", "country"],
+        )
+
+    def test_query(self):
+        """Test that only IPs without data are sent to the next tier"""
+        resolver = ChainResolver([self.local, self.remote])
+        actual = resolver.query(["1.1.1.1", "8.8.8.8", "9.9.9.9", "10.0.0.1"])
+        self.assertEqual(
+            actual,
+            [
+                {
+                    "as": "AS13335",
+                    "city": "Sydney",
+                    "status": "success",
+                    "query": "1.1.1.1",
+                },
+                {
+                    "as": "AS15169",
+                    "city": None,
+                    "status": "success",
+                    "query": "8.8.8.8",
+                },
+                {"as": "AS19281", "city": "Berkeley", "query": "9.9.9.9"},
+                {"status": "fail", "message": "No record found", "query": "10.0.0.1"},
+            ],
+        )
+        self.assertEqual(self.remote.queried, ["9.9.9.9", "10.0.0.1"])
+        self.assertEqual(
+            resolver.fields, ["query", "as", "city", "status", "message", "country"]
+        )
+
+    def test_required_fields(self):
+        """Test that IPs missing a requested field are sent to the next tier"""
+        resolver = ChainResolver([self.local, self.remote], fields=["query", "city"])
+        actual = resolver.query(["1.1.1.1", "8.8.8.8"])
+        self.assertEqual(actual[1]["as"], "AS15169")
+        self.assertEqual(actual[1]["city"], "Mountain View")
+        self.assertEqual(actual[1]["status"], "success")
+        self.assertEqual(self.remote.queried, ["8.8.8.8"])
+        self.assertEqual(resolver.stats, {"test_resolver_chain": 3})
+
+    def test_default_fields(self):
+        """Test that tiers without requested fields contribute their defaults"""
+        resolver = ChainResolver([self.local, ipapi.Resolver()])
+        self.assertEqual(
+            resolver.fields,
+            ["query", "as", "city", "status", "message"]
+            + [x for x in ipapi.DEFAULT_FIELDS if x not in self.local.fields],
+        )
+        self.assertIn("country", resolver.fields)
+
+    def test_aquery(self):
+        """Test async resolution through the chain"""
+        resolver = ChainResolver([self.local, self.remote])
+        actual = asyncio.run(resolver.aquery(["9.9.9.9", "1.1.1.1"]))
+        self.assertEqual([x["as"] for x in actual], ["AS19281", "AS13335"])
+        self.assertEqual(self.local.queried, ["9.9.9.9", "1.1.1.1"])
+        self.assertEqual(self.remote.queried, ["9.9.9.9"])
+
+    def test_no_resolvers(self):
+        """Test that at least one resolver is required"""
+        with self.assertRaises(ValueError):
+            ChainResolver([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""JSON Codec Tests."""
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from libchickadee.resolvers import ResolverBase, codec
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class CodecTestCase(unittest.TestCase):
+    """JSON codec tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.record = {"query": "1.1.1.1", "regionName": "Île-de-France", "count": 2}
+        self.encoded = (
+            '{"query":"1.1.1.1","regionName":"Île-de-France","count":2}'.encode()
+        )
+        # Output of the standard library, as written by earlier versions
+        self.stdlib_encoded = json.dumps(self.record).encode()
+
+    def backends(self):
+        """Run each subtest with orjson, if installed, and with the stdlib.
+
+        Yields the backend name and its patch.
+        """
+        yield "json", patch("libchickadee.resolvers.codec.orjson", None)
+        if codec.orjson is not None:
+            yield "orjson", patch("libchickadee.resolvers.codec.orjson", codec.orjson)
+
+    def test_round_trip(self):
+        """Test each codec encodes and decodes records"""
+        for name, backend in self.backends():
+            with self.subTest(backend=name), backend:
+                self.assertEqual(codec.backend(), name)
+                self.assertEqual(codec.dumps(self.record), self.stdlib_encoded)
+                self.assertEqual(codec.dumps(self.record, compact=True), self.encoded)
+                self.assertEqual(codec.dumps([1], newline=True), b"[1]\n")
+                self.assertEqual(json.loads(codec.dumps({1: "a"})), {"1": "a"})
+                self.assertEqual(codec.loads(self.stdlib_encoded), self.record)
+                self.assertEqual(codec.loads(self.encoded), self.record)
+                with self.assertRaises(ValueError):
+                    codec.loads(b"{")
+
+    @unittest.skipUnless(codec.orjson, "orjson is not installed")
+    def test_backends_match(self):
+        """Test both libraries write the same bytes for the same records"""
+        records = [
+            self.record,
+            {"query": "8.8.8.8", "lat": 37.751, "lon": -97.822, "proxy": False},
+            {"query": "2001:db8::1", "org": None, "as": "AS0 \u4f8b \U0001f426"},
+            {"query": "1.1.1.2", "raw": {"detected_urls": [{"positives": 1}]}},
+        ]
+        for compact in (False, True):
+            written = {}
+            for name, backend in self.backends():
+                with backend:
+                    for lines in (False, True):
+                        outfile = io.BytesIO()
+                        ResolverBase.write_json(
+                            outfile, iter(records), lines=lines, compact=compact
+                        )
+                        written[name, lines] = outfile.getvalue()
+            with self.subTest(compact=compact):
+                self.assertEqual(written["orjson", False], written["json", False])
+                self.assertEqual(written["orjson", True], written["json", True])
+
+    def test_response_json(self):
+        """Test decoding response bodies"""
+        for name, backend in self.backends():
+            with self.subTest(backend=name), backend:
+                response = MagicMock()
+                response.content = self.encoded
+                response.json.return_value = self.record
+                self.assertEqual(codec.response_json(response), self.record)
+
+        # Mocked responses without a body are decoded by the response
+        response = MagicMock()
+        response.json.return_value = {"query": "8.8.8.8"}
+        self.assertEqual(codec.response_json(response), {"query": "8.8.8.8"})
+
+    def test_byte_writer(self):
+        """Test writing bytes to binary and text files"""
+        binary = io.BytesIO()
+        codec.byte_writer(binary)(self.encoded)
+        self.assertEqual(binary.getvalue(), self.encoded)
+
+        text = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        text.write("[")
+        codec.byte_writer(text)(self.encoded)
+        text.write("]")
+        text.flush()
+        self.assertEqual(text.buffer.getvalue(), b"[" + self.encoded + b"]")
+
+        text = io.StringIO()
+        codec.byte_writer(text)(self.encoded)
+        self.assertEqual(text.getvalue(), self.encoded.decode())
+
+    def test_write_json(self):
+        """Test writing compact reports to text streams"""
+        for name, backend in self.backends():
+            with self.subTest(backend=name), backend:
+                outfile = io.StringIO()
+                ResolverBase.write_json(
+                    outfile, [self.record] * 2, lines=True, compact=True
+                )
+                self.assertEqual(
+                    outfile.getvalue(), (self.encoded + b"\n").decode() * 2
+                )
+
+                outfile = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+                ResolverBase.write_json(outfile, iter([self.record] * 2), compact=True)
+                self.assertEqual(
+                    outfile.buffer.getvalue(),
+                    b"[" + self.encoded + b"," + self.encoded + b"]",
+                )
+
+    def test_write_json_unchanged(self):
+        """Test reports are written as earlier versions did by default"""
+        for name, backend in self.backends():
+            with self.subTest(backend=name), backend:
+                outfile = io.StringIO()
+                ResolverBase.write_json(outfile, iter([self.record] * 2))
+                self.assertEqual(outfile.getvalue(), json.dumps([self.record] * 2))
+
+                outfile = io.StringIO()
+                ResolverBase.write_json(outfile, [self.record], lines=True)
+                self.assertEqual(outfile.getvalue(), json.dumps(self.record) + "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
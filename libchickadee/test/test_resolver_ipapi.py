@@ -1,13 +1,18 @@
 """IP-API Resolver Tests."""
+import asyncio
 import csv
 import json
 import os
+import random
+import threading
+import time
 import unittest
 from collections import OrderedDict
 from datetime import datetime
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
-from libchickadee.resolvers.ipapi import Resolver
+from libchickadee.resolvers.ipapi import RATE_LIMIT_ATTEMPTS, ProResolver, Resolver
+from libchickadee.resolvers.retry import RetryPolicy
 
 __author__ = "Chapin Bryce"
 __date__ = 20200114
@@ -56,6 +61,7 @@ class IPAPITestCase(unittest.TestCase):
         self.resolver = Resolver(
             fields=["query", "count", "as", "country", "org", "proxy"]
         )
+        self.resolver.session = MagicMock()
 
     @patch("libchickadee.resolvers.ipapi.Resolver.single")
     def test_ipapi_resolve_query_single(self, mock_query):
@@ -74,9 +80,9 @@ class IPAPITestCase(unittest.TestCase):
         batch_result = list(self.expected_result)
         self.assertCountEqual(res, batch_result)
 
-    @patch("libchickadee.resolvers.ipapi.requests.get")
-    def test_ipapi_resolve_single(self, mock_query):
+    def test_ipapi_resolve_single(self):
         """Single Query Method Test"""
+        mock_query = self.resolver.session.get
         for count, ip in enumerate(self.test_data_ips):
             mock_query.return_value = MockResponse(
                 json_data=self.expected_result[count], status_code=200
@@ -85,9 +91,9 @@ class IPAPITestCase(unittest.TestCase):
             data = self.resolver.single()
             self.assertEqual(data, [self.expected_result[count]])
 
-    @patch("libchickadee.resolvers.ipapi.requests.post")
-    def test_ipapi_resolve_batch(self, mock_query):
+    def test_ipapi_resolve_batch(self):
         """Batch Query Method Test"""
+        mock_query = self.resolver.session.post
         mock_query.return_value = MockResponse(
             json_data=self.expected_result, status_code=200
         )
@@ -113,10 +119,10 @@ class IPAPITestCase(unittest.TestCase):
 
             self.assertEqual(data, expected)
 
-    @patch("libchickadee.resolvers.ipapi.requests.get")
-    @patch("libchickadee.resolvers.ipapi.requests.post")
-    def test_ipapi_rate_limiting(self, mock_get, mock_post):
+    def test_ipapi_rate_limiting(self):
         """Validate the handling for rate limiting"""
+        mock_get = self.resolver.session.get
+        mock_post = self.resolver.session.post
         single = {
             "test_data": self.test_data_ips[1],
             "expected_data": [self.expected_result[1]],
@@ -147,6 +153,165 @@ class IPAPITestCase(unittest.TestCase):
             self.assertTrue(delta.total_seconds() > 1)
             self.assertEqual(data, test["expected_data"])
 
+    def test_ipapi_rate_limit_chunk_retry(self):
+        """Validate that a rate limited chunk is retried alone"""
+        ips = [f"1.1.1.{x}" for x in range(250)]
+        responses = iter(
+            [
+                MockResponse(json_data=None, status_code=200),
+                MockResponse(json_data={}, status_code=429, rl="0", ttl="0"),
+                MockResponse(json_data=None, status_code=200),
+                MockResponse(json_data=None, status_code=200),
+            ]
+        )
+        sent = []
+
+        def post(url, json, params, timeout):
+            """Echo the chunk back, after the next scripted status"""
+            sent.append(json[0]["query"])
+            response = next(responses)
+            response.json_data = json
+            return response
+
+        self.resolver.session.post.side_effect = post
+        self.resolver.batch_limiter.buffer = 0
+        actual = self.resolver.query(ips)
+        self.assertEqual([x["query"] for x in actual], ips)
+        self.assertEqual(sent, ["1.1.1.0", "1.1.1.100", "1.1.1.100", "1.1.1.200"])
+
+    @patch("libchickadee.resolvers.ipapi.time.sleep")
+    def test_ipapi_rate_limit_bounded(self, mock_sleep):
+        """Validate that rate limited requests without headers are not retried forever"""
+        response = MockResponse(json_data={}, status_code=429)
+        response.headers = {}
+        self.resolver.session.post.return_value = response
+        self.resolver.session.get.return_value = response
+        for ips in [["1.1.1.1", "8.8.8.8"], "1.1.1.1"]:
+            self.resolver.session.post.reset_mock()
+            self.resolver.session.get.reset_mock()
+            actual = self.resolver.query(ips)
+            self.assertEqual(
+                {(x["status"], x["message"]) for x in actual},
+                {("failed", f"Rate limited after {RATE_LIMIT_ATTEMPTS} attempts")},
+            )
+            sent = self.resolver.session.post.call_count
+            sent += self.resolver.session.get.call_count
+            self.assertEqual(sent, RATE_LIMIT_ATTEMPTS)
+        self.assertEqual(mock_sleep.call_count, (RATE_LIMIT_ATTEMPTS - 1) * 2)
+
+    def test_session_reuse(self):
+        """Validate that requests share the resolver's pooled session"""
+        resolver = Resolver()
+        session = resolver.session
+        self.assertIs(session, resolver.session)
+        adapter = session.get_adapter("http://ip-api.com/batch")
+        self.assertEqual(adapter._pool_maxsize, resolver.pool_size)
+        resolver.close()
+        self.assertIsNot(session, resolver.session)
+
+
+class ProResolverTestCase(unittest.TestCase):
+    """IP-API Pro Resolver Tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.resolver = ProResolver("not-a-key", fields=["query"], max_workers=4)
+        self.resolver.session = MagicMock()
+        self.resolver.retry = RetryPolicy(base_delay=0)
+        self.ips = [f"1.1.{x // 256}.{x % 256}" for x in range(1000)]
+
+    def test_concurrent_batch(self):
+        """Validate that concurrent batches return results in order"""
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def post(url, json, params, timeout):
+            """Return the chunk after a random delay, tracking concurrency"""
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(random.uniform(0, 0.05))  # nosec
+            with lock:
+                in_flight.pop()
+            if json[0]["query"] == self.ips[300]:
+                return MockResponse(json_data={}, status_code=500)
+            self.assertEqual(params["key"], "not-a-key")
+            return MockResponse(json_data=json, status_code=200)
+
+        self.resolver.session.post.side_effect = post
+        actual = self.resolver.query(self.ips)
+
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        # The failing chunk is sent once, then retried 3 times
+        self.assertEqual(self.resolver.session.post.call_count, 13)
+        self.assertEqual(self.resolver.retry.stats()["retries"], 3)
+        self.assertLessEqual(max(peak), 4)
+        self.assertGreater(max(peak), 1)
+        # The failed chunk is reported without affecting the others
+        self.assertEqual(actual[299].get("status"), None)
+        self.assertEqual(actual[300]["status"], "failed")
+        self.assertEqual(actual[399]["status"], "failed")
+        self.assertEqual(actual[400].get("status"), None)
+
+    def test_concurrent_single(self):
+        """Validate concurrent single lookups without shared resolver state"""
+
+        def get(url, params, timeout):
+            """Return a record for the IP in the URL after a random delay"""
+            time.sleep(random.uniform(0, 0.01))  # nosec
+            return MockResponse({"query": url.rsplit("/", 1)[-1]}, status_code=200)
+
+        self.resolver.session.get.side_effect = get
+        actual = self.resolver.query(self.ips[:50], force_single=True)
+        self.assertEqual([x["query"] for x in actual], self.ips[:50])
+        self.assertIsNone(self.resolver.session.post.call_args)
+
+    def test_aquery(self):
+        """Validate the async interface returns batch and single results in order"""
+
+        def post(url, json, params, timeout):
+            """Return the chunk after a random delay"""
+            time.sleep(random.uniform(0, 0.02))  # nosec
+            return MockResponse(json_data=json, status_code=200)
+
+        def get(url, params, timeout):
+            """Return a record for the IP in the URL"""
+            return MockResponse({"query": url.rsplit("/", 1)[-1]}, status_code=200)
+
+        self.resolver.session.post.side_effect = post
+        self.resolver.session.get.side_effect = get
+        actual = asyncio.run(self.resolver.aquery(self.ips))
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        self.assertEqual(self.resolver.session.post.call_count, 10)
+
+        actual = asyncio.run(self.resolver.aquery(self.ips[:20], force_single=True))
+        self.assertEqual([x["query"] for x in actual], self.ips[:20])
+        actual = asyncio.run(self.resolver.aquery(self.ips[0]))
+        self.assertEqual(actual, [{"query": self.ips[0]}])
+
+    def test_aquery_timeout(self):
+        """Validate that requests not yet sent are abandoned on timeout"""
+
+        def post(url, json, params, timeout):
+            """Respond slowly"""
+            time.sleep(0.2)
+            return MockResponse(json_data=json, status_code=200)
+
+        self.resolver.session.post.side_effect = post
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.resolver.aquery(self.ips, timeout=0.1))
+        time.sleep(0.3)
+        # Only the first round of concurrent requests was sent
+        self.assertEqual(self.resolver.session.post.call_count, 4)
+
+    def test_free_resolver_sequential(self):
+        """Validate that the rate limited resolver does not send concurrently"""
+        resolver = Resolver()
+        resolver.max_workers = 4
+        self.assertEqual(resolver.worker_count(), 1)
+        self.assertEqual(self.resolver.worker_count(), 4)
+
 
 class WritersTestCase(unittest.TestCase):
     """Test writer functionality"""
@@ -188,6 +353,13 @@ class WritersTestCase(unittest.TestCase):
         rec["none"] = None
         self.assertDictEqual(rec, read_data[0])
 
+    def test_write_json_iterator(self):
+        """Test writing records from a generator to a JSON file"""
+        Resolver.write_json(self.testfile, (x for x in self.data * 2), ["a"])
+        self.open_file = open("testfile")
+        read_data = json.load(self.open_file)
+        self.assertEqual(read_data, [{"a": "1"}, {"a": "1"}])
+
     def test_write_json_lines(self):
         """Test writing information to a JSON file with one object per line"""
         Resolver.write_json(self.testfile, self.data, lines=True)
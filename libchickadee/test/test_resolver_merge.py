@@ -0,0 +1,123 @@
+"""Merge Resolver Tests."""
+import asyncio
+import time
+import unittest
+
+from libchickadee.resolvers import ResolverBase
+from libchickadee.resolvers.merge import MergeResolver
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class StaticResolver(ResolverBase):
+    """Resolver answering from a dictionary of records, after a delay."""
+
+    def __init__(self, records, fields, delay=0.0):
+        """Set the records to answer with"""
+        super().__init__()
+        self.records = records
+        self.fields = fields
+        self.delay = delay
+        self.queried = []
+
+    def batch(self):
+        """Return the known records, or a failure"""
+        time.sleep(self.delay)
+        self.queried.append(list(self.data))
+        return [
+            dict(
+                self.records.get(ip, {"status": "fail", "message": "No record found"}),
+                query=ip,
+            )
+            for ip in self.data
+        ]
+
+
+class MergeResolverTestCase(unittest.TestCase):
+    """Merge resolver tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.ipapi = StaticResolver(
+            {
+                "1.1.1.1": {"as": "AS13335", "country": "Australia"},
+                "8.8.8.8": {"as": "AS15169", "country": "United States"},
+            },
+            ["query", "count", "as", "country", "status"],
+            delay=0.3,
+        )
+        self.vt = StaticResolver(
+            {"8.8.8.8": {"asn": "AS15169 GOOGLE", "detected_url_count": 3}},
+            ["query", "count", "asn", "detected_url_count"],
+            delay=0.3,
+        )
+        self.resolver = MergeResolver({"ip_api": self.ipapi, "virustotal": self.vt})
+
+    def test_query(self):
+        """Test every resolver resolves every IP once, concurrently"""
+        start = time.time()
+        actual = self.resolver.query(["1.1.1.1", "8.8.8.8", "1.1.1.1"])
+        self.assertLess(time.time() - start, 0.55)
+        self.assertEqual(self.ipapi.queried, [["1.1.1.1", "8.8.8.8"]])
+        self.assertEqual(self.vt.queried, [["1.1.1.1", "8.8.8.8"]])
+        self.assertEqual(
+            actual,
+            [
+                {
+                    "query": "1.1.1.1",
+                    "ip_api.as": "AS13335",
+                    "ip_api.country": "Australia",
+                    "virustotal.status": "fail",
+                    "virustotal.message": "No record found",
+                },
+                {
+                    "query": "8.8.8.8",
+                    "ip_api.as": "AS15169",
+                    "ip_api.country": "United States",
+                    "virustotal.asn": "AS15169 GOOGLE",
+                    "virustotal.detected_url_count": 3,
+                },
+            ],
+        )
+        self.assertEqual(
+            self.resolver.fields,
+            [
+                "query",
+                "count",
+                "ip_api.as",
+                "ip_api.country",
+                "ip_api.status",
+                "virustotal.asn",
+                "virustotal.detected_url_count",
+            ],
+        )
+
+    def test_iquery(self):
+        """Test streaming merged records in chunks"""
+        self.ipapi.delay = self.vt.delay = 0
+        self.ipapi.stream_size = 1
+        self.vt.stream_size = 2
+        actual = list(self.resolver.iquery(["8.8.8.8", "1.1.1.1", "9.9.9.9"]))
+        self.assertEqual(
+            [x["query"] for x in actual], ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+        )
+        self.assertEqual(self.vt.queried, [["8.8.8.8", "1.1.1.1"], ["9.9.9.9"]])
+        self.assertEqual(actual[2]["ip_api.status"], "fail")
+
+    def test_aquery(self):
+        """Test async resolution with every resolver"""
+        actual = asyncio.run(self.resolver.aquery(["8.8.8.8"]))
+        self.assertEqual(actual[0]["ip_api.as"], "AS15169")
+        self.assertEqual(actual[0]["virustotal.asn"], "AS15169 GOOGLE")
+
+    def test_no_resolvers(self):
+        """Test that at least one resolver is required"""
+        with self.assertRaises(ValueError):
+            MergeResolver({})
+
+
+if __name__ == "__main__":
+    unittest.main()
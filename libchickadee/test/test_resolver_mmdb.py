@@ -0,0 +1,293 @@
+"""MMDB Resolver Tests."""
+import os
+import struct
+import tempfile
+import unittest
+
+from netaddr import IPNetwork
+
+from libchickadee.resolvers.mmdb import (
+    METADATA_MARKER,
+    InvalidDatabaseError,
+    MMDBReader,
+    Resolver,
+)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+def control(type_num, size):
+    """Build the control bytes for a type and size."""
+    if size < 29:
+        size_bits, extra = size, b""
+    elif size < 285:
+        size_bits, extra = 29, bytes([size - 29])
+    else:
+        size_bits, extra = 30, (size - 285).to_bytes(2, "big")
+    if type_num <= 7:
+        return bytes([(type_num << 5) | size_bits]) + extra
+    return bytes([size_bits, type_num - 7]) + extra
+
+
+def encode(value):
+    """Encode a value in the MaxMind DB data section format."""
+    if isinstance(value, dict):
+        return control(7, len(value)) + b"".join(
+            encode(k) + encode(v) for k, v in value.items()
+        )
+    if isinstance(value, list):
+        return control(11, len(value)) + b"".join(encode(x) for x in value)
+    if isinstance(value, str):
+        raw = value.encode("utf-8")
+        return control(2, len(raw)) + raw
+    if isinstance(value, bool):
+        return control(14, int(value))
+    if isinstance(value, float):
+        return control(3, 8) + struct.pack(">d", value)
+    if isinstance(value, int) and value < 0:
+        return control(8, 4) + struct.pack(">i", value)
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return control(6 if value < 2**32 else 9, len(raw)) + raw
+
+
+def build_tree(networks, ip_version):
+    """Build the search tree nodes and data section for networks.
+
+    Returns:
+        (tuple): Nodes, as pairs of child node numbers or ``("data", offset)``
+            entries, and the encoded data section.
+    """
+    nodes = [[None, None]]
+    data = b""
+    total = 128 if ip_version == 6 else 32
+    for cidr, record in networks.items():
+        network = IPNetwork(cidr)
+        bits = network.prefixlen
+        if ip_version == 6 and network.version == 4:
+            bits += 96
+        offset = len(data)
+        data += encode(record)
+        node = 0
+        for depth in range(bits - 1):
+            bit = (network.first >> (total - 1 - depth)) & 1
+            if nodes[node][bit] is None:
+                nodes.append([None, None])
+                nodes[node][bit] = len(nodes) - 1
+            node = nodes[node][bit]
+        nodes[node][(network.first >> (total - bits)) & 1] = ("data", offset)
+    return nodes, data
+
+
+def pack_node(left, right, record_size):
+    """Pack the left and right record values of a search tree node."""
+    if record_size == 24:
+        return left.to_bytes(3, "big") + right.to_bytes(3, "big")
+    if record_size == 28:
+        middle = ((left >> 24) << 4) | (right >> 24)
+        return (
+            (left & 0xFFFFFF).to_bytes(3, "big")
+            + bytes([middle])
+            + (right & 0xFFFFFF).to_bytes(3, "big")
+        )
+    return left.to_bytes(4, "big") + right.to_bytes(4, "big")
+
+
+def write_mmdb(path, networks, record_size=24, ip_version=6):
+    """Write a MaxMind DB file mapping networks to records.
+
+    Args:
+        path (str): Output path.
+        networks (dict): CIDR strings mapped to record dictionaries.
+        record_size (int): Search tree record size in bits.
+        ip_version (int): 4 or 6. IPv4 networks are stored in ``::/96`` of
+            IPv6 trees.
+    """
+    nodes, data = build_tree(networks, ip_version)
+    node_count = len(nodes)
+
+    def record_value(entry):
+        """Convert a tree entry to its record value."""
+        if entry is None:
+            return node_count
+        if isinstance(entry, tuple):
+            return node_count + 16 + entry[1]
+        return entry
+
+    tree = b"".join(
+        pack_node(record_value(left), record_value(right), record_size)
+        for left, right in nodes
+    )
+    metadata = {
+        "node_count": node_count,
+        "record_size": record_size,
+        "ip_version": ip_version,
+        "database_type": "Test",
+        "languages": ["en", "de"],
+        "binary_format_major_version": 2,
+        "binary_format_minor_version": 0,
+        "build_epoch": 1685577600,
+        "description": {"en": "Test database"},
+    }
+    with open(path, "wb") as open_file:
+        open_file.write(tree + b"\x00" * 16 + data + METADATA_MARKER + encode(metadata))
+
+
+CITY = {
+    "1.1.1.0/24": {
+        "continent": {"code": "OC", "names": {"en": "Oceania", "de": "Ozeanien"}},
+        "country": {"iso_code": "AU", "names": {"en": "Australia"}},
+        "city": {"names": {"en": "Sydney"}},
+        "location": {
+            "latitude": -33.8688,
+            "longitude": 151.209,
+            "time_zone": "Australia/Sydney",
+        },
+        "subdivisions": [{"iso_code": "NSW", "names": {"en": "New South Wales"}}],
+        "postal": {"code": "2000"},
+    },
+    "2001:4860::/32": {
+        "country": {"iso_code": "US", "names": {"en": "United States"}},
+        "traits": {"is_anonymous_proxy": False},
+    },
+}
+
+ASN = {
+    "1.1.1.0/24": {
+        "autonomous_system_number": 13335,
+        "autonomous_system_organization": "CLOUDFLARENET",
+    },
+    "8.8.8.0/24": {
+        "autonomous_system_number": 15169,
+        "autonomous_system_organization": "GOOGLE",
+    },
+}
+
+
+class MMDBReaderTestCase(unittest.TestCase):
+    """MaxMind DB reader tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove test databases"""
+        self.tmp_dir.cleanup()
+
+    def test_record_sizes(self):
+        """Test reading each supported record size"""
+        for record_size in (24, 28, 32):
+            with self.subTest(record_size=record_size):
+                path = os.path.join(self.tmp_dir.name, f"{record_size}.mmdb")
+                write_mmdb(path, CITY, record_size=record_size)
+                reader = MMDBReader(path)
+                self.assertEqual(reader.metadata["database_type"], "Test")
+                record = reader.get("1.1.1.1")
+                self.assertEqual(record["country"]["iso_code"], "AU")
+                self.assertEqual(record["location"]["latitude"], -33.8688)
+                self.assertEqual(
+                    reader.get("2001:4860:4860::8888")["country"]["iso_code"], "US"
+                )
+                self.assertIsNone(reader.get("8.8.8.8"))
+                self.assertIsNone(reader.get("2002::1"))
+                reader.close()
+
+    def test_ipv4_database(self):
+        """Test an IPv4 only database"""
+        path = os.path.join(self.tmp_dir.name, "asn.mmdb")
+        write_mmdb(path, ASN, ip_version=4)
+        reader = MMDBReader(path)
+        self.assertEqual(reader.get("8.8.8.8")["autonomous_system_number"], 15169)
+        self.assertIsNone(reader.get("2001:4860:4860::8888"))
+        reader.close()
+
+    def test_record_cache(self):
+        """Test that decoded records are cached up to the configured size"""
+        path = os.path.join(self.tmp_dir.name, "city.mmdb")
+        write_mmdb(path, CITY)
+        reader = MMDBReader(path, cache_size=1)
+        au = reader.get("1.1.1.1")
+        self.assertIs(reader.get("1.1.1.2"), au)
+        us = reader.get("2001:4860:4860::8888")
+        self.assertEqual(len(reader._records), 1)
+        self.assertIs(reader.get("2001:4860:4860::8844"), us)
+        self.assertEqual(reader.get("1.1.1.1"), au)
+        reader.close()
+
+    def test_invalid_database(self):
+        """Test that other files are rejected"""
+        path = os.path.join(self.tmp_dir.name, "invalid.mmdb")
+        with open(path, "wb") as open_file:
+            open_file.write(b"\x00" * 1024)
+        with self.assertRaises(InvalidDatabaseError):
+            MMDBReader(path)
+
+
+class MMDBResolverTestCase(unittest.TestCase):
+    """MaxMind DB resolver tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.city_path = os.path.join(self.tmp_dir.name, "city.mmdb")
+        self.asn_path = os.path.join(self.tmp_dir.name, "asn.mmdb")
+        write_mmdb(self.city_path, CITY)
+        write_mmdb(self.asn_path, ASN, record_size=28)
+        self.resolver = Resolver(f"{self.city_path},{self.asn_path}")
+
+    def tearDown(self):
+        """Remove test databases"""
+        self.resolver.close()
+        self.tmp_dir.cleanup()
+
+    def test_query(self):
+        """Test resolving with the ip-api field names"""
+        actual = self.resolver.query(["1.1.1.1", "8.8.8.8", "10.0.0.1", "invalid"])
+        self.assertEqual(
+            actual[0],
+            {
+                "query": "1.1.1.1",
+                "count": None,
+                "as": "AS13335 CLOUDFLARENET",
+                "org": "CLOUDFLARENET",
+                "isp": "CLOUDFLARENET",
+                "continent": "Oceania",
+                "country": "Australia",
+                "regionName": "New South Wales",
+                "city": "Sydney",
+                "zip": "2000",
+                "lat": -33.8688,
+                "lon": 151.209,
+                "timezone": "Australia/Sydney",
+                "status": "success",
+                "message": None,
+            },
+        )
+        self.assertEqual(actual[1]["as"], "AS15169 GOOGLE")
+        self.assertIsNone(actual[1]["country"])
+        self.assertEqual(actual[2]["status"], "fail")
+        self.assertEqual(actual[2]["message"], "No record found")
+        self.assertEqual(actual[3]["message"], "Invalid IP address")
+
+    def test_fields_and_lang(self):
+        """Test selecting fields and the language of place names"""
+        resolver = Resolver(
+            [self.city_path], fields=["query", "continent", "countryCode"], lang="de"
+        )
+        self.assertEqual(
+            resolver.query("1.1.1.1"),
+            [{"query": "1.1.1.1", "continent": "Ozeanien", "countryCode": "AU"}],
+        )
+        resolver.close()
+
+    def test_no_database(self):
+        """Test that a database path is required"""
+        with self.assertRaises(ValueError):
+            Resolver("")
+
+
+if __name__ == "__main__":
+    unittest.main()
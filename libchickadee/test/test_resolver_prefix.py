@@ -0,0 +1,154 @@
+"""Prefix Resolver Tests."""
+import asyncio
+import unittest
+
+from libchickadee.resolvers import ResolverBase
+from libchickadee.resolvers.prefix import PrefixResolver, parse_granularity
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class EchoResolver(ResolverBase):
+    """Resolver returning the IP address queried."""
+
+    def __init__(self, fields):
+        """Set the fields to return"""
+        super().__init__()
+        self.fields = fields
+        self.queried = []
+
+    def batch(self):
+        """Return a record per IP"""
+        self.queried += self.data
+        return [
+            {k: v for k, v in {"query": ip, "resolved": ip}.items() if k in self.fields}
+            for ip in self.data
+        ]
+
+
+class PrefixResolverTestCase(unittest.TestCase):
+    """Prefix resolver tests."""
+
+    def test_query(self):
+        """Test that one IP per prefix is resolved and copied to the others"""
+        inner = EchoResolver(["query", "resolved"])
+        resolver = PrefixResolver(inner, ipv4_prefix=24, ipv6_prefix=64)
+        actual = resolver.query(
+            ["10.0.0.2", "10.0.1.1", "10.0.0.1", "2001:db8::1", "2001:db8::2", "bad"]
+        )
+        self.assertEqual(inner.queried, ["10.0.0.2", "10.0.1.1", "2001:db8::1", "bad"])
+        self.assertEqual(
+            actual,
+            [
+                {"query": "10.0.0.2", "resolved": "10.0.0.2", "inferred_from": None},
+                {"query": "10.0.1.1", "resolved": "10.0.1.1", "inferred_from": None},
+                {
+                    "query": "10.0.0.1",
+                    "resolved": "10.0.0.2",
+                    "inferred_from": "10.0.0.2",
+                },
+                {
+                    "query": "2001:db8::1",
+                    "resolved": "2001:db8::1",
+                    "inferred_from": None,
+                },
+                {
+                    "query": "2001:db8::2",
+                    "resolved": "2001:db8::1",
+                    "inferred_from": "2001:db8::1",
+                },
+                {"query": "bad", "resolved": "bad", "inferred_from": None},
+            ],
+        )
+        self.assertEqual(resolver.fields, ["query", "resolved", "inferred_from"])
+
+    def test_aquery_without_query_field(self):
+        """Test fan out of records lacking the query field"""
+        inner = EchoResolver(["resolved"])
+        resolver = PrefixResolver(inner, ipv4_prefix=16)
+        actual = asyncio.run(resolver.aquery(["10.0.0.1", "10.0.1.1", "10.1.0.1"]))
+        self.assertEqual(
+            actual,
+            [
+                {"resolved": "10.0.0.1", "inferred_from": None},
+                {"resolved": "10.0.0.1", "inferred_from": "10.0.0.1"},
+                {"resolved": "10.1.0.1", "inferred_from": None},
+            ],
+        )
+
+    def test_iquery(self):
+        """Test streaming records, grouped by prefix"""
+        inner = EchoResolver(["query", "resolved"])
+        inner.stream_size = 1
+        resolver = PrefixResolver(inner)
+        stream = resolver.iquery(["10.0.0.1", "10.0.1.1", "10.0.0.2"])
+        self.assertEqual(
+            [next(stream), next(stream)],
+            [
+                {"query": "10.0.0.1", "resolved": "10.0.0.1", "inferred_from": None},
+                {
+                    "query": "10.0.0.2",
+                    "resolved": "10.0.0.1",
+                    "inferred_from": "10.0.0.1",
+                },
+            ],
+        )
+        self.assertEqual(inner.queried, ["10.0.0.1"])
+        self.assertEqual(next(stream)["query"], "10.0.1.1")
+        self.assertEqual(inner.queried, ["10.0.0.1", "10.0.1.1"])
+
+    def test_per_ip_fields(self):
+        """Test that fields describing the resolved IP address are not copied"""
+        inner = EchoResolver(["query"])
+        inner.batch = lambda: [
+            {
+                "query": ip,
+                "as": "AS13335",
+                "reverse": "one.one.one.one",
+                "proxy": False,
+                "mobile": True,
+                "ip_api.hosting": True,
+                "virustotal.detected_urls": ["http://1.1.1.1/"],
+            }
+            for ip in inner.data
+        ]
+        resolver = PrefixResolver(inner)
+        actual = resolver.query(["1.1.1.1", "1.1.1.2"])
+        self.assertEqual(actual[0]["reverse"], "one.one.one.one")
+        self.assertTrue(actual[0]["mobile"])
+        self.assertTrue(actual[0]["ip_api.hosting"])
+        self.assertEqual(
+            actual[1],
+            {
+                "query": "1.1.1.2",
+                "as": "AS13335",
+                "reverse": None,
+                "proxy": None,
+                "mobile": None,
+                "ip_api.hosting": None,
+                "virustotal.detected_urls": None,
+                "inferred_from": "1.1.1.1",
+            },
+        )
+
+    def test_iquery_without_query_field(self):
+        """Test that streamed records are only matched to a prefix by query"""
+        inner = EchoResolver(["resolved"])
+        resolver = PrefixResolver(inner)
+        actual = list(resolver.iquery(["10.0.0.1", "10.0.0.2"]))
+        self.assertEqual(actual, [{"resolved": "10.0.0.1", "inferred_from": None}])
+
+    def test_parse_granularity(self):
+        """Test parsing prefix lengths"""
+        self.assertEqual(parse_granularity("24"), (24, 48))
+        self.assertEqual(parse_granularity(" 16, 64"), (16, 64))
+        for value in ("", "24,48,64", "33", "24,129", "-1", "a"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_granularity(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
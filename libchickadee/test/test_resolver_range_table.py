@@ -0,0 +1,176 @@
+"""Range Table Resolver Tests."""
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from libchickadee.resolvers.range_table import (
+    InvalidTableError,
+    RangeTable,
+    Resolver,
+    np,
+)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+IP2ASN = (
+    "1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n"
+    "1.0.1.0\t1.0.3.255\t0\tNone\tNot routed\n"
+    "1.1.1.0\t1.1.1.255\t13335\tUS\tCLOUDFLARENET\n"
+    "8.8.8.0\t8.8.8.255\t15169\tUS\tGOOGLE\n"
+    "2001:4860::\t2001:4860:ffff:ffff:ffff:ffff:ffff:ffff\t15169\tUS\tGOOGLE\n"
+)
+
+IP2LOCATION = (
+    '"0","16777215","-","-","-","-"\n'
+    '"16843008","16843263","AU","Australia","Queensland","Brisbane"\n'
+    '"134744064","134744319","US","United States of America","California",'
+    '"Mountain View"\n'
+)
+
+
+@unittest.skipUnless(np, "NumPy is not installed")
+class RangeTableTestCase(unittest.TestCase):
+    """Range table loading tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.ip2asn_path = os.path.join(self.tmp_dir.name, "ip2asn-combined.tsv.gz")
+        with gzip.open(self.ip2asn_path, "wt") as open_file:
+            open_file.write(IP2ASN)
+
+    def tearDown(self):
+        """Remove test tables"""
+        self.tmp_dir.cleanup()
+
+    def test_lookup(self):
+        """Test looking up IPv4, IPv6, and unmatched addresses"""
+        table = RangeTable.load(self.ip2asn_path, self.cache_dir)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(
+            table.lookup(
+                ["1.1.1.1", "1.0.2.1", "2001:4860:4860::8888", "::ffff:8.8.4.4", "x"]
+            ),
+            [
+                {"asn": "13335", "countryCode": "US", "asname": "CLOUDFLARENET"},
+                None,
+                {"asn": "15169", "countryCode": "US", "asname": "GOOGLE"},
+                None,
+                None,
+            ],
+        )
+
+    def test_binary_cache(self):
+        """Test that loaded tables are cached until the dataset changes"""
+        RangeTable.load(self.ip2asn_path, self.cache_dir)
+        cached = os.listdir(self.cache_dir)
+        self.assertEqual(len(cached), 1)
+        self.assertTrue(cached[0].startswith("ip2asn-"))
+        self.assertTrue(cached[0].endswith(".npz"))
+
+        with gzip.open(self.ip2asn_path, "wt") as open_file:
+            open_file.write(IP2ASN.replace("GOOGLE", "EXAMPLE"))
+        table = RangeTable.load(self.ip2asn_path, self.cache_dir)
+        self.assertEqual(table.lookup(["8.8.8.8"])[0]["asname"], "EXAMPLE")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        cache_path = os.path.join(self.cache_dir, cached[0])
+        with open(cache_path, "wb") as open_file:
+            open_file.write(b"not a cache")
+        self.assertIsNone(RangeTable.from_cache(cache_path, "source"))
+
+    def test_invalid_table(self):
+        """Test that other files are rejected"""
+        path = os.path.join(self.tmp_dir.name, "invalid.csv")
+        with open(path, "w") as open_file:
+            open_file.write("ip_from,ip_to,country_code\n")
+        with self.assertRaises(InvalidTableError):
+            RangeTable.load(path, False)
+
+
+@unittest.skipUnless(np, "NumPy is not installed")
+class RangeTableResolverTestCase(unittest.TestCase):
+    """Range table resolver tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ip2asn_path = os.path.join(self.tmp_dir.name, "ip2asn-v4.tsv")
+        self.ip2location_path = os.path.join(self.tmp_dir.name, "IP2LOCATION.CSV")
+        with open(self.ip2asn_path, "w") as open_file:
+            open_file.write(IP2ASN)
+        with open(self.ip2location_path, "w") as open_file:
+            open_file.write(IP2LOCATION)
+        self.resolver = Resolver(
+            f"{self.ip2asn_path},{self.ip2location_path}", cache_dir=False
+        )
+
+    def tearDown(self):
+        """Remove test tables"""
+        self.tmp_dir.cleanup()
+
+    def test_query(self):
+        """Test resolving with the ip-api field names"""
+        actual = self.resolver.query(
+            ["1.1.1.1", "8.8.8.8", "10.0.0.1", "invalid", "1.1.1.2"]
+        )
+        self.assertEqual(
+            actual[0],
+            {
+                "query": "1.1.1.1",
+                "count": None,
+                "as": "AS13335 CLOUDFLARENET",
+                "org": "CLOUDFLARENET",
+                "isp": "CLOUDFLARENET",
+                "country": "Australia",
+                "countryCode": "US",
+                "regionName": "Queensland",
+                "city": "Brisbane",
+                "zip": None,
+                "lat": None,
+                "lon": None,
+                "timezone": None,
+                "status": "success",
+                "message": None,
+            },
+        )
+        self.assertEqual(actual[1]["city"], "Mountain View")
+        self.assertEqual(actual[2]["status"], "fail")
+        self.assertEqual(actual[2]["message"], "No record found")
+        self.assertEqual(actual[3]["message"], "Invalid IP address")
+        self.assertEqual(actual[4]["query"], "1.1.1.2")
+        self.assertIsNot(actual[0], actual[4])
+
+    def test_fields(self):
+        """Test selecting fields"""
+        resolver = Resolver(
+            [self.ip2asn_path], fields=["as", "countryCode"], cache_dir=False
+        )
+        self.assertEqual(
+            resolver.query(["8.8.8.8", "2001:4860::1"]),
+            [
+                {"as": "AS15169 GOOGLE", "countryCode": "US"},
+                {"as": "AS15169 GOOGLE", "countryCode": "US"},
+            ],
+        )
+
+    def test_no_table(self):
+        """Test that a dataset path is required"""
+        with self.assertRaises(ValueError):
+            Resolver("")
+
+    def test_numpy_missing(self):
+        """Test that a missing NumPy names the extra to install"""
+        with patch("libchickadee.resolvers.range_table.np", None):
+            with self.assertRaisesRegex(ImportError, r"chickadee\[range-table\]"):
+                RangeTable.load(self.ip2asn_path, cache_dir=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
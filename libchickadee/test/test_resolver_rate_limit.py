@@ -0,0 +1,114 @@
+"""Rate Limiter Tests."""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from libchickadee.resolvers.ipapi import ProResolver, Resolver
+from libchickadee.resolvers.rate_limit import (
+    RateLimiter,
+    SharedRateLimiter,
+    quota_name,
+)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    """Token bucket rate limiter tests."""
+
+    def test_window(self):
+        """Test that requests wait once the window's quota is used"""
+        limiter = RateLimiter(3, 0.5, buffer=0)
+        start = time.time()
+        for _ in range(3):
+            self.assertEqual(limiter.acquire(), 0)
+        self.assertLess(time.time() - start, 0.1)
+        self.assertGreater(limiter.acquire(), 0.3)
+        self.assertEqual(limiter.tokens, 2)
+
+    def test_update(self):
+        """Test synchronising the limiter with the data source's quota"""
+        limiter = RateLimiter(15, 60, buffer=0.25)
+        limiter.update(remaining=0, reset=0)
+        waited = limiter.acquire()
+        self.assertGreater(waited, 0.2)
+        self.assertEqual(limiter.tokens, 14)
+
+        limiter.update(remaining=2, reset=30)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(limiter.tokens, 0)
+        self.assertGreater(limiter.reset_at - time.time(), 29)
+
+
+class SharedRateLimiterTestCase(unittest.TestCase):
+    """Cross-process rate limiter tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the state files"""
+        self.tmp_dir.cleanup()
+
+    def test_shared_quota(self):
+        """Test that separate limiters draw from the same quota"""
+        limiters = [
+            SharedRateLimiter("test", 10, 60, state_dir=self.tmp_dir.name)
+            for _ in range(2)
+        ]
+        threads = [threading.Thread(target=limiters[x % 2].acquire) for x in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        # A new limiter, as from another process, sees the quota is used
+        limiter = SharedRateLimiter("test", 10, 60, state_dir=self.tmp_dir.name)
+        with limiter._state():
+            self.assertEqual(limiter.tokens, 0)
+
+        # And its updates are seen by the others
+        limiter.update(5, 60)
+        self.assertEqual(limiters[0].acquire(), 0)
+        self.assertEqual(limiters[1].acquire(), 0)
+        with open(limiter.state_path) as open_file:
+            self.assertIn('"tokens": 3', open_file.read())
+
+    def test_corrupt_state(self):
+        """Test that unreadable state is replaced"""
+        limiter = SharedRateLimiter("test", 5, 60, state_dir=self.tmp_dir.name)
+        with open(limiter.state_path, "w") as open_file:
+            open_file.write("{not json")
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.tokens, 4)
+
+    def test_quota_name(self):
+        """Test that secrets are not used in state file names"""
+        self.assertEqual(quota_name("ip-api-batch"), "ip-api-batch")
+        name = quota_name("virustotal", "secret-key")
+        self.assertTrue(name.startswith("virustotal-"))
+        self.assertNotIn("secret-key", name)
+        self.assertNotEqual(name, quota_name("virustotal", "other-key"))
+
+    def test_resolver_share_limits(self):
+        """Test that only rate limited resolvers use shared limits"""
+        resolver = Resolver()
+        resolver.share_limits(self.tmp_dir.name)
+        self.assertIsInstance(resolver.batch_limiter, SharedRateLimiter)
+        self.assertEqual(
+            os.path.dirname(resolver.single_limiter.state_path), self.tmp_dir.name
+        )
+        resolver = ProResolver("not-a-key")
+        resolver.share_limits(self.tmp_dir.name)
+        self.assertIsNone(resolver.batch_limiter)
+
+
+if __name__ == "__main__":
+    unittest.main()
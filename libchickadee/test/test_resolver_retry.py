@@ -0,0 +1,141 @@
+"""Retry Policy Tests."""
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from libchickadee.resolvers.ipapi import ProResolver
+from libchickadee.resolvers.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestFailed,
+    RetryPolicy,
+)
+from libchickadee.resolvers.virustotal import ProResolver as VTProResolver
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+def response(status_code, json_data=None):
+    """Build a mock response with a status code"""
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json = lambda: json_data
+    return resp
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    """Retry policy tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.policy = RetryPolicy(max_attempts=3, base_delay=0)
+
+    def test_retry_status(self):
+        """Test that server errors are retried until a response succeeds"""
+        send = MagicMock(side_effect=[response(503), response(500), response(200)])
+        self.assertEqual(self.policy.call(send).status_code, 200)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(
+            self.policy.stats(),
+            {
+                "requests": 3,
+                "retries": 2,
+                "failures": 2,
+                "gave_up": 0,
+                "rejected": 0,
+                "opened": 0,
+            },
+        )
+
+    def test_give_up(self):
+        """Test that attempts are bounded"""
+        send = MagicMock(return_value=response(502))
+        with self.assertLogs("libchickadee.resolvers.retry", level="ERROR"):
+            self.assertEqual(self.policy.call(send).status_code, 502)
+        self.assertEqual(send.call_count, 3)
+
+        self.policy.breaker.record_success()
+        send = MagicMock(side_effect=requests.ConnectionError("reset"))
+        with self.assertLogs("libchickadee.resolvers.retry", level="ERROR"):
+            with self.assertRaises(RequestFailed):
+                self.policy.call(send)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(self.policy.stats()["gave_up"], 2)
+
+    def test_backoff(self):
+        """Test that the backoff grows exponentially, with jitter, to a limit"""
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        with patch("libchickadee.resolvers.retry.random.uniform") as mock_uniform:
+            mock_uniform.side_effect = lambda low, high: high
+            self.assertEqual([policy.backoff(x) for x in range(1, 5)], [1, 2, 4, 5])
+
+    def test_circuit_breaker(self):
+        """Test that requests are rejected while the circuit is open"""
+        policy = RetryPolicy(max_attempts=2, base_delay=0, failure_threshold=3)
+        send = MagicMock(side_effect=requests.Timeout())
+        with self.assertLogs("libchickadee.resolvers.retry", level="WARNING"):
+            with self.assertRaises(RequestFailed):
+                policy.call(send)
+            with self.assertRaises(CircuitOpenError) as opened:
+                policy.call(send)
+            with self.assertRaises(CircuitOpenError) as rejected:
+                policy.call(send)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(opened.exception.attempts, 1)
+        self.assertEqual(rejected.exception.attempts, 0)
+        self.assertEqual(policy.stats()["opened"], 1)
+        self.assertEqual(policy.stats()["rejected"], 2)
+
+    def test_half_open(self):
+        """Test that a trial request closes or reopens the circuit"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # One trial at a time
+        self.assertTrue(breaker.record_failure())
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+
+class ResolverRetryTestCase(unittest.TestCase):
+    """Resolver error handling tests."""
+
+    def test_ipapi_network_error(self):
+        """Test that network errors are reported as failed records"""
+        resolver = ProResolver("not-a-key", fields=["query"])
+        resolver.retry = RetryPolicy(max_attempts=2, base_delay=0)
+        resolver.session = MagicMock()
+        resolver.session.post.side_effect = requests.ConnectionError("reset")
+        resolver.session.get.side_effect = [
+            requests.Timeout(),
+            response(200, {"query": "1.1.1.1"}),
+        ]
+        with self.assertLogs("libchickadee.resolvers.retry", level="ERROR"):
+            actual = resolver.query(["1.1.1.1", "2.2.2.2"])
+        self.assertEqual([x["status"] for x in actual], ["failed", "failed"])
+        self.assertEqual(resolver.session.post.call_count, 2)
+        self.assertEqual(resolver.query("1.1.1.1"), [{"query": "1.1.1.1"}])
+
+    def test_virustotal_rate_limit(self):
+        """Test that repeated 204 responses are retried a bounded number of times"""
+        resolver = VTProResolver("not-a-key")
+        resolver.retry = RetryPolicy(max_attempts=3, base_delay=0)
+        resolver.session = MagicMock()
+        resolver.session.get.return_value = response(204)
+        resolver.pool.keys[0].limiter.update = MagicMock()
+        with self.assertLogs("libchickadee.resolvers.virustotal", level="ERROR"):
+            actual = resolver.query("1.1.1.1")
+        self.assertEqual(actual[0]["status"], "failed")
+        self.assertEqual(resolver.session.get.call_count, 3)
+        self.assertEqual(resolver.retry.stats()["rate_limited"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+"""Reverse DNS Resolver Tests."""
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from libchickadee.resolvers import ResolverBase
+from libchickadee.resolvers.cache import MemoryCache
+from libchickadee.resolvers.prefix import PrefixResolver
+from libchickadee.resolvers.reverse_dns import (
+    REVERSE_FIELD,
+    ReverseDNSResolver,
+    system_lookup,
+)
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class CountryResolver(ResolverBase):
+    """Resolver returning a country per IP, recording the IPs queried"""
+
+    def __init__(self):
+        """Set defaults"""
+        super().__init__()
+        self.fields = ["query", "country"]
+        self.queried = []
+
+    def batch(self):
+        """Return a record per IP"""
+        self.queried += self.data
+        return [{"query": x, "country": "Australia"} for x in self.data]
+
+
+class FakeDNS:
+    """Injectable lookup answering from a dictionary, after a delay"""
+
+    def __init__(self, hostnames, delay=0.0):
+        """Set the hostnames to answer with"""
+        self.hostnames = hostnames
+        self.delay = delay
+        self.looked_up = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ip):
+        """Look up an IP address, tracking concurrent lookups"""
+        with self._lock:
+            self.looked_up.append(ip)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.hostnames.get(ip, {}).get("delay", self.delay))
+        with self._lock:
+            self.active -= 1
+        if ip not in self.hostnames:
+            return ""
+        if "error" in self.hostnames[ip]:
+            raise self.hostnames[ip]["error"]
+        return self.hostnames[ip]["name"]
+
+
+class ReverseDNSResolverTestCase(unittest.TestCase):
+    """Reverse DNS resolver tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.dns = FakeDNS(
+            {
+                "1.1.1.1": {"name": "one.one.one.one"},
+                "8.8.8.8": {"name": "dns.google"},
+                "9.9.9.9": {"name": "dns9.quad9.net", "delay": 1.0},
+                "10.0.0.1": {"error": OSError("Resolver failure")},
+            },
+            delay=0.1,
+        )
+        self.inner = CountryResolver()
+        self.resolver = ReverseDNSResolver(self.inner, lookup=self.dns, timeout=0.5)
+
+    def test_query(self):
+        """Test hostnames are added while the wrapped resolver runs"""
+        start = time.time()
+        actual = self.resolver.query(["1.1.1.1", "8.8.8.8", "2.2.2.2", "10.0.0.1"])
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(self.dns.peak, 4)
+        self.assertEqual(
+            actual,
+            [
+                {
+                    "query": "1.1.1.1",
+                    "country": "Australia",
+                    "reverse": "one.one.one.one",
+                },
+                {"query": "8.8.8.8", "country": "Australia", "reverse": "dns.google"},
+                {"query": "2.2.2.2", "country": "Australia", "reverse": ""},
+                {"query": "10.0.0.1", "country": "Australia", "reverse": None},
+            ],
+        )
+        self.assertEqual(self.resolver.fields, ["query", "country", REVERSE_FIELD])
+
+    def test_timeout(self):
+        """Test slow lookups are abandoned, and not cached"""
+        start = time.time()
+        actual = self.resolver.query(["9.9.9.9", "1.1.1.1"])
+        self.assertLess(time.time() - start, 0.9)
+        self.assertEqual([x["reverse"] for x in actual], [None, "one.one.one.one"])
+
+        self.dns.looked_up.clear()
+        self.resolver.query(["9.9.9.9", "1.1.1.1"])
+        self.assertEqual(self.dns.looked_up, ["9.9.9.9"])
+
+    def test_cache(self):
+        """Test hostnames are cached, until they expire"""
+        self.resolver.query(["1.1.1.1", "2.2.2.2"])
+        self.dns.looked_up.clear()
+        actual = self.resolver.query(["1.1.1.1", "2.2.2.2"])
+        self.assertEqual(self.dns.looked_up, [])
+        self.assertEqual([x["reverse"] for x in actual], ["one.one.one.one", ""])
+        self.assertEqual(self.inner.queried, ["1.1.1.1", "2.2.2.2"] * 2)
+
+        expired = time.time() + 3601
+        with patch("libchickadee.resolvers.cache.time.time", return_value=expired):
+            self.resolver.query(["1.1.1.1"])
+        self.assertEqual(self.dns.looked_up, ["1.1.1.1"])
+
+    def test_backend(self):
+        """Test hostnames are read from and written to a persistent cache"""
+        backend = MemoryCache()
+        resolver = ReverseDNSResolver(self.inner, lookup=self.dns, cache=backend)
+        self.assertIsNone(resolver.cache)  # Records are not cached
+        resolver.query(["8.8.8.8"])
+        resolver = ReverseDNSResolver(self.inner, lookup=self.dns, cache=backend)
+        self.dns.looked_up.clear()
+        self.assertEqual(resolver.query(["8.8.8.8"])[0]["reverse"], "dns.google")
+        self.assertEqual(self.dns.looked_up, [])
+
+    def test_iquery(self):
+        """Test lookups are started ahead of streamed records"""
+        ips = [f"192.0.{x // 256}.{x % 256}" for x in range(300)]
+        self.dns.delay = 0.0
+        self.resolver.lookup_workers = 4
+        stream = self.resolver.iquery(ips)
+        first = next(stream)
+        self.assertEqual(
+            first, {"query": ips[0], "country": "Australia", "reverse": ""}
+        )
+        # The first two chunks are looked up before the second is resolved
+        self.assertLessEqual(len(self.dns.looked_up), 200)
+        self.assertEqual([x["query"] for x in stream], ips[1:])
+        self.assertCountEqual(self.dns.looked_up, ips)
+
+    def test_iquery_prefix(self):
+        """Test lookups of every IP address when resolving by prefix"""
+        self.dns.delay = 0.0
+        resolver = ReverseDNSResolver(
+            PrefixResolver(self.inner, 24), lookup=self.dns, timeout=0.5
+        )
+        actual = list(resolver.iquery(["1.1.1.1", "8.8.8.8", "1.1.1.2"]))
+        self.assertEqual(self.inner.queried, ["1.1.1.1", "8.8.8.8"])
+        self.assertEqual(
+            [(x["query"], x["inferred_from"], x["reverse"]) for x in actual],
+            [
+                ("1.1.1.1", None, "one.one.one.one"),
+                ("1.1.1.2", "1.1.1.1", ""),
+                ("8.8.8.8", None, "dns.google"),
+            ],
+        )
+
+    def test_aquery(self):
+        """Test async resolution with hostnames"""
+        actual = asyncio.run(self.resolver.aquery(["8.8.8.8", "1.1.1.1"]))
+        self.assertEqual(
+            [x["reverse"] for x in actual], ["dns.google", "one.one.one.one"]
+        )
+
+    def test_wrapped_reverse(self):
+        """Test IPs with hostnames from the wrapped resolver are not looked up"""
+        self.inner.fields = ["query", "country", "reverse"]
+        self.inner.batch = lambda: [
+            {"query": "1.1.1.1", "reverse": "resolved.example"},
+            {"query": "8.8.8.8", "status": "fail"},
+        ]
+        resolver = ReverseDNSResolver(self.inner, lookup=self.dns, timeout=0.5)
+        self.assertFalse(resolver.eager)
+        actual = resolver.query(["1.1.1.1", "8.8.8.8"])
+        self.assertEqual(self.dns.looked_up, ["8.8.8.8"])
+        self.assertEqual(
+            [x["reverse"] for x in actual], ["resolved.example", "dns.google"]
+        )
+
+    def test_hung_lookups(self):
+        """Test lookups are skipped while every thread is held by a hung lookup"""
+        release = threading.Event()
+
+        def hung(ip):
+            """Hang until released"""
+            release.wait(5)
+            return ""
+
+        resolver = ReverseDNSResolver(
+            self.inner, lookup=hung, timeout=0.1, max_workers=1
+        )
+        try:
+            actual = resolver.query(["192.0.2.1"])
+            self.assertEqual(actual[0]["reverse"], None)
+            start = time.time()
+            actual = resolver.query(["1.1.1.1"])
+            self.assertLess(time.time() - start, 0.1)
+            self.assertEqual(actual[0]["reverse"], None)
+            self.assertTrue(
+                all(x.daemon for x in threading.enumerate() if x.name == "reverse-dns")
+            )
+        finally:
+            release.set()
+
+    def test_system_lookup(self):
+        """Test lookups with the system resolver"""
+        with patch("socket.gethostbyaddr") as mock_lookup:
+            mock_lookup.return_value = ("one.one.one.one", [], ["1.1.1.1"])
+            self.assertEqual(system_lookup("1.1.1.1"), "one.one.one.one")
+            mock_lookup.side_effect = socket.herror(1, "Unknown host")
+            self.assertEqual(system_lookup("192.0.2.1"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,21 @@
 import datetime
 import json
 import os
+import tempfile
 import time
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
-from libchickadee.resolvers.virustotal import ProResolver
+from libchickadee.resolvers.rate_limit import RateLimiter, RequestBudget
+from libchickadee.resolvers.retry import RetryPolicy
+from libchickadee.resolvers.virustotal import (
+    DAILY_LIMIT,
+    FIELDS,
+    NON_DEFAULT_FIELDS,
+    RAW_FIELD,
+    KeyPool,
+    ProResolver,
+)
 
 __author__ = "Chapin Bryce"
 __date__ = 20200805
@@ -37,7 +47,12 @@ class IPAPITestCase(unittest.TestCase):
                 "query": "2001:4860:4860::8888",
             },
         ]
-        self.resolver = ProResolver(api_key="")
+        self.resolver = ProResolver(
+            api_key="not-a-key",
+            fields=FIELDS + NON_DEFAULT_FIELDS + ["continent", "whois"],
+        )
+        self.resolver.session = MagicMock()
+        self.resolver.retry = RetryPolicy(base_delay=0)
         local_dir = os.path.abspath(__file__).rsplit(os.sep, 1)[0]
         resource_file = open(os.path.join(local_dir, "vt_resp_data.json"))
         self.vt_rep_data_list = json.load(resource_file)
@@ -59,9 +74,28 @@ class IPAPITestCase(unittest.TestCase):
         vt_values = self.resolver.parse_vt_resp(query, vt_resp_data)
         self.assertDictEqual(expected, vt_values)
 
-    @patch("libchickadee.resolvers.virustotal.requests.get")
-    def test_resolve_single(self, mock_requests):
+    def test_parse_vt_resp_fields(self):
+        """Confirm only the requested fields are extracted."""
+        vt_resp_data = self.vt_rep_data_list["Test0"]["test"]
+        query = self.vt_rep_data_list["Test0"]["query"]
+        expected = self.vt_rep_data_list["Test0"]["expected"]
+        self.resolver.fields = FIELDS
+        self.resolver._extract_resolutions = MagicMock()
+        vt_values = self.resolver.parse_vt_resp(query, vt_resp_data)
+        self.assertEqual(list(vt_values), FIELDS)
+        self.assertDictEqual({k: expected[k] for k in FIELDS}, vt_values)
+        self.resolver._extract_resolutions.assert_not_called()
+
+        self.resolver.fields = ["query", "asn", RAW_FIELD]
+        vt_values = self.resolver.parse_vt_resp(query, vt_resp_data)
+        self.assertEqual(vt_values[RAW_FIELD], vt_resp_data)
+        self.assertEqual(
+            sorted(vt_values), ["asn", "message", "query", RAW_FIELD, "status"]
+        )
+
+    def test_resolve_single(self):
         """Test the resolution processing of a single item."""
+        mock_requests = self.resolver.session.get
 
         def mock_json():
             """Return a mocked JSON value from the request"""
@@ -74,9 +108,9 @@ class IPAPITestCase(unittest.TestCase):
         self.assertEqual(1, len(actual))
         self.assertDictEqual(expected, actual[0])
 
-    @patch("libchickadee.resolvers.virustotal.requests.get")
-    def test_resolve_batch(self, mock_requests):
+    def test_resolve_batch(self):
         """Test the resolution processing of a multiple items."""
+        mock_requests = self.resolver.session.get
         # Build 3 requests
         req1 = MagicMock()
         req1.status_code = 200
@@ -103,38 +137,153 @@ class IPAPITestCase(unittest.TestCase):
         self.assertDictEqual(self.vt_rep_data_list["Test0"]["expected"], actual[0])
         self.assertDictEqual(self.vt_rep_data_list["Test1"]["expected"], actual[1])
 
-    @patch("libchickadee.resolvers.virustotal.requests.get")
-    def test_resolve_errors(self, mock_requests):
+    def test_resolve_errors(self):
         """Testing error handling of the resolver."""
+        mock_requests = self.resolver.session.get
         subtests = {
             400: "Incorrect request. Please check input data",
             403: "Authorization error. Please check API key",
             500: "Unknown error occurred, status code 500, please report",
         }
+        self.resolver.pool.keys[0].limiter = RateLimiter(10, 1, buffer=0)
+        query = self.vt_rep_data_list["Test0"]["query"]
         for status_code, err_msg in subtests.items():
             mock_requests.return_value.status_code = status_code
             with self.subTest(id=status_code):
                 with self.assertLogs(
                     "libchickadee.resolvers.virustotal", level="ERROR"
                 ) as mock_log:
-                    actual = self.resolver.query(
-                        self.vt_rep_data_list["Test0"]["query"]
-                    )
-                self.assertIsNone(actual)
-                self.assertEqual(mock_log.records[0].message, err_msg)
-
-    @patch("libchickadee.resolvers.virustotal.requests.get")
-    def test_sleeper(self, mock_requests):
-        """Validate that the sleep timer works appropriately for rate limiting"""
-        initial_time = datetime.datetime.now()
-        self.resolver.last_request = initial_time
-        time.sleep(2)
-        mock_requests.return_value.status_code = 403
-
-        self.resolver.query(data="1.1.1.1")
-        self.assertGreaterEqual(
-            self.resolver.last_request, initial_time + datetime.timedelta(seconds=2)
+                    actual = self.resolver.query(query)
+                self.assertEqual(
+                    actual, [{"query": query, "status": "failed", "message": err_msg}]
+                )
+                self.assertEqual(mock_log.records[0].message, f"{err_msg}: {query}")
+
+                actual = self.resolver.query(["1.1.1.1", "1.1.1.2"])
+                self.assertEqual([x["query"] for x in actual], ["1.1.1.1", "1.1.1.2"])
+                self.assertEqual([x["status"] for x in actual], ["failed"] * 2)
+
+    def test_key_pacing(self):
+        """Validate that requests are paced by the rate limiter of their key"""
+        self.resolver.pool.keys[0].limiter = RateLimiter(2, 0.5, buffer=0)
+        mock_requests = self.resolver.session.get
+        mock_requests.return_value.status_code = 200
+        mock_requests.return_value.json.return_value = {"response_code": 0}
+
+        start = time.time()
+        actual = self.resolver.query(["1.1.1.1", "1.1.1.2", "1.1.1.3"])
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        self.assertEqual(mock_requests.call_count, 3)
+        self.assertEqual(
+            [x["query"] for x in actual], ["1.1.1.1", "1.1.1.2", "1.1.1.3"]
+        )
+
+
+class KeyPoolTestCase(unittest.TestCase):
+    """VirusTotal API key pool tests."""
+
+    def setUp(self):
+        """Test config"""
+        self.resolver = ProResolver(api_key="key-1, key-2,key-3,key-1")
+        self.resolver.session = MagicMock()
+        self.ips = [f"1.1.1.{x}" for x in range(12)]
+
+        def get(uri, params, timeout):
+            """Return an empty report, after a short delay"""
+            time.sleep(0.05)
+            resp = MagicMock()
+            resp.status_code = 200
+            resp.json = lambda: {"response_code": 1}
+            return resp
+
+        self.resolver.session.get.side_effect = get
+
+    def test_key_parsing(self):
+        """Test the parsing of provided API keys"""
+        self.assertEqual(
+            [x.value for x in self.resolver.pool.keys], ["key-1", "key-2", "key-3"]
         )
+        self.assertEqual(len(KeyPool(["key-1"])), 1)
+        with self.assertRaises(ValueError):
+            KeyPool(" , ")
+
+    def test_concurrent_keys(self):
+        """Test that requests are spread across the keys concurrently"""
+        start = time.time()
+        actual = self.resolver.query(self.ips)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        used = [
+            call.kwargs["params"]["apikey"]
+            for call in self.resolver.session.get.call_args_list
+        ]
+        self.assertEqual(sorted(set(used)), ["key-1", "key-2", "key-3"])
+        self.assertEqual([x.used()["day"] for x in self.resolver.pool.keys], [4, 4, 4])
+
+    def test_exhausted_keys(self):
+        """Test that keys are rotated out once their quota is used"""
+        self.resolver.pool.keys[0].daily_limit = 1
+        self.resolver.pool.keys[1].monthly_limit = 0
+        self.resolver.pool.keys[2].daily_limit = 3
+        actual = self.resolver.query(self.ips[:5])
+        self.assertEqual([x["query"] for x in actual], self.ips[:5])
+        self.assertEqual([x["status"] for x in actual].count("skipped"), 1)
+        self.assertEqual(len(self.resolver.pool.active()), 0)
+
+    def test_budget(self):
+        """Test that requests stop once the budget is spent, keeping results"""
+        budget = RequestBudget(5)
+        self.resolver.set_budget(budget)
+        actual = self.resolver.query(self.ips)
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        self.assertEqual(self.resolver.session.get.call_count, 5)
+        self.assertEqual(budget.sent, 5)
+        skipped = [x for x in actual if x["status"] == "skipped"]
+        self.assertEqual(len(skipped), 7)
+        self.assertEqual(skipped[0]["message"], "Skipped, request budget of 5 reached")
+
+    def test_budget_before_token(self):
+        """Test an exhausted budget does not take rate limit tokens"""
+        pool = KeyPool(["key-1"])
+        pool.keys[0].limiter = RateLimiter(1, 60, buffer=0)
+        pool.budget = RequestBudget(0)
+        self.assertIsNone(pool.acquire())
+        self.assertEqual(pool.skip_reason(), "Skipped, request budget of 0 reached")
+
+        pool.budget = RequestBudget(2)
+        self.assertIs(pool.acquire(), pool.keys[0])
+        pool.keys[0].daily_limit = 1
+        self.assertIsNone(pool.acquire())
+        self.assertEqual(pool.budget.sent, 1)
+        self.assertEqual(pool.keys[0].used()["day"], 1)
+
+    def test_circuit_open_not_charged(self):
+        """Test requests rejected by an open circuit do not spend the quotas"""
+        budget = RequestBudget(5)
+        self.resolver.set_budget(budget)
+        self.resolver.retry = RetryPolicy(failure_threshold=1, reset_timeout=60)
+        self.resolver.retry.breaker.record_failure()
+        actual = self.resolver.query(self.ips[:3])
+        self.assertEqual([x["status"] for x in actual], ["failed"] * 3)
+        self.assertEqual(self.resolver.session.get.call_count, 0)
+        self.assertEqual(budget.sent, 0)
+        self.assertEqual([x.used()["day"] for x in self.resolver.pool.keys], [0, 0, 0])
+
+    def test_persistent_usage(self):
+        """Test that key usage carries over between resolvers"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.resolver.pool.track_usage(tmp_dir)
+            self.resolver.query(self.ips[:6])
+
+            resolver = ProResolver(api_key="key-3,key-2,key-1")
+            resolver.pool.track_usage(tmp_dir)
+            self.assertEqual(sum(x.used()["month"] for x in resolver.pool.keys), 6)
+            self.assertEqual(
+                resolver.pool.keys[2].remaining(),
+                DAILY_LIMIT - self.resolver.pool.keys[0].used()["day"],
+            )
+            for name in os.listdir(tmp_dir):
+                self.assertNotIn("key-", name.split("virustotal-usage-", 1)[1])
 
 
 if __name__ == "__main__":
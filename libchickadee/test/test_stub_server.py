@@ -0,0 +1,69 @@
+"""Resolver tests against the local stand-in server."""
+import time
+import unittest
+
+from libchickadee.resolvers.ipapi import ProResolver, Resolver
+from libchickadee.resolvers.retry import RetryPolicy
+from libchickadee.resolvers.virustotal import ProResolver as VTProResolver
+from libchickadee.test.stub_server import StubServer
+
+__author__ = "Chapin Bryce"
+__date__ = 20230601
+__license__ = "MIT Copyright 2023 Chapin Bryce"
+__desc__ = """Yet another GeoIP resolution tool."""
+
+
+class StubServerTestCase(unittest.TestCase):
+    """Resolver tests over HTTP, against the stand-in server."""
+
+    def setUp(self):
+        """Test config"""
+        self.ips = [f"198.51.{x // 256}.{x % 256}" for x in range(250)]
+
+    def test_ipapi_free_quota(self):
+        """Test that the free resolver follows the X-Rl and X-Ttl headers"""
+        with StubServer(window=1, batch_limit=2) as server:
+            resolver = Resolver(fields=["query", "country"])
+            resolver.uri = server.ipapi_uri
+            resolver.batch_limiter.buffer = 0
+            start = time.time()
+            actual = resolver.query(self.ips)
+            resolver.close()
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        self.assertEqual(set(actual[0]), {"query", "country"})
+        self.assertEqual(server.stats["batch"], 3)
+        # The third request waited for the window to reset, rather than a 429
+        self.assertGreaterEqual(time.time() - start, 0.5)
+        self.assertEqual(server.stats["batch_429"], 0)
+
+    def test_ipapi_pro(self):
+        """Test concurrent batch and single requests with an API key"""
+        with StubServer(latency=0.01, batch_limit=0, single_limit=0) as server:
+            resolver = ProResolver("key", fields=["query", "as"], max_workers=4)
+            resolver.uri = server.ipapi_uri
+            actual = resolver.query(self.ips)
+            single = resolver.query(self.ips[:5], force_single=True)
+            resolver.close()
+        self.assertEqual([x["query"] for x in actual], self.ips)
+        self.assertEqual([x["query"] for x in single], self.ips[:5])
+        self.assertEqual(server.stats["batch"], 3)
+        self.assertEqual(server.stats["single"], 5)
+
+    def test_virustotal_quota(self):
+        """Test VirusTotal reports and 204 responses once a key's quota is used"""
+        with StubServer(vt_limit=1) as server:
+            resolver = VTProResolver("key-1", fields=["query", "asn", "status"])
+            resolver.uri = server.vt_uri
+            resolver.retry = RetryPolicy(max_attempts=1)
+            with self.assertLogs("libchickadee.resolvers.virustotal", level="ERROR"):
+                actual = resolver.query(self.ips[:2])
+            resolver.close()
+        self.assertEqual(actual[0]["status"], 1)
+        self.assertTrue(actual[0]["asn"].startswith("AS"))
+        self.assertEqual(actual[1]["status"], "failed")
+        self.assertEqual(server.stats["vt"], 1)
+        self.assertEqual(server.stats["vt_204"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()